@@ -4,7 +4,7 @@ from SimulatedCircuit import SimulatedCircuit
 from Gate import And, Or, Xor
 from Branch import Branch
 from Source import Ground
-from Util import i2b_ri, pav2i
+from Bus import Bus
 
 
 class HalfAdder(SimulatedCircuit):
@@ -84,9 +84,9 @@ class Adder8bit(SimulatedCircuit):
 
         # create access points
         self.CI = self.fa[0].CI
-        self.A = [self.fa[i].A for i in range(self.num_adder)]
-        self.B = [self.fa[i].B for i in range(self.num_adder)]
-        self.S = [self.fa[i].S for i in range(self.num_adder)]
+        self.A = Bus(self.fa[i].A for i in range(self.num_adder))
+        self.B = Bus(self.fa[i].B for i in range(self.num_adder))
+        self.S = Bus(self.fa[i].S for i in range(self.num_adder))
         self.CO = self.fa[self.num_adder-1].CO
 
         # update sequence
@@ -108,14 +108,236 @@ class Adder8bit(SimulatedCircuit):
     def set_input(self, A: int, B: int):
         if A > 255 or A < 0 or B > 255 or B < 0:
             raise(RuntimeError)
-        strA = i2b_ri(A, 8)
-        strB = i2b_ri(B, 8)
-        for i in range(self.num_adder):
-            self.A[i].value = strA[i]
-            self.B[i].value = strB[i]
+        self.A.value = A
+        self.B.value = B
     
     def get_output(self):
-        return pav2i(self.S, self.num_adder)
+        return self.S.value
+
+
+class AdderNbit(SimulatedCircuit):
+    '''
+    N-bit adder built from And, Or and Xor gates: S = A + B + CI, carry out CO
+
+    Every bit has generate g = A & B and propagate p = A ^ B, and S[i] = p[i] ^ c[i]
+    for the carry c[i] into bit i. Subclasses build the carries in _carries(),
+    AdderNbit itself cannot be built.
+    A signal driving more than one gate input gets a Branch. The
+    update_sequence is in dependency order, so one step settles the sum.
+
+    gates: the And/Or/Xor gates
+    depth: gates on the longest path from an input to an output
+    '''
+    def __init__(self, device_name, name, nbit):
+        if type(self)._carries is AdderNbit._carries:
+            raise(RuntimeError(f'{type(self).__name__} has no carry network, use a subclass that defines _carries()'))
+        self.device_name = device_name
+        self.name = name
+        self.nbit = nbit
+
+        # create elements
+        self.brna = Bus(Branch(f'brna{i}') for i in range(nbit))
+        self.brnb = Bus(Branch(f'brnb{i}') for i in range(nbit))
+        self.brnci = Branch('brnci')
+        self.gates = []
+        self._sinks = {} # id(driver) -> gate inputs it drives
+        self._level = {id(d): 0 for d in self.brna + self.brnb + [self.brnci]}
+
+        g = [self._gate(And, self.brna[i], self.brnb[i]) for i in range(nbit)]
+        p = [self._gate(Xor, self.brna[i], self.brnb[i]) for i in range(nbit)]
+        c = self._carries(g, p, self.brnci)
+        S = [self._gate(Xor, p[i], c[i]) for i in range(nbit)]
+        CO = c[nbit]
+        self.depth = max(self._level[id(d)] for d in S + [CO])
+
+        # connect, with a branch wherever a signal fans out or is also an output
+        outputs = {id(d) for d in S + [CO]}
+        drives = {}
+        self.brn = []
+        for gate in self.gates:
+            sinks = self._sinks.get(id(gate.O), [])
+            if len(sinks) > 1 or (sinks and id(gate.O) in outputs):
+                brn = Branch(f'brn{len(self.brn)}')
+                gate.O >> brn >> tuple(sinks)
+                self.brn.append(brn)
+                drives[id(gate.O)] = brn
+            elif sinks:
+                gate.O >> sinks[0]
+        for brn in self.brna + self.brnb + [self.brnci]:
+            brn >> tuple(self._sinks.get(id(brn), []))
+
+        # create access points
+        self.A = self.brna
+        self.B = self.brnb
+        self.CI = self.brnci
+        self.S = Bus(drives.get(id(d), d) for d in S)
+        self.CO = drives.get(id(CO), CO)
+
+        # update sequence
+        self.update_sequence = self.brna + self.brnb + [self.brnci]
+        for gate in self.gates:
+            self.update_sequence.append(gate)
+            if id(gate.O) in drives:
+                self.update_sequence.append(drives[id(gate.O)])
+        del self._sinks, self._level
+
+        super().__init__(self.device_name, self.name)
+
+    def __repr__(self):
+        return f'{self.device_name}({self.name}, {self.nbit} bits, {len(self.gates)} gates, depth {self.depth})'
+
+    def _gate(self, cls, x, y):
+        # new gate on signals x and y, return: its output signal
+        gate = cls(f'{cls.__name__.lower()}{len(self.gates)}')
+        self._sinks.setdefault(id(x), []).append(gate.I[0])
+        self._sinks.setdefault(id(y), []).append(gate.I[1])
+        self._level[id(gate.O)] = max(self._level[id(x)], self._level[id(y)]) + 1
+        self.gates.append(gate)
+        return gate.O
+
+    def _carry(self, g, p, c):
+        # g | (p & c)
+        return self._gate(Or, g, self._gate(And, p, c))
+
+    def _carries(self, g, p, ci):
+        '''
+        return: nbit + 1 carry signals, c[0] = ci and c[nbit] = CO
+        '''
+        raise(NotImplementedError)
+
+    def gate_count(self):
+        '''
+        {gate class name: number of gates}
+        '''
+        count = {}
+        for gate in self.gates:
+            count[type(gate).__name__] = count.get(type(gate).__name__, 0) + 1
+        return count
+
+    def set_input(self, A: int, B: int):
+        self.A.value = A
+        self.B.value = B
+
+    def get_output(self):
+        return self.S.value
+
+
+class RippleCarryAdder(AdderNbit):
+    # each carry waits for the one below it: depth 2 * nbit + 1
+    def __init__(self, name, nbit):
+        super().__init__('RippleCarryAdder', name, nbit)
+
+    def _carries(self, g, p, ci):
+        c = [ci]
+        for i in range(self.nbit):
+            c.append(self._carry(g[i], p[i], c[i]))
+        return c
+
+
+class CarrySelectAdder(AdderNbit):
+    # Ripple blocks of `block` bits, each computed for a carry in of 0 (c0) and 1 (c1)
+    # at the same time. The real carry is then c0 | (cin & c1), which picks one of
+    # the two since c0 implies c1, so only the selection ripples from block to block.
+    # The first block has the carry in already and ripples from it.
+    def __init__(self, name, nbit, block=4):
+        self.block = block
+        super().__init__('CarrySelectAdder', name, nbit)
+
+    def _carries(self, g, p, ci):
+        c = [ci]
+        for i in range(min(self.block, self.nbit)):
+            c.append(self._carry(g[i], p[i], c[i]))
+        for lo in range(self.block, self.nbit, self.block):
+            hi = min(lo + self.block, self.nbit)
+            cin = c[lo]
+            c0 = g[lo]
+            c1 = self._gate(Or, g[lo], p[lo]) # = A | B
+            c.append(self._carry(c0, c1, cin))
+            for i in range(lo + 1, hi):
+                c0 = self._carry(g[i], p[i], c0)
+                c1 = self._carry(g[i], p[i], c1)
+                c.append(self._carry(c0, c1, cin))
+        return c
+
+
+class KoggeStoneAdder(AdderNbit):
+    # Parallel prefix of (generate, propagate) pairs with spans 1, 2, 4, ...,
+    # depth 2 * ceil(log2(nbit)) + 3
+    def __init__(self, name, nbit):
+        super().__init__('KoggeStoneAdder', name, nbit)
+
+    def _carries(self, g, p, ci):
+        G = list(g)
+        P = list(p)
+        G[0] = self._carry(g[0], p[0], ci) # the carry in joins at bit 0
+        d = 1
+        while d < self.nbit:
+            for i in reversed(range(d, self.nbit)):
+                G[i] = self._carry(G[i], P[i], G[i - d])
+                if i >= 2 * d: # a span reaching bit 0 needs no propagate
+                    P[i] = self._gate(And, P[i], P[i - d])
+            d *= 2
+        return [ci] + G
+
+
+# name -> class of the N-bit adders, constructed as cls(name, nbit)
+ADDERS = {
+    'ripple': RippleCarryAdder,
+    'carry-select': CarrySelectAdder,
+    'kogge-stone': KoggeStoneAdder,
+}
+
+
+def settle_steps(adder: AdderNbit, A, B, CI=0, max_steps=1000):
+    '''
+    Steps until the state stops changing after the inputs change to A, B, CI,
+    with the update_sequence reversed: every gate is evaluated before the gates
+    feeding it, so a step moves each signal one gate further, as with an
+    arbitrary order at its worst. Starts from A = B = CI = 0, settled.
+    Raises RuntimeError if the adder does not settle within max_steps.
+    '''
+    sequence = adder.update_sequence
+    adder.update_sequence = sequence[::-1]
+    try:
+        adder.set_input(0, 0)
+        adder.CI.value = OPEN
+        for k in range(max_steps):
+            before = adder.snapshot()
+            adder.step()
+            if adder.snapshot() == before:
+                break
+        adder.set_input(A, B)
+        adder.CI.value = HIGH if CI else OPEN
+        for k in range(max_steps):
+            before = adder.snapshot()
+            adder.step()
+            if adder.snapshot() == before:
+                return k
+    finally:
+        adder.update_sequence = sequence
+    raise(RuntimeError(f'{adder.name} did not settle in {max_steps} steps'))
+
+
+def compare_adders(nbit, kinds=tuple(ADDERS), file=None):
+    '''
+    Gate count, depth and settle steps of each kind of N-bit adder
+    The settle steps are for a carry through every bit: (2**nbit - 1) + 0 + 1.
+    At 16 bits: ripple 80 gates, depth 33, 50 steps; carry-select 119, 16, 24;
+    kogge-stone 182, 11, 17.
+    return: {kind: {'gates': n, 'depth': n, 'settle_steps': n}}
+    '''
+    out = {}
+    for kind in kinds:
+        adder = ADDERS[kind](kind, nbit)
+        adder.power_on()
+        out[kind] = {
+            'gates': len(adder.gates),
+            'depth': adder.depth,
+            'settle_steps': settle_steps(adder, 2**nbit - 1, 0, 1),
+        }
+        print(f'{kind}: {out[kind]["gates"]} gates, depth {out[kind]["depth"]}, '
+              f'{out[kind]["settle_steps"]} steps to settle', file=file)
+    return out
 
 
 class TestArithmetic(unittest.TestCase):
@@ -186,12 +408,55 @@ class TestArithmetic(unittest.TestCase):
         self.assertEqual(a8.CO.value, 1 if (A + B) >= 256 else 0)
         # print(a8)
 
+    def test_adder_nbit(self):
+        print('test_adder_nbit')
+
+        import random as rd
+        import io
+
+        rd.seed(25)
+        for nbit, kwargs in [(4, {}), (7, {'block': 3}), (16, {})]:
+            for kind, cls in ADDERS.items():
+                adder = cls(kind, nbit, **kwargs) if cls is CarrySelectAdder else cls(kind, nbit)
+                outputs = {id(p) for p in adder.S} | {id(adder.CO)}
+                for gate in adder.gates: # every gate is used
+                    used = gate.O.outport if isinstance(gate.O, Branch) else gate.O.connected
+                    self.assertTrue(used or id(gate.O) in outputs)
+                adder.power_on()
+                adder.step()
+                vectors = range(2**(2 * nbit + 1)) if nbit == 4 else [rd.randint(0, 2**(2 * nbit + 1) - 1) for k in range(30)]
+                for v in vectors:
+                    A = v & (2**nbit - 1)
+                    B = (v >> nbit) & (2**nbit - 1)
+                    CI = v >> (2 * nbit)
+                    adder.set_input(A, B)
+                    adder.CI.value = CI
+                    adder.step()
+                    self.assertEqual(adder.get_output() | (adder.CO.value << nbit), A + B + CI)
+        self.assertEqual(len(RippleCarryAdder('r', 8).gates), 40)
+        with self.assertRaises(RuntimeError):
+            AdderNbit('AdderNbit', 'x', 8)
+
+        out = compare_adders(16, file=io.StringIO())
+        self.assertEqual(out['ripple']['depth'], 33)
+        self.assertEqual(out['carry-select'], {'gates': 119, 'depth': 16, 'settle_steps': 24})
+        self.assertEqual(len(CarrySelectAdder('cs', 4).gates), len(RippleCarryAdder('r', 4).gates)) # one block is a ripple
+        self.assertLess(out['kogge-stone']['settle_steps'], out['carry-select']['settle_steps'])
+        self.assertLess(out['carry-select']['settle_steps'], out['ripple']['settle_steps'])
+
+        # settled in reverse order, the sum is still right
+        adder = KoggeStoneAdder('ks', 8)
+        adder.power_on()
+        settle_steps(adder, 0xB7, 0x5C, 1)
+        self.assertEqual(adder.get_output() | (adder.CO.value << 8), 0xB7 + 0x5C + 1)
+
 if __name__ == '__main__':
     suite = unittest.TestSuite()
     suite.addTests([
         TestArithmetic('test_half_adder'),
         TestArithmetic('test_full_adder'),
         TestArithmetic('test_adder8bit'),
+        TestArithmetic('test_adder_nbit'),
     ])
     runner = unittest.TextTestRunner()
     runner.run(suite)
\ No newline at end of file
@@ -0,0 +1,299 @@
+import unittest
+import random as rd
+from BitValue import *
+from SimulatedCircuit import SimulatedCircuit
+from Compiler import Netlist, COPY, CONST, CHARGE, SELECT, RESOLVE
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def levelize_ops(ops, nslot):
+    '''
+    Group ops into levels that can run as whole-array operations
+
+    An op goes one level after the last write of anything it reads and after
+    the last write of its destination, and no earlier than the last read of
+    its destination (a level gathers all of its inputs before it scatters).
+    Running the levels in order gives the same result as running ops in order.
+    '''
+    last_write = [-1] * nslot
+    last_read = [0] * nslot
+    levels = []
+    for op in ops:
+        code, dst = op[0], op[1]
+        if code == CONST:
+            srcs = ()
+        elif code == SELECT:
+            srcs = [i for i in op[2:] if i is not None]
+        elif code == RESOLVE:
+            srcs = op[2]
+        else: # COPY, CHARGE
+            srcs = (op[2],)
+
+        level = max(last_write[dst] + 1, last_read[dst])
+        for i in srcs:
+            if last_write[i] + 1 > level:
+                level = last_write[i] + 1
+        for i in srcs:
+            if last_read[i] < level:
+                last_read[i] = level
+        last_write[dst] = level
+
+        if level == len(levels):
+            levels.append([])
+        levels[level].append(op)
+    return levels
+
+
+class ArrayCircuit:
+    '''
+    Device state as NumPy int8 arrays, stepped one topological level at a time
+
+    Port values, Relay.X, Branch._value and Switch.state live in one int8
+    array indexed by Netlist slot; connections are index arrays. Within a
+    level COPY, CONST and SELECT become one gather/where/scatter, CHARGE one
+    compare, and Branch resolution one reduction per fan-in width.
+
+    state: int8 slot array, followed by OPEN, GND and HIGH constant slots
+    nlevel: number of levels per step
+    '''
+    def __init__(self, device: SimulatedCircuit, netlist: Netlist=None):
+        if np is None:
+            raise(ImportError('numpy is required for ArrayCircuit'))
+
+        self.device = device
+        self.netlist = netlist if netlist is not None else Netlist(device)
+
+        n = self.netlist.nslot
+        self._const = {OPEN: n, GND: n + 1, HIGH: n + 2}
+        self.levels = [self._pack(level) for level in levelize_ops(self.netlist.ops, n)]
+
+        self.load()
+
+    def __repr__(self):
+        return f'ArrayCircuit({self.device.name}, {self.netlist.nslot} slots, {self.nlevel} levels)'
+
+    @property
+    def nlevel(self):
+        return len(self.levels)
+
+    def _pack(self, ops):
+        # SELECT form of COPY/CONST/SELECT: dst = a if cond else b
+        select = []
+        charge = []
+        resolve = {}
+        for op in ops:
+            code = op[0]
+            if code == COPY:
+                select.append((op[1], self._const[HIGH], op[2], op[2]))
+            elif code == CONST:
+                c = self._const[op[2]]
+                select.append((op[1], c, c, c))
+            elif code == SELECT:
+                a = self._const[OPEN] if op[3] is None else op[3]
+                b = self._const[OPEN] if op[4] is None else op[4]
+                select.append((op[1], op[2], a, b))
+            elif code == CHARGE:
+                charge.append((op[1], op[2]))
+            else: # RESOLVE, grouped by fan-in
+                resolve.setdefault(len(op[2]), []).append((op[1],) + tuple(op[2]))
+
+        index = lambda rows: np.array(rows, dtype=np.intp).T
+        return (
+            index(select) if select else None,
+            index(charge) if charge else None,
+            [index(rows) for rows in resolve.values()],
+            )
+
+    def load(self):
+        '''
+        Re-read the object state, e.g. after power_on() or direct port writes
+        '''
+        self.state = np.array(self.netlist.load() + [OPEN, GND, HIGH], dtype=np.int8)
+
+    def store(self):
+        '''
+        Write the array state back to the objects
+        '''
+        self.netlist.store(self.state[:self.netlist.nslot].tolist())
+
+    def get(self, obj):
+        return int(self.state[self.netlist.find(obj)])
+
+    def set(self, obj, value):
+        self.state[self.netlist.find(obj)] = value
+
+    def power_on(self):
+        self.device.power_on()
+        self.load()
+
+    def power_off(self):
+        self.device.power_off()
+        self.load()
+
+    def step(self, n=1):
+        s = self.state
+        for i in range(n):
+            for select, charge, resolve in self.levels:
+                results = []
+                if select is not None:
+                    dst, cond, a, b = select
+                    results.append((dst, np.where(s[cond] != 0, s[a], s[b])))
+                if charge is not None:
+                    dst, src = charge
+                    results.append((dst, (s[src] == HIGH).astype(np.int8)))
+                for rows in resolve:
+                    values = s[rows[1:]]
+                    high = (values == HIGH).any(axis=0)
+                    gnd = (values == GND).any(axis=0)
+                    if (high & gnd).any():
+                        raise(NotImplementedError)
+                    results.append((rows[0], high.astype(np.int8) - gnd))
+                for dst, values in results:
+                    s[dst] = values
+
+
+
+
+@unittest.skipIf(np is None, 'numpy is not installed')
+class TestArrayEngine(unittest.TestCase):
+    def _compare(self, ref, dut, stimulus, nstep):
+        ref.power_on()
+        ac = ArrayCircuit(dut)
+        ac.power_on()
+        refnet = Netlist(ref)
+
+        for k in range(nstep):
+            for dev in [ref, dut]:
+                stimulus(dev, k)
+            ac.load()
+            ref.step()
+            ac.step()
+            ac.store()
+            self.assertEqual(ac.state[:refnet.nslot].tolist(), refnet.load())
+        return ac
+
+    def test_levelize_ops(self):
+        print('test_levelize_ops')
+
+        from Arithmetic import FullAdder
+
+        fa = FullAdder('fa')
+        fa.power_on()
+        netlist = Netlist(fa)
+        levels = levelize_ops(netlist.ops, netlist.nslot)
+        self.assertEqual(sum(len(level) for level in levels), len(netlist.ops))
+        self.assertLess(len(levels), len(netlist.ops))
+
+        # running the levels in order gives the sequential result
+        for k in range(8):
+            fa.CI.value, fa.A.value, fa.B.value = (k >> 2) & 1, (k >> 1) & 1, k & 1
+            state = netlist.load()
+            for level in levels:
+                netlist.execute(state, level)
+            fa.step()
+            self.assertEqual(state, netlist.load())
+
+    def test_gates(self):
+        print('test_gates')
+
+        from Gate import And, OrN, Nand, Nor, Xor
+
+        def stimulus(dev, k):
+            for j in range(len(dev.I)):
+                dev.I[j].value = (k >> j) & 1
+
+        for gate in [lambda: And('and1'), lambda: OrN('or4', 4), lambda: Nand('nand1'), lambda: Nor('nor1'), lambda: Xor('xor1')]:
+            self._compare(gate(), gate(), stimulus, 16)
+
+    def test_adder8bit(self):
+        print('test_adder8bit')
+
+        from Arithmetic import Adder8bit
+
+        rd.seed(4)
+        vectors = [(rd.randint(0, 255), rd.randint(0, 255)) for k in range(20)]
+
+        def stimulus(dev, k):
+            dev.set_input(*vectors[k])
+
+        ac = self._compare(Adder8bit('ref'), Adder8bit('dut'), stimulus, len(vectors))
+        A, B = vectors[-1]
+        self.assertEqual(ac.device.get_output(), (A + B) % 256)
+
+    def test_ram16x8(self):
+        print('test_ram16x8')
+
+        from Memory import RAM16x8
+
+        rd.seed(5)
+        vectors = [(rd.randint(0, 15), rd.randint(0, 255), rd.randint(0, 1), rd.randint(0, 1)) for k in range(40)]
+
+        def stimulus(dev, k):
+            addr, DI, W, E = vectors[k]
+            dev.set_addr(addr)
+            dev.set_input(DI)
+            dev.W.value = W
+            dev.E.value = E
+
+        self._compare(RAM16x8('ref'), RAM16x8('dut'), stimulus, len(vectors))
+
+    def test_ripple_counter(self):
+        print('test_ripple_counter')
+
+        from Counter import RippleCounter4Bit
+
+        # the array state is carried across steps, only Clk is written from outside
+        ref = RippleCounter4Bit('ref')
+        rc = RippleCounter4Bit('rc')
+        for dev in [ref, rc]:
+            dev.power_on()
+            dev.init()
+        ac = ArrayCircuit(rc)
+        for i in range(40):
+            ref.Clk.value = i % 2
+            ref.step()
+            ac.set(rc.Clk, i % 2)
+            ac.step()
+            self.assertEqual(ac.get(rc.Q[0]), ref.Q[0].value)
+        ac.store()
+        self.assertEqual(rc.get_output(), ref.get_output())
+
+    def test_short_circuit(self):
+        print('test_short_circuit')
+
+        from Source import Power, Ground
+        from Branch import Branch
+
+        class Dev(SimulatedCircuit):
+            def __init__(self, name):
+                self.pwr = Power('pwr')
+                self.gnd = Ground('gnd')
+                self.brn = Branch('brn')
+
+                (self.pwr.O, self.gnd.O) >> self.brn
+
+                self.update_sequence = [self.pwr, self.gnd, self.brn]
+
+                super().__init__('Dev', name)
+
+        ac = ArrayCircuit(Dev('dev'))
+        ac.power_on()
+        self.assertRaises(NotImplementedError, ac.step)
+
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTests([
+        TestArrayEngine('test_levelize_ops'),
+        TestArrayEngine('test_gates'),
+        TestArrayEngine('test_adder8bit'),
+        TestArrayEngine('test_ram16x8'),
+        TestArrayEngine('test_ripple_counter'),
+        TestArrayEngine('test_short_circuit'),
+    ])
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -7,8 +7,8 @@ from Decoder import Selector2to1
 from Arithmetic import Adder8bit
 from Counter import Oscillator, RippleCounter4Bit
 from FlipFlop import EdgeTriggeredDtypeFlipFlop, Latch8bit
-from Memory import RAM256x8
-from Util import i2b_ri, pav2i
+from Memory import RAM256x8, BehavioralRAM256x8
+from Bus import Bus
 
 
 class Selector2to1xN(SimulatedCircuit):
@@ -27,16 +27,16 @@ class Selector2to1xN(SimulatedCircuit):
         self.brn >> [self.sel[i].Select for i in range(self.n)]
 
         self.Select = self.brn
-        self.addrA = [self.sel[i].A for i in range(self.naddr)]
-        self.diA = [self.sel[i + self.naddr].A for i in range(self.nbit)]
+        self.addrA = Bus(self.sel[i].A for i in range(self.naddr))
+        self.diA = Bus(self.sel[i + self.naddr].A for i in range(self.nbit))
         self.wA = self.sel[self.naddr + self.nbit].A
         self.eA = self.sel[self.naddr + self.nbit + 1].A
-        self.addrB = [self.sel[i].B for i in range(self.naddr)]
-        self.diB = [self.sel[i + self.naddr].B for i in range(self.nbit)]
+        self.addrB = Bus(self.sel[i].B for i in range(self.naddr))
+        self.diB = Bus(self.sel[i + self.naddr].B for i in range(self.nbit))
         self.wB = self.sel[self.naddr + self.nbit].B
         self.eB = self.sel[self.naddr + self.nbit + 1].B
-        self.addrO = [self.sel[i].O for i in range(self.naddr)]
-        self.diO = [self.sel[i + self.naddr].O for i in range(self.nbit)]
+        self.addrO = Bus(self.sel[i].O for i in range(self.naddr))
+        self.diO = Bus(self.sel[i + self.naddr].O for i in range(self.nbit))
         self.wO = self.sel[self.naddr + self.nbit].O
         self.eO = self.sel[self.naddr + self.nbit + 1].O
 
@@ -54,36 +54,28 @@ class Selector2to1xN(SimulatedCircuit):
     def set_addrA(self, addr):
         if addr < 0 or addr > 2**self.naddr - 1:
             raise(RuntimeError)
-        bin = i2b_ri(addr, self.naddr)
-        for i in range(self.naddr):
-            self.addrA[i].value = bin[i]
+        self.addrA.value = addr
     
     def set_inputA(self, DI: int):
         if DI < 0 or DI > 2**self.nbit - 1:
             raise(RuntimeError)
-        strDI = i2b_ri(DI, self.nbit)
-        for i in range(self.nbit):
-            self.diA[i].value = strDI[i]
+        self.diA.value = DI
 
     def set_addrB(self, addr):
         if addr < 0 or addr > 2**self.naddr - 1:
             raise(RuntimeError)
-        bin = i2b_ri(addr, self.naddr)
-        for i in range(self.naddr):
-            self.addrB[i].value = bin[i]
+        self.addrB.value = addr
     
     def set_inputB(self, DI: int):
         if DI < 0 or DI > 2**self.nbit - 1:
             raise(RuntimeError)
-        strDI = i2b_ri(DI, self.nbit)
-        for i in range(self.nbit):
-            self.diB[i].value = strDI[i]
+        self.diB.value = DI
 
     def get_addrO(self):
-        return pav2i(self.addrO, self.naddr)
+        return self.addrO.value
 
     def get_inputO(self):
-        return pav2i(self.diO, self.nbit)
+        return self.diO.value
 
 
 class ControlSignal(SimulatedCircuit):
@@ -114,7 +106,7 @@ class ControlSignal(SimulatedCircuit):
         self.or8.O >> self.invor.I
         self.invor.O >> self.andw.I[1]
 
-        self.DI = [self.or8.I[i] for i in range(self.nbit)]
+        self.DI = Bus(self.or8.I[i] for i in range(self.nbit))
         self.ToCounterClk = self.brnd
         self.ToLatchClk = self.brnp
         self.ToRamW = self.andw.O
@@ -137,8 +129,8 @@ class AccumulatingAdder(SimulatedCircuit):
 
         self.adder = Adder8bit('adder')
         self.latch = Latch8bit('latch')
-        self.brndi = [Branch(f'brndi{i}') for i in range(self.nbit)]
-        self.brndo = [Branch(f'brndo{i}') for i in range(self.nbit)]
+        self.brndi = Bus(Branch(f'brndi{i}') for i in range(self.nbit))
+        self.brndo = Bus(Branch(f'brndo{i}') for i in range(self.nbit))
 
         for i in range(self.nbit):
             self.brndi[i] >> self.adder.A[i]
@@ -158,16 +150,15 @@ class AccumulatingAdder(SimulatedCircuit):
     def set_input(self, DI: int):
         if DI < 0 or DI > 2**self.nbit - 1:
             raise(RuntimeError)
-        strDI = i2b_ri(DI, self.nbit)
-        for i in range(self.nbit):
-            self.DI[i].value = strDI[i]
+        self.DI.value = DI
 
     def get_output(self):
-        return pav2i(self.DO, self.nbit)
+        return self.DO.value
 
 
 class AutomatedAccumulatingAdder(SimulatedCircuit):
-    def __init__(self, name):
+    # ram: RAM class with the access points of RAM256x8, e.g. BehavioralRAM256x8
+    def __init__(self, name, ram=RAM256x8):
         self.device_name = 'AutomatedAccumulatingAdder'
         self.name = name
         self.naddr = 4
@@ -175,7 +166,7 @@ class AutomatedAccumulatingAdder(SimulatedCircuit):
 
         self.cs = ControlSignal('cs')
         self.counter = RippleCounter4Bit('counter')
-        self.ram = RAM256x8('ram')
+        self.ram = ram('ram')
         self.adder = AccumulatingAdder('adder')
         self.sel = Selector2to1xN('sel', self.naddr)
 
@@ -203,14 +194,7 @@ class AutomatedAccumulatingAdder(SimulatedCircuit):
         self.counter.init()
 
     def write_data(self, data):
-        self.sel.setA()
-        self.sel.wA.set()
-        for addr, d in enumerate(data):
-            self.sel.set_addrA(addr)
-            self.sel.set_inputA(d)
-            self.sel.step()
-            self.ram.step()
-        self.sel.wA.reset()
+        self.ram.load(bytes(data))
         self.sel.setB()
     
     def read_data(self, addr):
@@ -223,9 +207,7 @@ class AutomatedAccumulatingAdder(SimulatedCircuit):
         # data = self.ram.get_output()
         # self.sel.eA.reset()
         # self.sel.setB()
-        strDO = ''.join([str(self.ram.cell[0].cell[addr][i].DO.value) for i in range(8)])[::-1]
-        data = int(strDO, 2)
-        return data
+        return self.ram.get_cell(addr)
     
 
 class TestAccumulator(unittest.TestCase):
@@ -347,6 +329,29 @@ class TestAccumulator(unittest.TestCase):
         self.assertTrue(correct)
         print(aaa.ram.cell[0])
 
+    def test_behavioral_ram(self):
+        print('test_behavioral_ram')
+
+        data = [0x35, 0x1B, 0x09, 0x31, 0x1E, 0x12, 0x23, 0x0C]
+        ndata = len(data)
+
+        aaa = AutomatedAccumulatingAdder('aaa', ram=BehavioralRAM256x8)
+        aaa.power_on()
+        aaa.init()
+        aaa.write_data(data)
+        for i in range(ndata):
+            self.assertEqual(aaa.read_data(i), data[i])
+
+        correct = False
+        for i in range(40):
+            aaa.step()
+            res = aaa.read_data(ndata)
+            if res != 0:
+                self.assertEqual(res, sum(data))
+                correct = True
+                break
+        self.assertTrue(correct)
+
 
 if __name__ == '__main__':
     suite = unittest.TestSuite()
@@ -356,6 +361,7 @@ if __name__ == '__main__':
         TestAccumulator('test_accumulating_adder'),
         TestAccumulator('test_ram_write_read'),
         TestAccumulator('test_automated_accumulating_adder'),
+        TestAccumulator('test_behavioral_ram'),
     ])
     runner = unittest.TextTestRunner()
     runner.run(suite)
\ No newline at end of file
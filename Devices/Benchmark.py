@@ -0,0 +1,204 @@
+import unittest
+import sys
+import os
+import gc
+import io
+import json
+import platform
+import subprocess
+import tempfile
+import tracemalloc
+from time import perf_counter
+from Util import walk
+
+
+def _devices():
+    # label -> factory, one entry per device class of interest
+    from Gate import And, OrN
+    from Arithmetic import Adder8bit, RippleCarryAdder, CarrySelectAdder, KoggeStoneAdder
+    from Decoder import Decoder4to16
+    from Memory import RAM16x8, RAM256x8
+    from Counter import RippleCounter4Bit
+    from AutomatedAccumulatingAdder import AutomatedAccumulatingAdder
+    return {
+        'And': lambda: And('and'),
+        'OrN(8)': lambda: OrN('orn', 8),
+        'Adder8bit': lambda: Adder8bit('adder'),
+        'RippleCarryAdder(16)': lambda: RippleCarryAdder('adder', 16),
+        'CarrySelectAdder(16)': lambda: CarrySelectAdder('adder', 16),
+        'KoggeStoneAdder(16)': lambda: KoggeStoneAdder('adder', 16),
+        'Decoder4to16': lambda: Decoder4to16('dec'),
+        'RAM16x8': lambda: RAM16x8('ram'),
+        'RAM256x8': lambda: RAM256x8('ram'),
+        'RippleCounter4Bit': lambda: RippleCounter4Bit('rc'),
+        'AutomatedAccumulatingAdder': lambda: AutomatedAccumulatingAdder('aaa'),
+    }
+
+DEVICES = tuple(_devices())
+
+
+def measure(factory, min_time=0.2):
+    '''
+    Construction time, step throughput, peak memory and object counts of one device
+    Timed runs take at least min_time seconds each (at least one run).
+    '''
+    gc.collect()
+
+    # construction, best of the runs that fit in min_time
+    times = []
+    start = perf_counter()
+    while True:
+        t0 = perf_counter()
+        device = factory()
+        times.append(perf_counter() - t0)
+        if perf_counter() - start >= min_time:
+            break
+
+    # peak memory of a construction
+    del device
+    gc.collect()
+    tracemalloc.start()
+    device = factory()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    nobject = sum(1 for path, obj in walk(device))
+    nprimitive = len({id(dev) for dev in device.flatten()})
+
+    # steps per second
+    device.power_on()
+    device.step()
+    nstep = 0
+    t0 = perf_counter()
+    while nstep == 0 or perf_counter() - t0 < min_time:
+        device.step()
+        nstep += 1
+    elapsed = perf_counter() - t0
+
+    return {
+        'construct_s': min(times),
+        'steps_per_s': nstep / elapsed,
+        'peak_bytes': peak,
+        'objects': nobject,
+        'primitives': nprimitive,
+    }
+
+
+def _commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(names=None, min_time=0.2, file=None):
+    '''
+    Measure the named devices (default: all of DEVICES)
+    return: JSON-ready dict with the results and where they were taken
+    '''
+    import Gate
+    factories = _devices()
+    results = {}
+    for name in names or DEVICES:
+        results[name] = measure(factories[name], min_time)
+        r = results[name]
+        print(f'{name}: construct {r["construct_s"] * 1e3:.2f} ms, {r["steps_per_s"]:.1f} steps/s, '
+              f'peak {r["peak_bytes"] / 2**20:.2f} MiB, {r["objects"]} objects, {r["primitives"]} primitives', file=file)
+    return {
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'fidelity': Gate.fidelity,
+        'results': results,
+    }
+
+
+def compare(old, new, threshold=0.1, file=None):
+    '''
+    Print new against old result per device and metric
+    return: list of (device, metric, ratio) worse than threshold
+    '''
+    # larger is better for steps_per_s, smaller for everything else
+    regressions = []
+    for name, r in new['results'].items():
+        if name not in old['results']:
+            continue
+        parts = []
+        for metric, value in r.items():
+            base = old['results'][name].get(metric)
+            if not base:
+                continue
+            ratio = value / base
+            parts.append(f'{metric} x{ratio:.2f}')
+            worse = 1 / ratio if metric == 'steps_per_s' else ratio
+            if worse > 1 + threshold:
+                regressions.append((name, metric, ratio))
+        print(f'{name}: ' + ', '.join(parts), file=file)
+    return regressions
+
+
+def main(argv):
+    '''
+    python Benchmark.py run [out.json] [device ...]
+    python Benchmark.py compare old.json new.json
+    '''
+    if argv[0] == 'run':
+        out = argv[1] if len(argv) > 1 and argv[1].endswith('.json') else None
+        names = [a for a in argv[1:] if a != out] or None
+        result = run(names)
+        if out:
+            with open(out, 'w') as f:
+                json.dump(result, f, indent=1)
+    elif argv[0] == 'compare':
+        with open(argv[1]) as f:
+            old = json.load(f)
+        with open(argv[2]) as f:
+            new = json.load(f)
+        regressions = compare(old, new)
+        for name, metric, ratio in regressions:
+            print(f'regression: {name} {metric} x{ratio:.2f}')
+        return 1 if regressions else 0
+    else:
+        raise(RuntimeError(main.__doc__))
+    return 0
+
+
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_run(self):
+        print('test_run')
+
+        result = run(['And', 'Adder8bit'], min_time=0.01, file=io.StringIO())
+        r = result['results']['And']
+        self.assertEqual(set(r), {'construct_s', 'steps_per_s', 'peak_bytes', 'objects', 'primitives'})
+        self.assertGreater(r['steps_per_s'], 0)
+        self.assertGreater(result['results']['Adder8bit']['primitives'], r['primitives'])
+        json.dumps(result)
+
+    def test_compare(self):
+        print('test_compare')
+
+        old = {'results': {'And': {'construct_s': 1.0, 'steps_per_s': 100.0, 'peak_bytes': 1000}}}
+        new = {'results': {'And': {'construct_s': 1.05, 'steps_per_s': 50.0, 'peak_bytes': 2000}}}
+        regressions = compare(old, new, file=io.StringIO())
+        self.assertEqual([(d, m) for d, m, r in regressions], [('And', 'steps_per_s'), ('And', 'peak_bytes')])
+
+        with tempfile.TemporaryDirectory() as directory:
+            for name, data in [('old.json', old), ('new.json', old)]:
+                with open(os.path.join(directory, name), 'w') as f:
+                    json.dump(data, f)
+            self.assertEqual(main(['compare', os.path.join(directory, 'old.json'), os.path.join(directory, 'new.json')]), 0)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        sys.exit(main(sys.argv[1:]))
+    suite = unittest.TestSuite()
+    suite.addTests([
+        TestBenchmark('test_run'),
+        TestBenchmark('test_compare'),
+    ])
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
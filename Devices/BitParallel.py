@@ -0,0 +1,227 @@
+import unittest
+import random as rd
+from BitValue import *
+from SimulatedCircuit import SimulatedCircuit
+from Compiler import Netlist, COPY, CONST, CHARGE, SELECT, RESOLVE
+
+
+def pack_lanes(values, nbit):
+    '''
+    Pack one integer per lane into nbit bitplanes
+    Bit k of plane i is bit i of values[k].
+    '''
+    planes = []
+    for i in range(nbit):
+        bits = ''.join('1' if (v >> i) & 1 else '0' for v in reversed(values))
+        planes.append(int(bits, 2) if bits else 0)
+    return planes
+
+
+def unpack_lanes(planes, nlane):
+    '''
+    Inverse of pack_lanes(): one integer per lane
+    '''
+    columns = [bin(plane)[2:].zfill(nlane)[::-1] for plane in reversed(planes)]
+    if not columns:
+        return [0] * nlane
+    return [int(''.join(column[k] for column in columns), 2) for k in range(nlane)]
+
+
+def generate_batch_source(netlist: Netlist, name='step'):
+    '''
+    Straight-line Python source of one step over packed lanes
+
+    Each slot is two bitplanes: h (lane is HIGH) and g (lane is GND);
+    a lane with neither bit set is OPEN. Relay.X is carried in h.
+    '''
+    lines = [f'def {name}(h, g, mask):']
+    n = netlist.nslot
+    if n:
+        lines.append('    ' + ', '.join(f'h{i}' for i in range(n)) + ', = h')
+        lines.append('    ' + ', '.join(f'g{i}' for i in range(n)) + ', = g')
+
+    for op in netlist.ops:
+        code, d = op[0], op[1]
+        if code == COPY:
+            lines.append(f'    h{d} = h{op[2]}; g{d} = g{op[2]}')
+        elif code == CONST:
+            lines.append(f'    h{d} = {"mask" if op[2] == HIGH else 0}; g{d} = {"mask" if op[2] == GND else 0}')
+        elif code == CHARGE:
+            lines.append(f'    h{d} = h{op[2]}; g{d} = 0')
+        elif code == SELECT:
+            c, a, b = op[2], op[3], op[4]
+            # a lane selects a while its condition slot is not OPEN
+            lines.append(f'    t = h{c} | g{c}; u = t ^ mask')
+            ha, ga = (f'(t & h{a})', f'(t & g{a})') if a is not None else ('0', '0')
+            hb, gb = (f'(u & h{b})', f'(u & g{b})') if b is not None else ('0', '0')
+            lines.append(f'    h{d} = {ha} | {hb}; g{d} = {ga} | {gb}')
+        else: # RESOLVE
+            hs = ' | '.join(f'h{i}' for i in op[2])
+            gs = ' | '.join(f'g{i}' for i in op[2])
+            lines.append(f'    h{d} = {hs}; g{d} = {gs}')
+            if len(op[2]) > 1:
+                lines.append(f'    if h{d} & g{d}:')
+                lines.append(f'        raise NotImplementedError')
+
+    if n:
+        lines.append('    h[:] = (' + ', '.join(f'h{i}' for i in range(n)) + ',)')
+        lines.append('    g[:] = (' + ', '.join(f'g{i}' for i in range(n)) + ',)')
+    else:
+        lines.append('    pass')
+    return '\n'.join(lines) + '\n'
+
+
+class BatchSimulator:
+    '''
+    Runs many independent input vectors through a device in one pass
+
+    Every lane starts from the current object state (call power_on() on the
+    device first), gets its own input values, and is stepped bit-parallel
+    over packed Python ints, so the number of lanes is not limited to 64.
+    '''
+    def __init__(self, device: SimulatedCircuit):
+        self.device = device
+        self.netlist = Netlist(device)
+        self.source = generate_batch_source(self.netlist)
+
+        namespace = {}
+        exec(compile(self.source, f'<batch {device.name}>', 'exec'), namespace)
+        self._step = namespace['step']
+
+    def __repr__(self):
+        return f'BatchSimulator({self.device.name}, {self.netlist.nslot} slots, {len(self.netlist.ops)} ops)'
+
+    def _bus(self, name):
+        bus = getattr(self.device, name) if isinstance(name, str) else name
+        return list(bus) if isinstance(bus, (list, tuple)) else [bus]
+
+    def run(self, inputs: dict, outputs: list, nstep=1):
+        '''
+        inputs: {access point name: [one integer per lane]}, all the same length
+        outputs: access point names to read
+        return: {access point name: [one integer per lane]}, HIGH bits read as 1
+        '''
+        nlane = len(next(iter(inputs.values())))
+        mask = (1 << nlane) - 1
+
+        # broadcast the object state to every lane
+        h = []
+        g = []
+        for value in self.netlist.load():
+            h.append(mask if value == HIGH else 0)
+            g.append(mask if value == GND else 0)
+
+        for name, values in inputs.items():
+            if len(values) != nlane:
+                raise(RuntimeError)
+            bus = self._bus(name)
+            for obj, plane in zip(bus, pack_lanes(values, len(bus))):
+                i = self.netlist.find(obj)
+                h[i] = plane
+                g[i] = 0
+
+        for k in range(nstep):
+            self._step(h, g, mask)
+
+        result = {}
+        for name in outputs:
+            planes = [h[self.netlist.find(obj)] for obj in self._bus(name)]
+            result[name] = unpack_lanes(planes, nlane)
+        return result
+
+
+
+
+class TestBitParallel(unittest.TestCase):
+    def test_pack_lanes(self):
+        print('test_pack_lanes')
+
+        values = [0, 5, 255, 128, 7]
+        planes = pack_lanes(values, 8)
+        self.assertEqual(planes[0], 0b10110)
+        self.assertEqual(planes[7], 0b01100)
+        self.assertEqual(unpack_lanes(planes, len(values)), values)
+
+    def test_gates(self):
+        print('test_gates')
+
+        from Gate import And, Or, Nand, Nor, Xor
+
+        for gate_class, op in [(And, lambda a, b: a & b), (Or, lambda a, b: a | b), (Nand, lambda a, b: 1 - (a & b)), (Nor, lambda a, b: 1 - (a | b)), (Xor, lambda a, b: a ^ b)]:
+            gate = gate_class('gate')
+            gate.power_on()
+            sim = BatchSimulator(gate)
+            A = [0, 0, 1, 1]
+            B = [0, 1, 0, 1]
+            O = sim.run({'I': [a | (b << 1) for a, b in zip(A, B)]}, ['O'])['O']
+            self.assertEqual(O, [op(a, b) for a, b in zip(A, B)])
+
+    def test_decoder4to16(self):
+        print('test_decoder4to16')
+
+        from Decoder import Decoder4to16
+
+        dec = Decoder4to16('dec')
+        dec.power_on()
+        sim = BatchSimulator(dec)
+        O = sim.run({'A': list(range(16))}, ['O'])['O']
+        self.assertEqual(O, [1 << i for i in range(16)])
+
+    def test_adder8bit_exhaustive(self):
+        print('test_adder8bit_exhaustive')
+
+        from Arithmetic import Adder8bit
+
+        a8 = Adder8bit('a8')
+        a8.power_on()
+        sim = BatchSimulator(a8)
+
+        vectors = range(2**17)
+        A = [v & 0xFF for v in vectors]
+        B = [(v >> 8) & 0xFF for v in vectors]
+        CI = [v >> 16 for v in vectors]
+        out = sim.run({'A': A, 'B': B, 'CI': CI}, ['S', 'CO'])
+        for a, b, ci, s, co in zip(A, B, CI, out['S'], out['CO']):
+            self.assertEqual(s | (co << 8), a + b + ci)
+
+    def test_matches_step(self):
+        print('test_matches_step')
+
+        from FlipFlop import EdgeTriggeredDtypeFlipFlop
+
+        # sequential state is carried from the objects into every lane
+        ff = EdgeTriggeredDtypeFlipFlop('etdff')
+        ff.power_on()
+        ff.D.set()
+        ff.Clk.set()
+        ff.step()
+        ff.Clk.reset()
+        ff.step()
+
+        sim = BatchSimulator(ff)
+        D = [0, 0, 1, 1]
+        Clk = [0, 1, 0, 1]
+        out = sim.run({'D': D, 'Clk': Clk}, ['Q', 'Qbar'])
+
+        # each lane against the object model started from the same state
+        saved = sim.netlist.load()
+        for k in range(4):
+            sim.netlist.store(saved)
+            ff.D.value = D[k]
+            ff.Clk.value = Clk[k]
+            ff.step()
+            self.assertEqual(out['Q'][k], ff.Q.value)
+            self.assertEqual(out['Qbar'][k], ff.Qbar.value)
+
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTests([
+        TestBitParallel('test_pack_lanes'),
+        TestBitParallel('test_gates'),
+        TestBitParallel('test_decoder4to16'),
+        TestBitParallel('test_adder8bit_exhaustive'),
+        TestBitParallel('test_matches_step'),
+    ])
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -10,6 +10,8 @@ class Branch(SimulatedCircuit):
     O: list of output ports
     state: state(HIGH, OPEN, or GND) of Branch
     '''
+    __slots__ = ('_value', '_ninport', '_noutport', 'inport', 'outport')
+
     def __init__(self, name):
         self.device_name = 'Branch'
         self.name = name
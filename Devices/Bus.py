@@ -0,0 +1,99 @@
+import unittest
+from BitValue import *
+
+
+class Bus(list):
+    '''
+    Multi-bit access point: a list of Ports or Branches, element 0 as bit 0
+
+    value reads and writes all bits as one integer with shifts and masks,
+    HIGH as 1 and anything else as 0. Being a list, indexing, iteration and
+    paths like 'A[3]' work as for any other list of ports.
+    '''
+    __slots__ = ()
+
+    def __repr__(self):
+        return f'Bus({len(self)} bits, {self.value:#x})'
+
+    @property
+    def value(self):
+        value = 0
+        for p in reversed(self):
+            value = (value << 1) | (p.value == HIGH)
+        return value
+
+    @value.setter
+    def value(self, value):
+        if value < 0 or value >> len(self):
+            raise(RuntimeError(f'{value} does not fit in {len(self)} bits'))
+        for p in self:
+            p.value = HIGH if value & 1 else OPEN
+            value >>= 1
+
+    def __rshift__(self, other):
+        '''
+        Connect bit by bit to a Bus or list of the same width
+        '''
+        if not isinstance(other, list):
+            return NotImplemented
+        if len(other) != len(self):
+            raise(RuntimeError(f'cannot connect {len(self)} bits to {len(other)}'))
+        for p, q in zip(self, other):
+            p >> q
+        return other
+
+
+
+
+class TestBus(unittest.TestCase):
+    def test_value(self):
+        print('test_value')
+
+        from Gate import And
+        from Port import Port
+        from Util import i2b_ri, pav2i
+
+        dev = And('and')
+        bus = Bus(Port(f'p{i}', dev) for i in range(8))
+        for value in [0, 1, 0x35, 0x80, 0xFF]:
+            bus.value = value
+            self.assertEqual(bus.value, value)
+            self.assertEqual([p.value for p in bus], i2b_ri(value, 8))
+            self.assertEqual(bus.value, pav2i(bus, 8))
+        for value in [-1, 0x100]:
+            with self.assertRaises(RuntimeError):
+                bus.value = value
+        bus[0].value = GND
+        self.assertEqual(bus.value, 0xFE)
+        self.assertIsInstance(bus[1:], list)
+
+    def test_connect(self):
+        print('test_connect')
+
+        from Gate import And
+        from Port import Port
+        from Branch import Branch
+
+        dev = And('and')
+        a = Bus(Port(f'a{i}', dev) for i in range(4))
+        b = Bus(Port(f'b{i}', dev) for i in range(4))
+        brn = Bus(Branch(f'brn{i}') for i in range(4))
+        a >> brn >> b
+        a.value = 0xA
+        for d in brn:
+            d.step()
+        for p in b:
+            p.update_value()
+        self.assertEqual(b.value, 0xA)
+        with self.assertRaises(RuntimeError):
+            a >> Bus(b[:3])
+
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTests([
+        TestBus('test_value'),
+        TestBus('test_connect'),
+    ])
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -0,0 +1,197 @@
+import unittest
+import random as rd
+from array import array
+from collections import deque
+from BitValue import *
+from SimulatedCircuit import SimulatedCircuit
+from Port import Port
+from Relay import Relay
+from Branch import Branch
+from Switch import Switch
+from Util import walk
+
+
+def state_attributes(obj):
+    '''
+    Attributes holding the simulation state of one object
+    Connections and names are structure and not part of it.
+    '''
+    if isinstance(obj, Port):
+        return ('value',)
+    elif isinstance(obj, Branch):
+        return ('_value',)
+    elif isinstance(obj, Relay):
+        return ('X',)
+    elif isinstance(obj, Switch):
+        return ('state',)
+    elif isinstance(obj, SimulatedCircuit) and hasattr(obj, 'supply'): # behavioral models
+        return tuple(attr for attr in ('supply', 'X', 'Y') if isinstance(getattr(obj, attr, None), int))
+    return ()
+
+
+class Checkpoint:
+    '''
+    Packs the complete state of a device into bytes and back
+
+    Every state value (Port.value, Branch._value, Relay.X, Switch.state,
+    supply and coils of behavioral models) is one signed byte, in the
+    hierarchical order of Util.walk, followed by the contents of
+    behavioral RAMs. The order only depends on the structure of the device,
+    so a snapshot can be restored into another instance of the same class.
+
+    names: path of each state value, e.g. 'dec.brnd[2]._value'
+    size: bytes per snapshot
+    '''
+    def __init__(self, device: SimulatedCircuit):
+        self.device_name = device.device_name
+        self.names = []
+        self._objs = []
+        self._attrs = []
+        self._buffers = []
+        for path, obj in walk(device):
+            for attr in state_attributes(obj):
+                self.names.append(f'{path}.{attr}' if path else attr)
+                self._objs.append(obj)
+                self._attrs.append(attr)
+            if isinstance(obj, SimulatedCircuit) and hasattr(obj, 'data'):
+                self._buffers.append(obj)
+        self._nvalue = len(self._objs)
+        self.size = self._nvalue + sum(len(obj.data) for obj in self._buffers)
+
+    def __repr__(self):
+        return f'Checkpoint({self.device_name}, {self.size} bytes)'
+
+    def snapshot(self):
+        '''
+        return: bytes of the current state
+        '''
+        out = array('b', map(getattr, self._objs, self._attrs)).tobytes()
+        if self._buffers:
+            out = b''.join([out] + [bytes(obj.data) for obj in self._buffers])
+        return out
+
+    def restore(self, buf):
+        '''
+        Set the state from bytes returned by snapshot()
+        '''
+        if len(buf) != self.size:
+            raise(RuntimeError(f'snapshot of {len(buf)} bytes, {self.device_name} needs {self.size}'))
+        values = array('b')
+        values.frombytes(buf[:self._nvalue])
+        deque(map(setattr, self._objs, self._attrs, values), 0)
+        pos = self._nvalue
+        for obj in self._buffers:
+            n = len(obj.data)
+            obj.data[:] = buf[pos:pos + n]
+            pos += n
+
+
+
+
+class TestCheckpoint(unittest.TestCase):
+    def test_rsff(self):
+        print('test_rsff')
+
+        from FlipFlop import RSFlipFlop
+
+        dev = RSFlipFlop('rsff1')
+        dev.power_on()
+        dev.S.value = HIGH
+        dev.step()
+        dev.S.value = OPEN
+        dev.step()
+        self.assertEqual(dev.Q.value, HIGH)
+
+        buf = dev.snapshot()
+        self.assertIsInstance(buf, bytes)
+        dev.R.value = HIGH
+        dev.step()
+        self.assertEqual(dev.Q.value, OPEN)
+
+        dev.restore(buf)
+        self.assertEqual(dev.Q.value, HIGH)
+        self.assertEqual(dev.R.value, OPEN)
+        dev.step()
+        self.assertEqual(dev.Q.value, HIGH)
+        self.assertEqual(dev.snapshot(), buf)
+
+        with self.assertRaises(RuntimeError):
+            dev.restore(buf[1:])
+
+        # primitives and gates carry no cache slot and build a Checkpoint per call
+        from Gate import And
+        gate = And('and1')
+        self.assertNotIn('_checkpoint', SimulatedCircuit.__slots__)
+        gate.power_on()
+        buf = gate.snapshot()
+        gate.I[0].set()
+        gate.restore(buf)
+        self.assertEqual(gate.I[0].value, OPEN)
+
+    def test_rewind(self):
+        print('test_rewind')
+
+        from AutomatedAccumulatingAdder import AutomatedAccumulatingAdder
+        from Memory import BehavioralRAM256x8
+
+        data = [0x35, 0x1B, 0x09, 0x31, 0x1E, 0x12, 0x23, 0x0C]
+
+        aaa = AutomatedAccumulatingAdder('aaa', ram=BehavioralRAM256x8)
+        aaa.power_on()
+        aaa.init()
+        aaa.write_data(data)
+        for i in range(5):
+            aaa.step()
+        buf = aaa.snapshot()
+
+        trace = []
+        for i in range(20):
+            aaa.step()
+            trace.append(aaa.snapshot())
+
+        # rewind and replay
+        aaa.restore(buf)
+        for i in range(20):
+            aaa.step()
+            self.assertEqual(aaa.snapshot(), trace[i])
+
+        # restore into a fresh instance of the same class
+        other = AutomatedAccumulatingAdder('other', ram=BehavioralRAM256x8)
+        other.restore(trace[-1])
+        self.assertEqual(other.read_data(len(data)), aaa.read_data(len(data)))
+        self.assertEqual(other.snapshot(), trace[-1])
+
+    def test_ram16x8(self):
+        print('test_ram16x8')
+
+        from Memory import RAM16x8
+
+        dev = RAM16x8('ram')
+        dev.power_on()
+        dev.step()
+        rd.seed(14)
+        for k in range(10):
+            dev.set_addr(rd.randint(0, 15))
+            dev.set_input(rd.randint(0, 255))
+            dev.W.set()
+            dev.step()
+            dev.W.reset()
+            dev.step()
+        cells = dev.print_cell()
+        buf = dev.snapshot()
+
+        fresh = RAM16x8('fresh')
+        fresh.restore(buf)
+        self.assertEqual(fresh.print_cell(), cells)
+        self.assertEqual(fresh.__dict__['_checkpoint'].names[:2], ['dec.brnd[0]._value', 'dec.brnd[0].outport[0].value'])
+
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTests([
+        TestCheckpoint('test_rsff'),
+        TestCheckpoint('test_rewind'),
+        TestCheckpoint('test_ram16x8'),
+    ])
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
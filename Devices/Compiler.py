@@ -0,0 +1,448 @@
+import unittest
+import random as rd
+from BitValue import *
+from SimulatedCircuit import SimulatedCircuit
+from Relay import Relay, CHARGED, DISCHARGED
+from Branch import Branch
+from Source import Power, Ground
+from Switch import Switch
+
+
+# op codes
+COPY = 0    # (COPY, dst, src): s[dst] = s[src]
+CONST = 1   # (CONST, dst, value): s[dst] = value
+CHARGE = 2  # (CHARGE, dst, src): s[dst] = CHARGED if s[src] == HIGH else DISCHARGED
+SELECT = 3  # (SELECT, dst, cond, a, b): s[dst] = s[a] if s[cond] else s[b], None reads OPEN
+RESOLVE = 4 # (RESOLVE, dst, srcs): s[dst] = Branch resolution of s[srcs]
+
+
+class Netlist:
+    '''
+    Flat, object-free description of one step of a device
+
+    Every signal the primitives read or write (Port.value, Relay.X,
+    Branch._value, Switch.state, state of behavioral models) is given a
+    slot, and the flattened update sequence is lowered to a list of ops
+    over those slots that performs exactly the assignments step() would.
+
+    device: source device
+    slots: (object, attribute) bound to each slot
+    ops: list of ops in execution order
+    '''
+    def __init__(self, device: SimulatedCircuit):
+        self.device = device
+        self.slots = []
+        self._index = {}
+
+        self.ops = []
+        lowered = {}
+        for dev in device.flatten():
+            if id(dev) not in lowered:
+                lowered[id(dev)] = self.lower(dev)
+            self.ops.extend(lowered[id(dev)])
+
+    def __repr__(self):
+        return f'Netlist({self.device.name}, {self.nslot} slots, {len(self.ops)} ops)'
+
+    @property
+    def nslot(self):
+        return len(self.slots)
+
+    def slot(self, obj, attr='value'):
+        key = (id(obj), attr)
+        if key not in self._index:
+            self._index[key] = len(self.slots)
+            self.slots.append((obj, attr))
+        return self._index[key]
+
+    def find(self, obj):
+        '''
+        Slot of a Port, Branch or Relay that is part of the netlist
+        '''
+        if isinstance(obj, Branch):
+            return self._index[(id(obj), '_value')]
+        elif isinstance(obj, Relay):
+            return self._index[(id(obj), 'X')]
+        elif isinstance(obj, Switch):
+            return self._index[(id(obj), 'state')]
+        else:
+            return self._index[(id(obj), 'value')]
+
+    def load(self):
+        '''
+        Read the current object state into a new slot list
+        '''
+        return [getattr(obj, attr) for obj, attr in self.slots]
+
+    def store(self, state):
+        '''
+        Write a slot list back to the objects
+        '''
+        for (obj, attr), value in zip(self.slots, state):
+            setattr(obj, attr, value)
+
+    def pull(self, port):
+        # Port.update_value()
+        if port.connected:
+            return [(COPY, self.slot(port), self.slot(port.connected))]
+        return []
+
+    def lower(self, dev):
+        '''
+        Ops for one update_inport(), update_state(), calc_output() of a primitive
+        '''
+        ops = []
+        if isinstance(dev, Relay):
+            X = self.slot(dev, 'X')
+            if dev.type == Relay.NORMAL:
+                ops += self.pull(dev.up)
+                ops += self.pull(dev.le)
+                ops.append((CHARGE, X, self.slot(dev.le)))
+                ops.append((SELECT, self.slot(dev.ru), X, None, self.slot(dev.up)))
+                ops.append((SELECT, self.slot(dev.rd), X, self.slot(dev.up), None))
+            else: # REVERSED
+                ops += self.pull(dev.le)
+                ops += self.pull(dev.ru)
+                ops += self.pull(dev.rd)
+                ops.append((CHARGE, X, self.slot(dev.le)))
+                ops.append((SELECT, self.slot(dev.up), X, self.slot(dev.rd), self.slot(dev.ru)))
+        elif isinstance(dev, Branch):
+            value = self.slot(dev, '_value')
+            for p in dev.inport:
+                ops += self.pull(p)
+            if dev.inport:
+                ops.append((RESOLVE, value, tuple(self.slot(p) for p in dev.inport)))
+                ops.extend([(COPY, self.slot(p), value) for p in dev.inport])
+            ops.extend([(COPY, self.slot(p), value) for p in dev.outport])
+        elif isinstance(dev, Switch):
+            ops += self.pull(dev.le)
+            ops.append((SELECT, self.slot(dev.ri), self.slot(dev, 'state'), self.slot(dev.le), None))
+        elif isinstance(dev, Ground):
+            ops.append((CONST, self.slot(dev.ri), GND))
+        elif isinstance(dev, Power):
+            self.slot(dev.O) # driven by on()/off() only
+        elif hasattr(dev, 'lower'): # behavioral models lower themselves
+            ops = dev.lower(self)
+        else:
+            raise(NotImplementedError)
+        return ops
+
+    def execute(self, state, ops=None):
+        '''
+        Reference interpreter: run ops (default: one step) on a slot list
+        '''
+        for op in (self.ops if ops is None else ops):
+            code = op[0]
+            if code == COPY:
+                state[op[1]] = state[op[2]]
+            elif code == CONST:
+                state[op[1]] = op[2]
+            elif code == CHARGE:
+                state[op[1]] = CHARGED if state[op[2]] == HIGH else DISCHARGED
+            elif code == SELECT:
+                src = op[3] if state[op[2]] else op[4]
+                state[op[1]] = OPEN if src is None else state[src]
+            else: # RESOLVE
+                values = [state[i] for i in op[2]]
+                if HIGH in values:
+                    if GND in values:
+                        raise(NotImplementedError)
+                    state[op[1]] = HIGH
+                elif GND in values:
+                    state[op[1]] = GND
+                else:
+                    state[op[1]] = OPEN
+
+
+def access(ops):
+    '''
+    Slots a list of ops reads before writing them, and slots it writes
+    '''
+    reads = []
+    writes = []
+    for op in ops:
+        if op[0] == CONST:
+            srcs = ()
+        elif op[0] == SELECT:
+            srcs = [i for i in op[2:] if i is not None]
+        elif op[0] == RESOLVE:
+            srcs = op[2]
+        else: # COPY, CHARGE
+            srcs = (op[2],)
+        for i in srcs:
+            if i not in writes and i not in reads:
+                reads.append(i)
+        if op[1] not in writes:
+            writes.append(op[1])
+    return reads, writes
+
+
+def generate_source(netlist: Netlist, name='step'):
+    '''
+    Straight-line Python source of one step over a slot list
+    Slots are unpacked into local variables on entry and packed back on exit.
+    '''
+    def v(i):
+        return f'v{i}' if i is not None else f'{OPEN}'
+
+    allslots = ', '.join(v(i) for i in range(netlist.nslot))
+    lines = [f'def {name}(s):']
+    if netlist.nslot:
+        lines.append(f'    {allslots}, = s')
+    for op in netlist.ops:
+        code = op[0]
+        if code == COPY:
+            lines.append(f'    {v(op[1])} = {v(op[2])}')
+        elif code == CONST:
+            lines.append(f'    {v(op[1])} = {op[2]}')
+        elif code == CHARGE:
+            lines.append(f'    {v(op[1])} = {CHARGED} if {v(op[2])} == {HIGH} else {DISCHARGED}')
+        elif code == SELECT:
+            lines.append(f'    {v(op[1])} = {v(op[3])} if {v(op[2])} else {v(op[4])}')
+        else: # RESOLVE
+            if len(op[2]) == 1:
+                lines.append(f'    {v(op[1])} = {v(op[2][0])}')
+                continue
+            values = ', '.join(v(i) for i in op[2])
+            lines.append(f'    if {HIGH} in ({values}):')
+            lines.append(f'        if {GND} in ({values}):')
+            lines.append(f'            raise NotImplementedError')
+            lines.append(f'        {v(op[1])} = {HIGH}')
+            lines.append(f'    elif {GND} in ({values}):')
+            lines.append(f'        {v(op[1])} = {GND}')
+            lines.append(f'    else:')
+            lines.append(f'        {v(op[1])} = {OPEN}')
+    if netlist.nslot:
+        lines.append(f'    s[:] = ({allslots},)')
+    else:
+        lines.append('    pass')
+    return '\n'.join(lines) + '\n'
+
+
+class CompiledCircuit:
+    '''
+    Device compiled to a single generated step(state) function
+
+    state: slot list, see Netlist; load() and store() sync it with the objects
+    source: generated Python source
+    '''
+    def __init__(self, device: SimulatedCircuit):
+        self.device = device
+        self.netlist = Netlist(device)
+        self.source = generate_source(self.netlist)
+
+        namespace = {}
+        exec(compile(self.source, f'<compiled {device.name}>', 'exec'), namespace)
+        self._step = namespace['step']
+
+        self.state = self.netlist.load()
+
+    def __repr__(self):
+        return f'CompiledCircuit({self.device.name}, {self.netlist.nslot} slots, {len(self.netlist.ops)} ops)'
+
+    def load(self):
+        '''
+        Re-read the object state, e.g. after power_on() or direct port writes
+        '''
+        self.state = self.netlist.load()
+
+    def store(self):
+        '''
+        Write the compiled state back to the objects
+        '''
+        self.netlist.store(self.state)
+
+    def get(self, obj):
+        return self.state[self.netlist.find(obj)]
+
+    def set(self, obj, value):
+        self.state[self.netlist.find(obj)] = value
+
+    def power_on(self):
+        self.device.power_on()
+        self.load()
+
+    def power_off(self):
+        self.device.power_off()
+        self.load()
+
+    def step(self, n=1):
+        for i in range(n):
+            self._step(self.state)
+
+
+
+
+class TestCompiler(unittest.TestCase):
+    def _compare(self, ref, dut, stimulus, nstep):
+        # ref runs step(), dut runs compiled; every slot has to match after every step
+        ref.power_on()
+        cc = CompiledCircuit(dut)
+        cc.power_on()
+        refnet = Netlist(ref)
+        self.assertEqual(refnet.nslot, cc.netlist.nslot)
+
+        for k in range(nstep):
+            for dev in [ref, dut]:
+                stimulus(dev, k)
+            cc.load()
+            ref.step()
+            cc.step()
+            cc.store()
+            self.assertEqual(cc.state, refnet.load())
+        return cc
+
+    def test_gates(self):
+        print('test_gates')
+
+        from Gate import And, OrN, Nand, Nor, Xor, Buffer, Inverter, TriStateBuffer
+
+        def stimulus(dev, k):
+            for j in range(len(dev.I)):
+                dev.I[j].value = (k >> j) & 1
+
+        for gate in [lambda: And('and1'), lambda: OrN('or4', 4), lambda: Nand('nand1'), lambda: Nor('nor1'), lambda: Xor('xor1')]:
+            self._compare(gate(), gate(), stimulus, 16)
+
+        def stimulus(dev, k):
+            dev.I.value = k & 1
+            if hasattr(dev, 'Enable'):
+                dev.Enable.value = (k >> 1) & 1
+
+        for gate in [lambda: Buffer('bf1'), lambda: Inverter('inv1'), lambda: TriStateBuffer('tri1')]:
+            self._compare(gate(), gate(), stimulus, 4)
+
+    def test_adder8bit(self):
+        print('test_adder8bit')
+
+        from Arithmetic import Adder8bit
+
+        rd.seed(2)
+        vectors = [(rd.randint(0, 255), rd.randint(0, 255)) for k in range(20)]
+
+        def stimulus(dev, k):
+            dev.set_input(*vectors[k])
+
+        cc = self._compare(Adder8bit('ref'), Adder8bit('dut'), stimulus, len(vectors))
+        cc.store()
+        A, B = vectors[-1]
+        self.assertEqual(cc.device.get_output(), (A + B) % 256)
+
+    def test_etdff(self):
+        print('test_etdff')
+
+        from FlipFlop import EdgeTriggeredDtypeFlipFlop
+
+        io = [[0, 0], [1, 0], [1, 1], [0, 1], [0, 0], [0, 1], [0, 0], [1, 1]]
+
+        def stimulus(dev, k):
+            dev.D.value, dev.Clk.value = io[k]
+
+        self._compare(EdgeTriggeredDtypeFlipFlop('ref'), EdgeTriggeredDtypeFlipFlop('dut'), stimulus, len(io))
+
+    def test_ram16x8(self):
+        print('test_ram16x8')
+
+        from Memory import RAM16x8
+
+        rd.seed(3)
+        vectors = [(rd.randint(0, 15), rd.randint(0, 255), rd.randint(0, 1), rd.randint(0, 1)) for k in range(40)]
+
+        def stimulus(dev, k):
+            addr, DI, W, E = vectors[k]
+            dev.set_addr(addr)
+            dev.set_input(DI)
+            dev.W.value = W
+            dev.E.value = E
+
+        self._compare(RAM16x8('ref'), RAM16x8('dut'), stimulus, len(vectors))
+
+    def test_behavioral(self):
+        print('test_behavioral')
+
+        import Gate
+        from Memory import RAM16x8
+
+        rd.seed(7)
+        vectors = [(rd.randint(0, 15), rd.randint(0, 255), rd.randint(0, 1), rd.randint(0, 1)) for k in range(40)]
+
+        def stimulus(dev, k):
+            addr, DI, W, E = vectors[k]
+            dev.set_addr(addr)
+            dev.set_input(DI)
+            dev.W.value = W
+            dev.E.value = E
+
+        previous = Gate.set_fidelity(Gate.BEHAVIORAL)
+        try:
+            ref, dut = RAM16x8('ref'), RAM16x8('dut')
+        finally:
+            Gate.set_fidelity(previous)
+        self._compare(ref, dut, stimulus, len(vectors))
+
+    def test_oscillator(self):
+        print('test_oscillator')
+
+        from Counter import Oscillator
+
+        osc = Oscillator('osc1')
+        cc = CompiledCircuit(osc)
+        cc.power_on()
+        cc.step()
+        self.assertEqual(cc.get(osc.O), HIGH)
+        for i in range(6):
+            cc.step()
+            self.assertEqual(cc.get(osc.O), OPEN if i % 2 == 0 else HIGH)
+
+    def test_short_circuit(self):
+        print('test_short_circuit')
+
+        from Source import Power
+
+        class Dev(SimulatedCircuit):
+            def __init__(self, name):
+                self.pwr = Power('pwr')
+                self.gnd = Ground('gnd')
+                self.brn = Branch('brn')
+
+                (self.pwr.O, self.gnd.O) >> self.brn
+
+                self.update_sequence = [self.pwr, self.gnd, self.brn]
+
+                super().__init__('Dev', name)
+
+        dev = Dev('dev')
+        cc = CompiledCircuit(dev)
+        cc.power_on()
+        self.assertRaises(NotImplementedError, cc.step)
+
+    def test_execute(self):
+        print('test_execute')
+
+        from Arithmetic import FullAdder
+
+        fa = FullAdder('fa')
+        fa.power_on()
+        netlist = Netlist(fa)
+        for k in range(8):
+            fa.CI.value, fa.A.value, fa.B.value = (k >> 2) & 1, (k >> 1) & 1, k & 1
+            state = netlist.load()
+            netlist.execute(state)
+            fa.step()
+            self.assertEqual(state, netlist.load())
+
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTests([
+        TestCompiler('test_gates'),
+        TestCompiler('test_adder8bit'),
+        TestCompiler('test_etdff'),
+        TestCompiler('test_ram16x8'),
+        TestCompiler('test_behavioral'),
+        TestCompiler('test_oscillator'),
+        TestCompiler('test_short_circuit'),
+        TestCompiler('test_execute'),
+    ])
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
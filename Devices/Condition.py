@@ -0,0 +1,314 @@
+import unittest
+from BitValue import *
+from SimulatedCircuit import SimulatedCircuit
+from Util import resolve, value_attr
+
+
+class _Context:
+    # collects the objects, edge memories and statements of one compiled check
+    def __init__(self, device):
+        self.device = device
+        self.namespace = {}
+        self.pre = []
+        self.nmemory = 0
+
+    def bind(self, obj):
+        name = f'o{len(self.namespace)}'
+        self.namespace[name] = obj
+        return name
+
+    def memory(self):
+        self.nmemory += 1
+        return self.nmemory - 1
+
+
+class Condition:
+    '''
+    Declarative stop condition for SimulatedCircuit.run()
+
+    Conditions are combined with &, | and ~ and compiled against a device
+    into one generated function that reads the signals directly, so a check
+    costs a few attribute reads per step. Edge conditions (rises, falls,
+    changes) compare with the value seen at the previous check; the first
+    check only records it. Conditions are made from Signal, Word and Cell,
+    Condition itself cannot be built.
+    '''
+    def __new__(cls, *args, **kwargs):
+        if cls._source is Condition._source:
+            raise(RuntimeError(f'{cls.__name__} is not a condition, compare a Signal, Word or Cell'))
+        return super().__new__(cls)
+
+    def __and__(self, other):
+        return _Op(' and ', [self, other])
+
+    def __or__(self, other):
+        return _Op(' or ', [self, other])
+
+    def __invert__(self):
+        return _Not(self)
+
+    def _source(self, ctx):
+        raise(NotImplementedError)
+
+    def compile(self, device: SimulatedCircuit):
+        '''
+        return: function without arguments, True while the condition holds
+        '''
+        ctx = _Context(device)
+        expr = self._source(ctx)
+        lines = ['def check():']
+        lines.extend(f'    {line}' for line in ctx.pre)
+        lines.append(f'    return {expr}')
+        ctx.namespace['m'] = [None] * ctx.nmemory
+        exec(compile('\n'.join(lines) + '\n', f'<condition {device.name}>', 'exec'), ctx.namespace)
+        return ctx.namespace['check']
+
+
+class _Op(Condition):
+    def __init__(self, joiner, items):
+        self.joiner = joiner
+        self.items = items
+
+    def _source(self, ctx):
+        return '(' + self.joiner.join(c._source(ctx) for c in self.items) + ')'
+
+
+class _Not(Condition):
+    def __init__(self, item):
+        self.item = item
+
+    def _source(self, ctx):
+        return f'(not {self.item._source(ctx)})'
+
+
+class _Compare(Condition):
+    def __init__(self, term, op, value):
+        self.term = term
+        self.op = op
+        self.value = value
+
+    def _source(self, ctx):
+        return f'({self.term._value(ctx)} {self.op} {self.value!r})'
+
+
+class _Edge(Condition):
+    def __init__(self, term, kind):
+        self.term = term
+        self.kind = kind
+
+    def _source(self, ctx):
+        # evaluated every check, even where the expression short-circuits
+        k = ctx.memory()
+        ctx.pre.append(f'v{k} = {self.term._value(ctx)}; p{k} = m[{k}]; m[{k}] = v{k}')
+        if self.kind == 'rises':
+            return f'(p{k} is not None and p{k} != {HIGH} and v{k} == {HIGH})'
+        elif self.kind == 'falls':
+            return f'(p{k} == {HIGH} and v{k} != {HIGH})'
+        return f'(p{k} is not None and p{k} != v{k})'
+
+
+class _Term:
+    # something with a value: comparisons and edges make conditions of it
+    def __eq__(self, value):
+        return _Compare(self, '==', value)
+
+    def __ne__(self, value):
+        return _Compare(self, '!=', value)
+
+    def __lt__(self, value):
+        return _Compare(self, '<', value)
+
+    def __gt__(self, value):
+        return _Compare(self, '>', value)
+
+    def __le__(self, value):
+        return _Compare(self, '<=', value)
+
+    def __ge__(self, value):
+        return _Compare(self, '>=', value)
+
+    __hash__ = object.__hash__
+
+    def rises(self):
+        return _Edge(self, 'rises')
+
+    def falls(self):
+        return _Edge(self, 'falls')
+
+    def changes(self):
+        return _Edge(self, 'changes')
+
+
+class Signal(_Term):
+    '''
+    Value (HIGH, OPEN, GND) of a Port, Branch, Relay or Switch at a path, e.g. 'cs.ToRamW'
+    '''
+    def __init__(self, path):
+        self.path = path
+
+    def _value(self, ctx):
+        obj = resolve(ctx.device, self.path)
+        return f'{ctx.bind(obj)}.{value_attr(obj)}'
+
+    def high(self):
+        return self == HIGH
+
+
+class Word(_Term):
+    '''
+    Integer on a list of Ports/Branches at a path, element 0 as bit 0, HIGH read as 1
+    '''
+    def __init__(self, path):
+        self.path = path
+
+    def _ports(self, ctx):
+        return resolve(ctx.device, self.path)
+
+    def _value(self, ctx):
+        bits = [f'({ctx.bind(p)}.{value_attr(p)} == {HIGH}) << {i}' for i, p in enumerate(self._ports(ctx))]
+        return '(' + ' | '.join(bits) + ')'
+
+    def _any(self, ctx):
+        return '(' + ' or '.join(f'{ctx.bind(p)}.{value_attr(p)} == {HIGH}' for p in self._ports(ctx)) + ')'
+
+    def __ne__(self, value):
+        if value == 0:
+            return _Nonzero(self)
+        return _Compare(self, '!=', value)
+
+    def __eq__(self, value):
+        if value == 0:
+            return ~_Nonzero(self)
+        return _Compare(self, '==', value)
+
+    __hash__ = object.__hash__
+
+
+class _Nonzero(Condition):
+    # any bit HIGH, stops reading at the first one
+    def __init__(self, word):
+        self.word = word
+
+    def _source(self, ctx):
+        return self.word._any(ctx)
+
+
+class Cell(Word):
+    '''
+    Stored byte at addr of the RAM at a path, e.g. Cell('ram', 8) != 0
+    Relay RAMs are read from their cell ports, behavioral RAMs from their data.
+    '''
+    def __init__(self, path, addr):
+        self.path = path
+        self.addr = addr
+
+    def _ports(self, ctx):
+        return resolve(ctx.device, self.path).cell_ports(self.addr)
+
+    def _value(self, ctx):
+        ram = resolve(ctx.device, self.path)
+        if hasattr(ram, 'core'):
+            return f'{ctx.bind(ram.core.data)}[{self.addr}]'
+        return super()._value(ctx)
+
+    def _any(self, ctx):
+        ram = resolve(ctx.device, self.path)
+        if hasattr(ram, 'core'):
+            return f'({self._value(ctx)} != 0)'
+        return super()._any(ctx)
+
+
+
+
+class TestCondition(unittest.TestCase):
+    data = [0x35, 0x1B, 0x09, 0x31, 0x1E, 0x12, 0x23, 0x0C]
+
+    def _aaa(self, ram):
+        from AutomatedAccumulatingAdder import AutomatedAccumulatingAdder
+
+        aaa = AutomatedAccumulatingAdder('aaa', ram=ram)
+        aaa.power_on()
+        aaa.init()
+        aaa.write_data(self.data)
+        return aaa
+
+    def test_cell(self):
+        print('test_cell')
+
+        from Memory import RAM256x8, BehavioralRAM256x8
+
+        ndata = len(self.data)
+        for ram in [RAM256x8, BehavioralRAM256x8]:
+            # polling, the way the tests do it
+            ref = self._aaa(ram)
+            for nstep in range(1, 41):
+                ref.step()
+                if ref.read_data(ndata) != 0:
+                    break
+
+            aaa = self._aaa(ram)
+            self.assertEqual(aaa.run(40, until=Cell('ram', ndata) != 0), nstep)
+            self.assertEqual(aaa.read_data(ndata), sum(self.data))
+            self.assertTrue((Cell('ram', ndata) == sum(self.data)).compile(aaa)())
+
+    def test_edges(self):
+        print('test_edges')
+
+        from Memory import BehavioralRAM256x8
+
+        aaa = self._aaa(BehavioralRAM256x8)
+        rises = (Signal('cs.ToRamW').rises()).compile(aaa)
+        falls = (Signal('cs.ToRamW').falls()).compile(aaa)
+        values = []
+        seen_rise = []
+        seen_fall = []
+        for k in range(40):
+            aaa.step()
+            values.append(aaa.cs.ToRamW.value)
+            seen_rise.append(rises())
+            seen_fall.append(falls())
+        expect_rise = [k > 0 and values[k - 1] != HIGH and values[k] == HIGH for k in range(40)]
+        expect_fall = [k > 0 and values[k - 1] == HIGH and values[k] != HIGH for k in range(40)]
+        self.assertEqual(seen_rise, expect_rise)
+        self.assertEqual(seen_fall, expect_fall)
+        self.assertIn(True, seen_rise)
+
+        # the edge is remembered even when an or short-circuits before it
+        aaa = self._aaa(BehavioralRAM256x8)
+        n = aaa.run(40, until=Signal('cs.ToRamW').rises())
+        self.assertEqual(n, expect_rise.index(True) + 1)
+        check = (Word('counter.Q') != 99) | Signal('cs.ToRamW').rises()
+        self.assertTrue(check.compile(aaa)())
+
+    def test_run(self):
+        print('test_run')
+
+        from FlipFlop import RSFlipFlop
+        from Memory import BehavioralRAM256x8
+
+        dev = RSFlipFlop('rsff')
+        dev.power_on()
+        self.assertEqual(dev.run(3), 3)
+        self.assertIsNone(dev.run(3, until=Signal('Q').high()))
+        dev.S.set()
+        self.assertEqual(dev.run(3, until=Signal('Q').high() & ~(Signal('Qbar') == HIGH)), 1)
+        self.assertEqual(dev.run(3, until=lambda: dev.Q.value == HIGH), 1) # plain callables work too
+        with self.assertRaises(RuntimeError):
+            Condition()
+
+        aaa = self._aaa(BehavioralRAM256x8)
+        self.assertEqual(aaa.run(60, until=Word('counter.Q') == 3), 13)
+        self.assertEqual(aaa.counter.get_output(), 3)
+        self.assertEqual(aaa.run(60, until=Word('counter.Q').changes()), 4) # the counter clock has period 4
+        self.assertEqual(aaa.counter.get_output(), 4)
+
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTests([
+        TestCondition('test_cell'),
+        TestCondition('test_edges'),
+        TestCondition('test_run'),
+    ])
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -5,7 +5,8 @@ from Port import Port
 from Gate import Inverter
 from FlipFlop import EdgeTriggeredDtypeFlipFlop
 from Branch import Branch
-from Util import i2b_ri, pav2i
+from Bus import Bus
+from Util import i2b_ri
 
 
 class Oscillator(SimulatedCircuit):
@@ -43,7 +44,7 @@ class RippleCounter(SimulatedCircuit):
             self.update_sequence.extend([self.etff[i], self.brn[i]])
 
         self.Clk = self.etff[0].Clk
-        self.Q = [self.etff[i].Q for i in range(self.nbit)]
+        self.Q = Bus(self.etff[i].Q for i in range(self.nbit))
 
         super().__init__(self.device_name, self.name)
     
@@ -51,7 +52,7 @@ class RippleCounter(SimulatedCircuit):
         return f'{self.device_name}({self.name}, {self.get_output()})'
     
     def get_output(self):
-        return pav2i(self.Q, self.nbit)
+        return self.Q.value
     
     def init(self):
         for i in range(self.nbit):
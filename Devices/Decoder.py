@@ -4,7 +4,8 @@ from SimulatedCircuit import SimulatedCircuit
 from Port import Port
 from Branch import Branch
 from Gate import And, AndN, OrN, Or, Inverter
-from Util import i2b_ri, pav2i
+from Bus import Bus
+from Util import i2b_ri
 
 
 class Decoder(SimulatedCircuit):
@@ -19,7 +20,7 @@ class Decoder(SimulatedCircuit):
         self.nloc = 2**n
 
         # create elements
-        self.brnd = [Branch(f'brnd{i}') for i in range(self.naddr)] # branch directly connected
+        self.brnd = Bus(Branch(f'brnd{i}') for i in range(self.naddr)) # branch directly connected
         self.inv = [Inverter(f'inv{i}') for i in range(self.naddr)]
         self.brni = [Branch(f'brni{i}') for i in range(self.naddr)] # branch connected through inverter
         self.ando = [AndN(f'and{i}', 4) for i in range(self.nloc)]
@@ -34,7 +35,7 @@ class Decoder(SimulatedCircuit):
 
         # create access points
         self.A = self.brnd
-        self.O = [self.ando[i].O for i in range(self.nloc)]
+        self.O = Bus(self.ando[i].O for i in range(self.nloc))
 
         # update sequences
         self.update_sequence = [self.brnd[i] for i in range(self.naddr)]
@@ -51,12 +52,10 @@ class Decoder(SimulatedCircuit):
         if addr < 0 or addr > self.nloc - 1:
             raise(RuntimeError)
 
-        bin = i2b_ri(addr, 4)
-        for i in range(self.naddr):
-            self.A[i].value = bin[i]
+        self.A.value = addr
     
     def get_output(self):
-        return pav2i(self.O, self.nloc)
+        return self.O.value
     
 
 class Decoder4to16(Decoder):
@@ -85,8 +84,8 @@ class Selector(SimulatedCircuit):
 
         # create access points
         self.Signal = self.brn
-        self.I = [self.ando[i].I[0] for i in range(self.nloc)]
-        self.O = [self.ando[i].O for i in range(self.nloc)]
+        self.I = Bus(self.ando[i].I[0] for i in range(self.nloc))
+        self.O = Bus(self.ando[i].O for i in range(self.nloc))
 
         # update sequence
         self.update_sequence = [self.brn]
@@ -98,7 +97,7 @@ class Selector(SimulatedCircuit):
         return f"{self.device_name}({self.name}, Signal = {str(self.Signal.value)}, {''.join([str(self.I[i].value) for i in range(self.nloc)])[::-1]} -> {''.join([str(self.O[i].value) for i in range(self.nloc)])[::-1]})"
     
     def get_output(self):
-        return pav2i(self.O, self.nloc)
+        return self.O.value
 
 
 class Selector16to1(Selector):
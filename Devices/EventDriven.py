@@ -0,0 +1,257 @@
+import unittest
+import heapq
+import random as rd
+from BitValue import *
+from SimulatedCircuit import SimulatedCircuit
+from Compiler import Netlist, access
+
+
+class EventDrivenSimulator:
+    '''
+    Steps a device by re-evaluating only primitives whose inputs changed
+
+    The flattened update sequence keeps its order: a primitive is evaluated
+    at its position in the sequence only if something it reads changed since
+    its last evaluation, so results are the same as step(). Fanout comes from
+    the connections themselves (Port.connected, Branch inports/outports) as
+    lowered by Netlist: a value written by one primitive and pulled by another
+    wakes the reader. Signals nothing inside the device drives (unconnected
+    ports, Power outputs, Branches without inports, Switch states) are
+    compared at the start of every step, so inputs are applied the usual way.
+
+    evaluations: number of primitives evaluated in the last step
+    '''
+    def __init__(self, device: SimulatedCircuit):
+        self.device = device
+        self.sequence = device.flatten()
+        self.netlist = Netlist(device)
+
+        self.devices = []
+        self._index = {}
+        self._positions = []
+        for pos, dev in enumerate(self.sequence):
+            if id(dev) not in self._index:
+                self._index[id(dev)] = len(self.devices)
+                self.devices.append(dev)
+                self._positions.append([])
+            self._positions[self._index[id(dev)]].append(pos)
+
+        # slots each primitive reads from others and slots it writes
+        reads = []
+        writes = []
+        active = []
+        for dev in self.devices:
+            ops = self.netlist.lower(dev)
+            r, w = access(ops)
+            reads.append(r)
+            writes.append(w)
+            active.append(len(ops) > 0) # Power has nothing to evaluate
+
+        readers = {}
+        for k, r in enumerate(reads):
+            for i in r:
+                readers.setdefault(i, []).append(k)
+        written = set()
+        for w in writes:
+            written.update(w)
+
+        # per primitive: the written signals somebody else reads, with their readers
+        self._fanout = []
+        for k, w in enumerate(writes):
+            self._fanout.append([
+                (self.netlist.slots[i], [j for j in readers[i] if j != k])
+                for i in w if i in readers and readers[i] != [k]
+                ])
+
+        # signals driven from outside the device
+        self._sources = [(self.netlist.slots[i], readers[i]) for i in sorted(readers) if i not in written]
+        self._snapshot = [getattr(obj, attr) for (obj, attr), r in self._sources]
+
+        self._phases = [(dev.update_inport, dev.update_state, dev.calc_output) for dev in self.devices]
+        self._owner = [self._index[id(dev)] for dev in self.sequence]
+        self._evaluate = [active[k] for k in self._owner]
+
+        self.evaluations = 0
+        self.invalidate()
+
+    def __repr__(self):
+        return f'EventDrivenSimulator({self.device.name}, {len(self.sequence)} positions, {self.evaluations} evaluations in last step)'
+
+    def invalidate(self):
+        '''
+        Evaluate everything on the next step, e.g. after stepping sub-devices directly
+        '''
+        self._pending = set(range(len(self.sequence)))
+
+    def power_on(self):
+        self.device.power_on()
+
+    def power_off(self):
+        self.device.power_off()
+
+    def _mark(self, k, pos, queue, queued):
+        for p in self._positions[k]:
+            if p > pos:
+                if not queued[p]:
+                    queued[p] = True
+                    heapq.heappush(queue, p)
+            else:
+                self._pending.add(p)
+
+    def step(self, n=1):
+        for i in range(n):
+            self._step()
+        return self.evaluations
+
+    def _step(self):
+        queued = [False] * len(self.sequence)
+        for p in self._pending:
+            queued[p] = True
+        queue = list(self._pending)
+        heapq.heapify(queue)
+        self._pending = set()
+
+        for s, ((obj, attr), readers) in enumerate(self._sources):
+            if getattr(obj, attr) != self._snapshot[s]:
+                for k in readers:
+                    self._mark(k, -1, queue, queued)
+
+        evaluations = 0
+        while queue:
+            pos = heapq.heappop(queue)
+            if not self._evaluate[pos]:
+                continue
+            k = self._owner[pos]
+            fanout = self._fanout[k]
+            before = [getattr(obj, attr) for (obj, attr), readers in fanout]
+
+            update_inport, update_state, calc_output = self._phases[k]
+            update_inport()
+            update_state()
+            calc_output()
+            evaluations += 1
+
+            for ((obj, attr), readers), value in zip(fanout, before):
+                if getattr(obj, attr) != value:
+                    for j in readers:
+                        self._mark(j, pos, queue, queued)
+
+        self._snapshot = [getattr(obj, attr) for (obj, attr), r in self._sources]
+        self.evaluations = evaluations
+
+
+
+
+class TestEventDriven(unittest.TestCase):
+    def test_ram16x8(self):
+        print('test_ram16x8')
+
+        from Memory import RAM16x8
+
+        ref = RAM16x8('ref')
+        dut = RAM16x8('dut')
+        sim = EventDrivenSimulator(dut)
+        ref.power_on()
+        sim.power_on()
+        ref.step()
+        full = sim.step()
+
+        rd.seed(6)
+        counts = []
+        for k in range(100):
+            addr = rd.randint(0, 15)
+            DI = rd.randint(0, 255)
+            W = rd.randint(0, 1)
+            E = rd.randint(0, 1)
+            for dev in [ref, dut]:
+                dev.set_addr(addr)
+                dev.set_input(DI)
+                dev.W.value = W
+                dev.E.value = E
+            ref.step()
+            counts.append(sim.step())
+            self.assertEqual(dut.get_output(), ref.get_output())
+            self.assertEqual(dut.print_cell(), ref.print_cell())
+
+        # print(f'{full} evaluations on the first step, {sum(counts) / len(counts):.0f} on average after')
+        self.assertLess(max(counts), full)
+
+        # nothing changes, nothing is evaluated
+        sim.step()
+        self.assertEqual(sim.step(), 0)
+
+    def test_rsff(self):
+        print('test_rsff')
+
+        from FlipFlop import RSFlipFlop
+
+        dev = RSFlipFlop('rsff1')
+        sim = EventDrivenSimulator(dev)
+        sim.power_on()
+        sim.step()
+
+        io = [ # [[S, R], Q],
+            [[0, 0], 0],
+            [[1, 0], 1],
+            [[0, 0], 1],
+            [[0, 1], 0],
+            [[0, 0], 0],
+        ]
+
+        for i in range(len(io)):
+            dev.S.value = io[i][0][0]
+            dev.R.value = io[i][0][1]
+            sim.step()
+            self.assertEqual(dev.Q.value, io[i][1])
+            self.assertNotEqual(dev.Q.value, dev.Qbar.value)
+
+    def test_oscillator(self):
+        print('test_oscillator')
+
+        from Counter import Oscillator
+
+        osc = Oscillator('osc1')
+        sim = EventDrivenSimulator(osc)
+        sim.power_on()
+        sim.step()
+        self.assertEqual(osc.O.value, HIGH)
+        for i in range(6):
+            self.assertGreater(sim.step(), 0)
+            self.assertEqual(osc.O.value, OPEN if i % 2 == 0 else HIGH)
+
+    def test_automated_accumulating_adder(self):
+        print('test_automated_accumulating_adder')
+
+        from AutomatedAccumulatingAdder import AutomatedAccumulatingAdder
+
+        data = [0x35, 0x1B, 0x09, 0x31, 0x1E, 0x12, 0x23, 0x0C]
+        ndata = len(data)
+
+        aaa = AutomatedAccumulatingAdder('aaa')
+        aaa.power_on()
+        aaa.init()
+        aaa.write_data(data)
+
+        sim = EventDrivenSimulator(aaa)
+        correct = False
+        for i in range(40):
+            sim.step()
+            self.assertLess(sim.evaluations, len(sim.sequence))
+            res = aaa.read_data(ndata)
+            if res != 0:
+                self.assertEqual(res, sum(data))
+                correct = True
+                break
+        self.assertTrue(correct)
+
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTests([
+        TestEventDriven('test_ram16x8'),
+        TestEventDriven('test_rsff'),
+        TestEventDriven('test_oscillator'),
+        TestEventDriven('test_automated_accumulating_adder'),
+    ])
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
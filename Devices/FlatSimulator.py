@@ -0,0 +1,240 @@
+import unittest
+import random as rd
+from BitValue import *
+from SimulatedCircuit import SimulatedCircuit
+from Source import Power
+
+
+class FlatSimulator:
+    '''
+    Runs a device from its flattened primitive schedule
+
+    device: device to simulate (any SimulatedCircuit)
+    sequence: primitive devices in update order, see SimulatedCircuit.flatten()
+    '''
+    def __init__(self, device: SimulatedCircuit):
+        self.device = device
+        self.sequence = device.flatten()
+
+        # bound phase methods, resolved once instead of three hasattr() per device and step
+        # Power does nothing in its phases (on/off drive Power.O directly), so it is left out
+        self._ops = [
+            (dev.update_inport, dev.update_state, dev.calc_output)
+            for dev in self.sequence if not isinstance(dev, Power)
+            ]
+
+    def __repr__(self):
+        return f'FlatSimulator({self.device.name}, {len(self._ops)} ops)'
+
+    def power_on(self):
+        self.device.power_on()
+
+    def power_off(self):
+        self.device.power_off()
+
+    def step(self, n=1):
+        for i in range(n):
+            for update_inport, update_state, calc_output in self._ops:
+                update_inport()
+                update_state()
+                calc_output()
+
+
+
+
+class TestFlatSimulator(unittest.TestCase):
+    def test_flatten(self):
+        print('test_flatten')
+
+        from Gate import And, Or
+        from Relay import Relay
+        from Branch import Branch
+
+        gate = And('and1')
+        self.assertEqual(gate.flatten(), [gate.pwr, gate.rly[0], gate.rly[1]])
+
+        gate = Or('or1')
+        sequence = gate.flatten()
+        self.assertEqual(len(sequence), 5)
+        self.assertIsInstance(sequence[0], Power)
+        self.assertIsInstance(sequence[1], Branch)
+        self.assertIsInstance(sequence[2], Relay)
+        self.assertIsInstance(sequence[4], Branch)
+
+        rly = Relay('rly', gate)
+        self.assertEqual(rly.flatten(), [rly])
+
+    def test_flatten_duplicates(self):
+        print('test_flatten_duplicates')
+
+        from FlipFlop import RSFlipFlop
+
+        dev = RSFlipFlop('rsff')
+        sequence = dev.flatten()
+        # nor2, brn2, nor1, brn1 are listed twice in RSFlipFlop.update_sequence
+        self.assertEqual(len(sequence), 16)
+        self.assertEqual(sequence[:8], sequence[8:])
+
+    def test_gates(self):
+        print('test_gates')
+
+        from Gate import And, Or, Nand, Nor, Xor
+
+        truth_tables = [
+            [And, [0, 0, 0, 1]],
+            [Or, [0, 1, 1, 1]],
+            [Nand, [1, 1, 1, 0]],
+            [Nor, [1, 0, 0, 0]],
+            [Xor, [0, 1, 1, 0]],
+        ]
+
+        for gate_class, outputs in truth_tables:
+            sim = FlatSimulator(gate_class('gate'))
+            sim.power_on()
+            for i in range(4):
+                sim.device.I[0].value = (i >> 1) & 1
+                sim.device.I[1].value = i & 1
+                sim.step()
+                self.assertEqual(sim.device.O.value, outputs[i])
+
+    def test_adder8bit(self):
+        print('test_adder8bit')
+
+        from Source import Ground
+        from Arithmetic import Adder8bit
+
+        gnd = Ground('gnd')
+        a8 = Adder8bit('a8')
+        gnd.O >> a8.CI
+        gnd.power_on()
+        gnd.step()
+
+        sim = FlatSimulator(a8)
+        sim.power_on()
+        sim.step()
+
+        for A, B in [(19, 115), (198, 115), (255, 1), (0, 0)]:
+            a8.set_input(A, B)
+            sim.step()
+            self.assertEqual(a8.get_output(), (A + B) % 256)
+            self.assertEqual(a8.CO.value, 1 if (A + B) >= 256 else 0)
+
+    def test_etdff(self):
+        print('test_etdff')
+
+        from FlipFlop import EdgeTriggeredDtypeFlipFlop
+
+        ff = EdgeTriggeredDtypeFlipFlop('etdff')
+        sim = FlatSimulator(ff)
+        sim.power_on()
+        sim.step()
+
+        io = [ # [[D, Clk], Q],
+            [[0, 0], 0],
+            [[1, 0], 0],
+            [[1, 1], 1],
+            [[0, 1], 1],
+            [[0, 0], 1],
+            [[0, 1], 0],
+            [[0, 0], 0],
+        ]
+
+        for i in range(len(io)):
+            ff.D.value = io[i][0][0]
+            ff.Clk.value = io[i][0][1]
+            sim.step()
+            self.assertEqual(ff.Q.value, io[i][1])
+            self.assertNotEqual(ff.Q.value, ff.Qbar.value)
+
+    def test_ripple_counter(self):
+        print('test_ripple_counter')
+
+        from Counter import Oscillator, RippleCounter4Bit
+        from Util import i2b_ri
+
+        osc1 = Oscillator('osc1')
+        rc = RippleCounter4Bit('rc')
+        osc1.O >> rc.Clk
+        osc1.power_on()
+        rc.power_on()
+        rc.init()
+
+        sim_osc = FlatSimulator(osc1)
+        sim_rc = FlatSimulator(rc)
+        for i in range(20):
+            for k in range(2):
+                sim_osc.step()
+                sim_rc.step()
+            ans = i2b_ri(i % 16, 4)
+            for j in range(4):
+                self.assertEqual(rc.Q[j].value, ans[j])
+
+    def test_ram16x8(self):
+        print('test_ram16x8')
+
+        from Memory import RAM16x8
+
+        # the same random traffic through step() and FlatSimulator.step()
+        ref = RAM16x8('ref')
+        dut = RAM16x8('dut')
+        sim = FlatSimulator(dut)
+        ref.power_on()
+        sim.power_on()
+        ref.step()
+        sim.step()
+
+        rd.seed(1)
+        for k in range(100):
+            addr = rd.randint(0, 15)
+            DI = rd.randint(0, 255)
+            W = rd.randint(0, 1)
+            E = rd.randint(0, 1)
+            for dev in [ref, dut]:
+                dev.set_addr(addr)
+                dev.set_input(DI)
+                dev.W.value = W
+                dev.E.value = E
+            ref.step()
+            sim.step()
+            self.assertEqual(dut.get_output(), ref.get_output())
+            self.assertEqual(dut.print_cell(), ref.print_cell())
+
+    def test_automated_accumulating_adder(self):
+        print('test_automated_accumulating_adder')
+
+        from AutomatedAccumulatingAdder import AutomatedAccumulatingAdder
+
+        data = [0x35, 0x1B, 0x09, 0x31, 0x1E, 0x12, 0x23, 0x0C]
+        ndata = len(data)
+
+        aaa = AutomatedAccumulatingAdder('aaa')
+        aaa.power_on()
+        aaa.init()
+        aaa.write_data(data)
+
+        sim = FlatSimulator(aaa)
+        correct = False
+        for i in range(40):
+            sim.step()
+            res = aaa.read_data(ndata)
+            if res != 0:
+                self.assertEqual(res, sum(data))
+                correct = True
+                break
+        self.assertTrue(correct)
+
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTests([
+        TestFlatSimulator('test_flatten'),
+        TestFlatSimulator('test_flatten_duplicates'),
+        TestFlatSimulator('test_gates'),
+        TestFlatSimulator('test_adder8bit'),
+        TestFlatSimulator('test_etdff'),
+        TestFlatSimulator('test_ripple_counter'),
+        TestFlatSimulator('test_ram16x8'),
+        TestFlatSimulator('test_automated_accumulating_adder'),
+    ])
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -4,7 +4,7 @@ from SimulatedCircuit import SimulatedCircuit
 from Port import Port
 from Branch import Branch
 from Gate import And, Nor, Inverter
-from Util import i2b_ri, pav2i
+from Bus import Bus
 
 
 class RSFlipFlop(SimulatedCircuit):
@@ -137,8 +137,8 @@ class LatchNbit(SimulatedCircuit):
         for i in range(self.nbit):
             self.brn >> self.latch[i].Clk
 
-        self.D = [self.latch[i].D for i in range(self.nbit)]
-        self.Q = [self.latch[i].Q for i in range(self.nbit)]
+        self.D = Bus(self.latch[i].D for i in range(self.nbit))
+        self.Q = Bus(self.latch[i].Q for i in range(self.nbit))
 
         self.update_sequence = [self.brn]
         self.update_sequence.extend([self.latch[i] for i in range(self.nbit)])
@@ -148,12 +148,10 @@ class LatchNbit(SimulatedCircuit):
     def set_input(self, D: int):
         if D > 2**self.nbit - 1 or D < 0:
             raise(RuntimeError)
-        strD = i2b_ri(D, self.nbit)
-        for i in range(self.nbit):
-            self.D[i].value = strD[i]
+        self.D.value = D
     
     def get_output(self):
-        return pav2i(self.Q, self.nbit)
+        return self.Q.value
 
 
 class Latch8bit(LatchNbit):
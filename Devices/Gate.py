@@ -1,44 +1,152 @@
 from BitValue import *
 from SimulatedCircuit import SimulatedCircuit
 from Port import Port
-from Relay import Relay
+from Relay import Relay, CHARGED, DISCHARGED
 from Source import Power
 from Branch import Branch
 from collections.abc import Iterable
 from Util import i2b_ri
 
 
-class AndN(SimulatedCircuit):
+# fidelity of newly created gates
+RELAY = 'relay'           # network of Relay, Power and Branch
+BEHAVIORAL = 'behavioral' # single evaluator on the same access points
+
+fidelity = RELAY
+
+def set_fidelity(level):
+    '''
+    Set the default fidelity of gates created from now on
+    return: the previous default
+    '''
+    global fidelity
+    if level not in (RELAY, BEHAVIORAL):
+        raise(RuntimeError)
+    previous = fidelity
+    fidelity = level
+    return previous
+
+
+class Gate(SimulatedCircuit):
+    '''
+    Common part of the gates
+
+    At RELAY fidelity a gate is a composite of relays. At BEHAVIORAL fidelity
+    it has no update_sequence and is stepped like a primitive: update_inport()
+    pulls the inputs, update_state() evaluates them into X and calc_output()
+    drives O, HIGH only while powered. Connections and access points are the
+    same at both fidelities.
+
+    fidelity: RELAY or BEHAVIORAL
+    supply: HIGH while powered, OPEN otherwise (BEHAVIORAL only)
+    X: evaluated condition, CHARGED or DISCHARGED like Relay.X (BEHAVIORAL only)
+    '''
+    __slots__ = ('fidelity', 'supply', 'X', 'inputs', 'I', 'O', 'update_sequence')
+
+    def _fidelity(self, level):
+        self.fidelity = fidelity if level is None else level
+        if self.fidelity not in (RELAY, BEHAVIORAL):
+            raise(RuntimeError)
+        if self.fidelity == BEHAVIORAL:
+            self.supply = OPEN
+            self.X = DISCHARGED
+            return True
+        return False
+
+    def on(self):
+        self.supply = HIGH
+
+    def off(self):
+        self.supply = OPEN
+
+    def update_inport(self):
+        for p in self.inputs:
+            p.update_value()
+
+    def _drive(self, value):
+        if isinstance(self.O, Branch):
+            self.O._value = value
+            self.O.calc_output()
+        else:
+            self.O.value = value
+
+    # lowering to Netlist ops (see Compiler), output slot doubles as scratch
+    def _lower_out(self, netlist):
+        return netlist.slot(self.O, '_value') if isinstance(self.O, Branch) else netlist.slot(self.O)
+
+    def _lower_inputs(self, netlist):
+        ops = []
+        for p in self.inputs:
+            ops += netlist.pull(p)
+        return ops
+
+    def _lower_reduce(self, netlist, any_high):
+        from Compiler import CHARGE, SELECT
+        X = netlist.slot(self, 'X')
+        t = self._lower_out(netlist)
+        ops = [(CHARGE, X, netlist.slot(self.inputs[-1]))]
+        for p in reversed(self.inputs[:-1]):
+            ops.append((CHARGE, t, netlist.slot(p)))
+            ops.append((SELECT, X, t, t, X) if any_high else (SELECT, X, t, X, None))
+        return ops
+
+    def _lower_drive(self, netlist, a, b):
+        from Compiler import COPY, SELECT
+        out = self._lower_out(netlist)
+        ops = [(SELECT, out, netlist.slot(self, 'X'), a, b)]
+        if isinstance(self.O, Branch):
+            ops.extend([(COPY, netlist.slot(p), out) for p in self.O.outport])
+        return ops
+
+
+class AndN(Gate):
     '''
     n: no. of inputs
     I: Input signal vector (n x 1)
     O: Output signal (HIGH or OPEN)
     '''
-    def __init__(self, name, n):
+    __slots__ = ('n', '_nconnected', '_outconnected', 'pwr', 'rly')
+
+    def __init__(self, name, n, fidelity=None):
         self.device_name = 'And'
         self.name = name
         self.n = n
         self._nconnected = 0
         self._outconnected = False
 
-        # elements
-        self.pwr = Power('pwr')
-        self.rly = [Relay(f'rly{i}', self) for i in range(self.n)]
+        if self._fidelity(fidelity):
+            # points
+            self.I = [Port(f'I{i}', self) for i in range(self.n)]
+            self.O = Port('O', self)
+            self.inputs = self.I
+        else:
+            # elements
+            self.pwr = Power('pwr')
+            self.rly = [Relay(f'rly{i}', self) for i in range(self.n)]
+
+            # connections
+            self.pwr.O >> self.rly[0].up
+            for i in range(self.n - 1):
+                self.rly[i].rd >> self.rly[i + 1].up
+
+            # points
+            self.I = [self.rly[i].le for i in range(self.n)]
+            self.O = self.rly[-1].rd
+
+            # update sequence
+            self.update_sequence = [self.pwr]
+            self.update_sequence.extend([self.rly[i] for i in range(self.n)])
+    
+        super().__init__(self.device_name, self.name)
 
-        # connections
-        self.pwr.O >> self.rly[0].up
-        for i in range(self.n - 1):
-            self.rly[i].rd >> self.rly[i + 1].up
+    def update_state(self):
+        self.X = CHARGED if all(p.value == HIGH for p in self.I) else DISCHARGED
 
-        # points
-        self.I = [self.rly[i].le for i in range(self.n)]
-        self.O = self.rly[-1].rd
+    def calc_output(self):
+        self._drive(self.supply if self.X else OPEN)
 
-        # update sequence
-        self.update_sequence = [self.pwr]
-        self.update_sequence.extend([self.rly[i] for i in range(self.n)])
-    
-        super().__init__(self.device_name, self.name)
+    def lower(self, netlist):
+        return self._lower_inputs(netlist) + self._lower_reduce(netlist, False) + self._lower_drive(netlist, netlist.slot(self, 'supply'), None)
     
     @property
     def nconnected(self):
@@ -88,46 +196,65 @@ class AndN(SimulatedCircuit):
     
 
 class And(AndN):
-    def __init__(self, name):
-        super().__init__(name, 2)
+    __slots__ = ()
+
+    def __init__(self, name, fidelity=None):
+        super().__init__(name, 2, fidelity)
 
 
-class OrN(SimulatedCircuit):
+class OrN(Gate):
     '''
     n: no. of inputs
     I: Input signal vector (n x 1)
     O: Output signal (HIGH or OPEN)
     '''
-    def __init__(self, name, n):
+    __slots__ = ('n', '_nconnected', '_outconnected', 'pwr', 'brnpw', 'rly', 'brno')
+
+    def __init__(self, name, n, fidelity=None):
         self.device_name = 'Or'
         self.name = name
         self.n = n
         self._nconnected = 0
         self._outconnected = False
 
-        # elements
-        self.pwr = Power('pwr')
-        self.brnpw = Branch('brnpw')
-        self.rly = [Relay(f'rly{i}', self) for i in range(self.n)]
-        self.brno = Branch('brno')
-
-        # connections
-        self.pwr.O >> self.brnpw
-        for i in range(self.n):
-            self.brnpw >> self.rly[i].up
-            self.rly[i].rd >> self.brno
-
-        # access points
-        self.I = [self.rly[i].le for i in range(self.n)]
-        self.O = self.brno
-
-        # update sequence
-        self.update_sequence = [self.pwr, self.brnpw]
-        self.update_sequence.extend([self.rly[i] for i in range(self.n)])
-        self.update_sequence.append(self.brno)
+        if self._fidelity(fidelity):
+            # access points
+            self.I = [Port(f'I{i}', self) for i in range(self.n)]
+            self.O = Branch('brno')
+            self.inputs = self.I
+        else:
+            # elements
+            self.pwr = Power('pwr')
+            self.brnpw = Branch('brnpw')
+            self.rly = [Relay(f'rly{i}', self) for i in range(self.n)]
+            self.brno = Branch('brno')
+
+            # connections
+            self.pwr.O >> self.brnpw
+            for i in range(self.n):
+                self.brnpw >> self.rly[i].up
+                self.rly[i].rd >> self.brno
+
+            # access points
+            self.I = [self.rly[i].le for i in range(self.n)]
+            self.O = self.brno
+
+            # update sequence
+            self.update_sequence = [self.pwr, self.brnpw]
+            self.update_sequence.extend([self.rly[i] for i in range(self.n)])
+            self.update_sequence.append(self.brno)
     
         super().__init__(self.device_name, name)
 
+    def update_state(self):
+        self.X = CHARGED if any(p.value == HIGH for p in self.I) else DISCHARGED
+
+    def calc_output(self):
+        self._drive(self.supply if self.X else OPEN)
+
+    def lower(self, netlist):
+        return self._lower_inputs(netlist) + self._lower_reduce(netlist, True) + self._lower_drive(netlist, netlist.slot(self, 'supply'), None)
+
     @property
     def nconnected(self):
         return self._nconnected
@@ -176,110 +303,200 @@ class OrN(SimulatedCircuit):
     
 
 class Or(OrN):
-    def __init__(self, name):
-        super().__init__(name, 2)
+    __slots__ = ()
+
+    def __init__(self, name, fidelity=None):
+        super().__init__(name, 2, fidelity)
 
 
-class Nand(SimulatedCircuit):
-    def __init__(self, name):
+class Nand(Gate):
+    __slots__ = ('pwr1', 'pwr2', 'rly1', 'rly2', 'brn')
+
+    def __init__(self, name, fidelity=None):
         self.device_name = 'Nand'
         self.name = name
 
-        # creat elements
-        self.pwr1 = Power('pwr1')
-        self.pwr2 = Power('pwr2')
-        self.rly1 = Relay('rly1', self)
-        self.rly2 = Relay('rly2', self)
-        self.brn = Branch('brn')
-
-        # connect
-        self.pwr1.O >> self.rly1.up
-        self.pwr2.O >> self.rly2.up
-        self.rly1.ru >> self.brn
-        self.rly2.ru >> self.brn
-
-        # create access points
-        self.I = [self.rly1.le, self.rly2.le]
-        self.O = self.brn
-
-        # update sequences
-        self.update_sequence = [self.pwr1, self.pwr2, self.rly1, self.rly2, self.brn]
+        if self._fidelity(fidelity):
+            # create access points
+            self.I = [Port('I0', self), Port('I1', self)]
+            self.O = Branch('brn')
+            self.inputs = self.I
+        else:
+            # creat elements
+            self.pwr1 = Power('pwr1')
+            self.pwr2 = Power('pwr2')
+            self.rly1 = Relay('rly1', self)
+            self.rly2 = Relay('rly2', self)
+            self.brn = Branch('brn')
+
+            # connect
+            self.pwr1.O >> self.rly1.up
+            self.pwr2.O >> self.rly2.up
+            self.rly1.ru >> self.brn
+            self.rly2.ru >> self.brn
+
+            # create access points
+            self.I = [self.rly1.le, self.rly2.le]
+            self.O = self.brn
+
+            # update sequences
+            self.update_sequence = [self.pwr1, self.pwr2, self.rly1, self.rly2, self.brn]
     
         super().__init__(self.device_name, name)
 
+    def update_state(self):
+        self.X = CHARGED if all(p.value == HIGH for p in self.I) else DISCHARGED
+
+    def calc_output(self):
+        self._drive(OPEN if self.X else self.supply)
+
+    def lower(self, netlist):
+        return self._lower_inputs(netlist) + self._lower_reduce(netlist, False) + self._lower_drive(netlist, None, netlist.slot(self, 'supply'))
+
 
-class Nor(SimulatedCircuit):
-    def __init__(self, name):
+class Nor(Gate):
+    __slots__ = ('pwr', 'rly1', 'rly2')
+
+    def __init__(self, name, fidelity=None):
         self.device_name = 'Nor'
         self.name = name
 
-        # creat update_sequence
-        self.pwr = Power('pwr')
-        self.rly1 = Relay('rly1', self)
-        self.rly2 = Relay('rly2', self)
+        if self._fidelity(fidelity):
+            # create access points
+            self.I = [Port('I0', self), Port('I1', self)]
+            self.O = Port('O', self)
+            self.inputs = self.I
+        else:
+            # creat update_sequence
+            self.pwr = Power('pwr')
+            self.rly1 = Relay('rly1', self)
+            self.rly2 = Relay('rly2', self)
 
-        # connect
-        self.pwr.O >> self.rly1.up
-        self.rly1.ru >> self.rly2.up
+            # connect
+            self.pwr.O >> self.rly1.up
+            self.rly1.ru >> self.rly2.up
 
-        # create access points
-        self.I = [self.rly1.le, self.rly2.le]
-        self.O = self.rly2.ru
+            # create access points
+            self.I = [self.rly1.le, self.rly2.le]
+            self.O = self.rly2.ru
 
-        # update sequences
-        self.update_sequence = [self.pwr, self.rly1, self.rly2]
+            # update sequences
+            self.update_sequence = [self.pwr, self.rly1, self.rly2]
     
         super().__init__(self.device_name, name)
 
+    def update_state(self):
+        self.X = CHARGED if any(p.value == HIGH for p in self.I) else DISCHARGED
 
-class Xor(SimulatedCircuit):
-    def __init__(self, name):
-        self.device_name = 'Xor'
-        self.name = name
+    def calc_output(self):
+        self._drive(OPEN if self.X else self.supply)
 
-        # creat update_sequence
-        self.pwr = Power('pwr')
-        self.rly1 = Relay('rly1', self)
-        self.rly2 = Relay('rly2', self, type=Relay.REVERSED)
+    def lower(self, netlist):
+        return self._lower_inputs(netlist) + self._lower_reduce(netlist, True) + self._lower_drive(netlist, None, netlist.slot(self, 'supply'))
 
-        # connect
-        self.pwr.O >> self.rly1.up
-        self.rly1.ru >> self.rly2.rd
-        self.rly1.rd >> self.rly2.ru
 
-        # create access points
-        self.I = [self.rly1.le, self.rly2.le]
-        self.O = self.rly2.up
+class Xor(Gate):
+    '''
+    Y: I[1] is HIGH while powered, CHARGED or DISCHARGED (BEHAVIORAL only)
+    '''
+    __slots__ = ('Y', 'pwr', 'rly1', 'rly2')
 
-        # update sequences
-        self.update_sequence = [self.pwr, self.rly1, self.rly2]
+    def __init__(self, name, fidelity=None):
+        self.device_name = 'Xor'
+        self.name = name
+
+        if self._fidelity(fidelity):
+            self.Y = DISCHARGED
+
+            # create access points
+            self.I = [Port('I0', self), Port('I1', self)]
+            self.O = Port('O', self)
+            self.inputs = self.I
+        else:
+            # creat update_sequence
+            self.pwr = Power('pwr')
+            self.rly1 = Relay('rly1', self)
+            self.rly2 = Relay('rly2', self, type=Relay.REVERSED)
+
+            # connect
+            self.pwr.O >> self.rly1.up
+            self.rly1.ru >> self.rly2.rd
+            self.rly1.rd >> self.rly2.ru
+
+            # create access points
+            self.I = [self.rly1.le, self.rly2.le]
+            self.O = self.rly2.up
+
+            # update sequences
+            self.update_sequence = [self.pwr, self.rly1, self.rly2]
     
         super().__init__(self.device_name, name)
 
+    def update_state(self):
+        self.X = CHARGED if self.I[0].value == HIGH else DISCHARGED
+        self.Y = CHARGED if self.I[1].value == HIGH and self.supply == HIGH else DISCHARGED
 
-class Buffer(SimulatedCircuit):
-    def __init__(self, name):
+    def calc_output(self):
+        if self.X:
+            self.O.value = OPEN if self.Y else self.supply
+        else:
+            self.O.value = HIGH if self.Y else OPEN
+
+    def lower(self, netlist):
+        from Compiler import CHARGE, SELECT
+        X = netlist.slot(self, 'X')
+        Y = netlist.slot(self, 'Y')
+        O = netlist.slot(self.O)
+        supply = netlist.slot(self, 'supply')
+        return self._lower_inputs(netlist) + [
+            (CHARGE, X, netlist.slot(self.I[0])),
+            (CHARGE, Y, netlist.slot(self.I[1])),
+            (SELECT, O, Y, None, supply),
+            (SELECT, Y, Y, supply, None),
+            (SELECT, O, X, O, Y),
+            ]
+
+
+class Buffer(Gate):
+    __slots__ = ('pwr', 'rly')
+
+    def __init__(self, name, fidelity=None):
         self.device_name = 'Buffer'
 
-        # creat update_sequence
-        self.pwr = Power('pwr')
-        self.rly = Relay('rly', self)
+        if self._fidelity(fidelity):
+            # create access points
+            self.I = Port('I', self)
+            self.O = Port('O', self)
+            self.inputs = [self.I]
+        else:
+            # creat update_sequence
+            self.pwr = Power('pwr')
+            self.rly = Relay('rly', self)
 
-        # connect
-        self.pwr.O >> self.rly.up
+            # connect
+            self.pwr.O >> self.rly.up
 
-        # create access points
-        self.I = self.rly.le
-        self.O = self.rly.rd
+            # create access points
+            self.I = self.rly.le
+            self.O = self.rly.rd
 
-        # update sequences
-        self.update_sequence = [self.pwr, self.rly]
+            # update sequences
+            self.update_sequence = [self.pwr, self.rly]
     
         super().__init__(self.device_name, name)
     
     def __repr__(self):
         return f'{self.device_name}({self.name}, {strof(self.I.value)} -> {strof(self.O.value)})'
 
+    def update_state(self):
+        self.X = CHARGED if self.I.value == HIGH else DISCHARGED
+
+    def calc_output(self):
+        self.O.value = self.supply if self.X else OPEN
+
+    def lower(self, netlist):
+        return self._lower_inputs(netlist) + self._lower_reduce(netlist, False) + self._lower_drive(netlist, netlist.slot(self, 'supply'), None)
+
     def __rshift__(self, obj):
         self.O >> obj
         return obj
@@ -289,27 +506,46 @@ class Buffer(SimulatedCircuit):
         return self
 
 
-class TriStateBuffer(SimulatedCircuit):
-    def __init__(self, name):
+class TriStateBuffer(Gate):
+    __slots__ = ('Enable', 'rly')
+
+    def __init__(self, name, fidelity=None):
         self.device_name = 'TriStateBuffer'
         self.name = name
 
-        # creat update_sequence
-        self.rly = Relay('rly', self)
+        if self._fidelity(fidelity):
+            # create access points
+            self.Enable = Port('Enable', self)
+            self.I = Port('I', self)
+            self.O = Port('O', self)
+            self.inputs = [self.I, self.Enable]
+        else:
+            # creat update_sequence
+            self.rly = Relay('rly', self)
 
-        # create access points
-        self.Enable = self.rly.le
-        self.I = self.rly.up
-        self.O = self.rly.rd
+            # create access points
+            self.Enable = self.rly.le
+            self.I = self.rly.up
+            self.O = self.rly.rd
 
-        # update sequences
-        self.update_sequence = [self.rly]
+            # update sequences
+            self.update_sequence = [self.rly]
     
         super().__init__(self.device_name, name)
     
     def __repr__(self):
         return f'{self.device_name}({self.name}, {strof(self.Enable.value)}: {strof(self.I.value)} -> {strof(self.O.value)})'
 
+    def update_state(self):
+        self.X = CHARGED if self.Enable.value == HIGH else DISCHARGED
+
+    def calc_output(self):
+        self.O.value = self.I.value if self.X else OPEN
+
+    def lower(self, netlist):
+        from Compiler import CHARGE
+        return self._lower_inputs(netlist) + [(CHARGE, netlist.slot(self, 'X'), netlist.slot(self.Enable))] + self._lower_drive(netlist, netlist.slot(self.I), None)
+
     def __rshift__(self, obj):
         self.O >> obj
         return obj
@@ -319,28 +555,45 @@ class TriStateBuffer(SimulatedCircuit):
         return self
 
 
-class Inverter(SimulatedCircuit):
-    def __init__(self, name):
+class Inverter(Gate):
+    __slots__ = ('pwr', 'rly')
+
+    def __init__(self, name, fidelity=None):
         self.device_name = 'Inverter'
 
-        # creat update_sequence
-        self.pwr = Power('pwr')
-        self.rly = Relay('rly', self)
+        if self._fidelity(fidelity):
+            # create access points
+            self.I = Port('I', self)
+            self.O = Port('O', self)
+            self.inputs = [self.I]
+        else:
+            # creat update_sequence
+            self.pwr = Power('pwr')
+            self.rly = Relay('rly', self)
 
-        # connect
-        self.pwr.O >> self.rly.up
+            # connect
+            self.pwr.O >> self.rly.up
 
-        # create access points
-        self.I = self.rly.le
-        self.O = self.rly.ru
+            # create access points
+            self.I = self.rly.le
+            self.O = self.rly.ru
 
-        # update sequences
-        self.update_sequence = [self.pwr, self.rly]
+            # update sequences
+            self.update_sequence = [self.pwr, self.rly]
     
         super().__init__(self.device_name, name)
     
     def __repr__(self):
         return f'{self.device_name}({self.name}, {strof(self.I.value)} -> {strof(self.O.value)})'
+
+    def update_state(self):
+        self.X = CHARGED if self.I.value == HIGH else DISCHARGED
+
+    def calc_output(self):
+        self.O.value = OPEN if self.X else self.supply
+
+    def lower(self, netlist):
+        return self._lower_inputs(netlist) + self._lower_reduce(netlist, False) + self._lower_drive(netlist, None, netlist.slot(self, 'supply'))
     
     def __rshift__(self, obj):
         self.O >> obj
@@ -732,6 +985,116 @@ class TestGate(unittest.TestCase):
             self.assertEqual(bf3.O.value, truth_table[i][1])
 
 
+    def test_behavioral(self):
+        print('test_behavioral')
+
+        gates = [
+            lambda f: AndN('and3', 3, fidelity=f),
+            lambda f: OrN('or3', 3, fidelity=f),
+            lambda f: Nand('nand1', fidelity=f),
+            lambda f: Nor('nor1', fidelity=f),
+            lambda f: Xor('xor1', fidelity=f),
+            lambda f: Buffer('bf1', fidelity=f),
+            lambda f: Inverter('inv1', fidelity=f),
+        ]
+        for gate in gates:
+            rly = gate(RELAY)
+            bhv = gate(BEHAVIORAL)
+            self.assertFalse(hasattr(bhv, 'update_sequence'))
+            inputs = lambda dev: dev.I if isinstance(dev.I, list) else [dev.I]
+            n = len(inputs(rly))
+            for power in [True, False]:
+                for dev in [rly, bhv]:
+                    dev.power_on() if power else dev.power_off()
+                for k in range(2**n):
+                    for dev in [rly, bhv]:
+                        for j in range(n):
+                            inputs(dev)[j].value = (k >> j) & 1
+                        dev.step()
+                    self.assertEqual(bhv.O.value, rly.O.value)
+
+        rly = TriStateBuffer('tsb', fidelity=RELAY)
+        bhv = TriStateBuffer('tsb', fidelity=BEHAVIORAL)
+        for k in range(4):
+            for dev in [rly, bhv]:
+                dev.I.value = k & 1
+                dev.Enable.value = k >> 1
+                dev.step()
+            self.assertEqual(bhv.O.value, rly.O.value)
+
+    def test_behavioral_lowering(self):
+        print('test_behavioral_lowering')
+
+        from Compiler import Netlist
+
+        gates = [
+            AndN('and3', 3, fidelity=BEHAVIORAL),
+            OrN('or3', 3, fidelity=BEHAVIORAL),
+            Nand('nand1', fidelity=BEHAVIORAL),
+            Nor('nor1', fidelity=BEHAVIORAL),
+            Xor('xor1', fidelity=BEHAVIORAL),
+            Buffer('bf1', fidelity=BEHAVIORAL),
+            Inverter('inv1', fidelity=BEHAVIORAL),
+            TriStateBuffer('tsb', fidelity=BEHAVIORAL),
+        ]
+        for gate in gates:
+            # an outside port on O, so Branch outputs are lowered too
+            tap = Port('tap', gate)
+            gate.O >> tap
+            netlist = Netlist(gate)
+            inputs = gate.inputs
+            for power in [True, False]:
+                gate.power_on() if power else gate.power_off()
+                for k in range(2**len(inputs)):
+                    for j in range(len(inputs)):
+                        inputs[j].value = (k >> j) & 1
+                    state = netlist.load()
+                    netlist.execute(state)
+                    gate.step()
+                    self.assertEqual(state, netlist.load())
+
+    def test_set_fidelity(self):
+        print('test_set_fidelity')
+
+        import Gate
+        from Arithmetic import Adder8bit
+        from Memory import RAM16x8
+
+        # through the imported module, whose global the other modules read
+        previous = Gate.set_fidelity(Gate.BEHAVIORAL)
+        try:
+            a8 = Adder8bit('a8')
+            ram = RAM16x8('ram')
+            rly = Gate.And('and1', fidelity=Gate.RELAY)
+        finally:
+            Gate.set_fidelity(previous)
+        self.assertEqual(Gate.fidelity, previous)
+        self.assertFalse(any(isinstance(dev, Relay) for dev in a8.flatten() + ram.flatten()))
+        self.assertEqual(rly.fidelity, RELAY)
+
+        a8.power_on()
+        for A, B in [(0, 0), (255, 1), (100, 55), (200, 200)]:
+            a8.set_input(A, B)
+            a8.step()
+            self.assertEqual(a8.get_output(), (A + B) % 256)
+
+        ram.power_on()
+        ram.step()
+        for addr in range(16):
+            ram.set_addr(addr)
+            ram.set_input(addr * 13)
+            ram.W.set()
+            ram.step()
+            ram.W.reset()
+            ram.step()
+        ram.E.set()
+        for addr in range(16):
+            ram.set_addr(addr)
+            ram.step()
+            self.assertEqual(ram.get_output(), (addr * 13) % 256)
+
+        self.assertRaises(RuntimeError, set_fidelity, 'transistor')
+
 
 
 
@@ -753,6 +1116,9 @@ if __name__ == '__main__':
         TestGate('test_AndOr'),
         TestGate('test_And_connect'),
         TestGate('test_Or_connect'),
+        TestGate('test_behavioral'),
+        TestGate('test_behavioral_lowering'),
+        TestGate('test_set_fidelity'),
     ])
     runner = unittest.TextTestRunner()
     runner.run(suite)
\ No newline at end of file
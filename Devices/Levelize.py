@@ -0,0 +1,541 @@
+import unittest
+import heapq
+from BitValue import *
+from SimulatedCircuit import SimulatedCircuit
+from Source import Power
+from Compiler import Netlist, access, CONST
+
+
+def strongly_connected(edges):
+    '''
+    Strongly connected components of a graph given as successor lists,
+    in topological order with ties broken by the lowest node index
+
+    Tarjan's algorithm, then Kahn's order of the condensation.
+    '''
+    n = len(edges)
+    index = [None] * n
+    low = [0] * n
+    onstack = [False] * n
+    stack = []
+    components = []
+    counter = 0
+
+    for root in range(n):
+        if index[root] is not None:
+            continue
+        work = [(root, 0)]
+        while work:
+            v, i = work.pop()
+            if i == 0:
+                index[v] = low[v] = counter
+                counter += 1
+                stack.append(v)
+                onstack[v] = True
+            if i < len(edges[v]):
+                work.append((v, i + 1))
+                w = edges[v][i]
+                if index[w] is None:
+                    work.append((w, 0))
+                elif onstack[w]:
+                    low[v] = min(low[v], index[w])
+                continue
+            if low[v] == index[v]:
+                component = []
+                while True:
+                    w = stack.pop()
+                    onstack[w] = False
+                    component.append(w)
+                    if w == v:
+                        break
+                components.append(sorted(component))
+            if work:
+                u = work[-1][0]
+                low[u] = min(low[u], low[v])
+
+    owner = {}
+    for c, component in enumerate(components):
+        for v in component:
+            owner[v] = c
+    succ = [set() for c in components]
+    indegree = [0] * len(components)
+    for v in range(n):
+        for w in edges[v]:
+            if owner[v] != owner[w] and owner[w] not in succ[owner[v]]:
+                succ[owner[v]].add(owner[w])
+                indegree[owner[w]] += 1
+
+    ready = [(components[c][0], c) for c in range(len(components)) if indegree[c] == 0]
+    heapq.heapify(ready)
+    ordered = []
+    while ready:
+        first, c = heapq.heappop(ready)
+        ordered.append(components[c])
+        for d in succ[c]:
+            indegree[d] -= 1
+            if indegree[d] == 0:
+                heapq.heappush(ready, (components[d][0], d))
+    return ordered
+
+
+class Loop:
+    '''
+    Feedback region among the children of one device
+
+    members: children in evaluation order
+    feedback: (source, target) edges that point back against that order
+    iterations: passes over members per step, one more than len(feedback) so a change
+        travels every feedback edge once, or more if the loop needed more passes to
+        settle from the state at levelization. Changes that go round the loop again
+        keep settling over the following steps.
+    oscillating: the loop never settles (e.g. Oscillator), so it gets one pass per step
+    '''
+    def __init__(self, members, feedback, iterations, oscillating):
+        self.members = members
+        self.feedback = feedback
+        self.iterations = iterations
+        self.oscillating = oscillating
+
+    def __repr__(self):
+        names = ', '.join(m.name for m in self.members)
+        back = ', '.join(f'{s.name}->{t.name}' for s, t in self.feedback)
+        state = 'oscillating' if self.oscillating else f'{self.iterations} iterations'
+        return f'Loop([{names}], feedback [{back}], {state})'
+
+
+class Levelization:
+    '''
+    Evaluation order of a device's children derived from connectivity
+
+    A child depends on another when it pulls a value the other one writes.
+    Children are put in topological order; strongly connected children form
+    a Loop that is repeated until a change has travelled every feedback edge.
+
+    device: composite device (has update_sequence)
+    order: derived update_sequence
+    loops: list of Loop
+    '''
+    def __init__(self, device: SimulatedCircuit, netlist: Netlist=None, _access=None):
+        self.device = device
+        self.netlist = netlist if netlist is not None else Netlist(device)
+        self._leaf_access = _access if _access is not None else {}
+
+        children = []
+        for dev in device.update_sequence:
+            if dev not in children:
+                children.append(dev)
+        self.children = children
+
+        reads = []
+        writes = []
+        for child in children:
+            r = set()
+            w = set()
+            for leaf in child.flatten():
+                lr, lw = self._access(leaf)
+                r.update(lr)
+                w.update(lw)
+            reads.append(r)
+            writes.append(w)
+
+        n = len(children)
+        self.edges = [[j for j in range(n) if j != i and reads[j] & writes[i]] for i in range(n)]
+
+        self.order = []
+        self.loops = []
+        for component in strongly_connected(self.edges):
+            if len(component) == 1 and component[0] not in self.edges[component[0]]:
+                self.order.append(children[component[0]])
+            else:
+                loop = self._loop(component)
+                self.loops.append(loop)
+                self.order.extend(loop.members * loop.iterations)
+
+    def __repr__(self):
+        out = f'Levelization({self.device.name}, {len(self.device.update_sequence)} -> {len(self.order)} entries'
+        for loop in self.loops:
+            out += f'\n  {loop}'
+        return out + ')'
+
+    def _access(self, leaf):
+        if id(leaf) not in self._leaf_access:
+            self._leaf_access[id(leaf)] = access(self.netlist.lower(leaf))
+        return self._leaf_access[id(leaf)]
+
+    def _loop(self, component):
+        # greedy order: fewest unplaced predecessors first, then hand-written order
+        members = set(component)
+        preds = {v: [u for u in component if v in self.edges[u]] for v in component}
+        placed = []
+        while len(placed) < len(component):
+            rest = [v for v in component if v not in placed]
+            v = min(rest, key=lambda v: (sum(1 for u in preds[v] if u not in placed), v))
+            placed.append(v)
+        position = {v: k for k, v in enumerate(placed)}
+        feedback = [(u, v) for u in placed for v in self.edges[u] if v in members and position[v] <= position[u]]
+
+        children = [self.children[v] for v in placed]
+        feedback = [(self.children[u], self.children[v]) for u, v in feedback]
+        passes = self._settle_passes(children)
+        oscillating = passes is None
+        # a change needs one pass plus one per feedback edge it travels back over;
+        # raised to what the loop needs from the state at levelization
+        iterations = 1 if oscillating else max(len(feedback) + 1, passes)
+        return Loop(children, feedback, iterations, oscillating)
+
+    def _settle_passes(self, members, max_passes=16):
+        # run the loop alone on a copy of the state, powered, until its values stop changing
+        # return: passes until they did, None if they cycle instead (0 if it cannot be lowered)
+        ops = []
+        written = set()
+        for member in members:
+            for leaf in member.flatten():
+                leaf_ops = self.netlist.lower(leaf)
+                ops.extend(leaf_ops)
+                written.update(access(leaf_ops)[1])
+                if isinstance(leaf, Power):
+                    ops.append((CONST, self.netlist.slot(leaf.O), HIGH))
+        written = sorted(written)
+
+        state = self.netlist.load()
+        seen = []
+        try:
+            for k in range(max_passes):
+                self.netlist.execute(state, ops)
+                values = tuple(state[i] for i in written)
+                if seen and values == seen[-1]:
+                    return len(seen)
+                if values in seen:
+                    return None
+                seen.append(values)
+        except NotImplementedError:
+            return 0
+        return None
+
+
+def levelize(device: SimulatedCircuit):
+    '''
+    Levelization of every composite in the hierarchy, innermost first
+    '''
+    netlist = Netlist(device)
+    cache = {}
+    result = []
+    done = set()
+
+    def visit(dev):
+        if id(dev) in done or not hasattr(dev, 'update_sequence'):
+            return
+        done.add(id(dev))
+        for child in dev.update_sequence:
+            visit(child)
+        result.append(Levelization(dev, netlist, cache))
+
+    visit(device)
+    return result
+
+
+def auto_sequence(device: SimulatedCircuit):
+    '''
+    Replace the update_sequence of every composite with the derived order
+    '''
+    levels = levelize(device)
+    for level in levels:
+        level.device.update_sequence = level.order
+    return levels
+
+
+class SettlePlan:
+    '''
+    Primitive-level evaluation plan used by SimulatedCircuit.settle()
+
+    Primitives are grouped into strongly connected regions in topological
+    order. A region of one primitive without feedback is evaluated once; a
+    feedback region is evaluated until none of the values it writes changes.
+
+    stages: list of (phases, watched), watched is None for a single pass
+    '''
+    def __init__(self, device: SimulatedCircuit, netlist: Netlist=None):
+        self.device = device
+        self.netlist = netlist if netlist is not None else Netlist(device)
+
+        leaves = []
+        seen = set()
+        for leaf in device.flatten():
+            if id(leaf) not in seen:
+                seen.add(id(leaf))
+                leaves.append(leaf)
+
+        reads = []
+        writes = []
+        for leaf in leaves:
+            r, w = access(self.netlist.lower(leaf))
+            reads.append(r)
+            writes.append(w)
+        readers = {}
+        for k, r in enumerate(reads):
+            for i in r:
+                readers.setdefault(i, []).append(k)
+        edges = []
+        for k, w in enumerate(writes):
+            edges.append(sorted(set(j for i in w for j in readers.get(i, ()) if j != k)))
+
+        self.stages = []
+        self.loops = 0
+        for component in strongly_connected(edges):
+            phases = []
+            for k in component:
+                leaf = leaves[k]
+                phases.extend(getattr(leaf, phase) for phase in ['update_inport', 'update_state', 'calc_output'] if hasattr(leaf, phase))
+            if len(component) == 1 and component[0] not in edges[component[0]]:
+                self.stages.append((phases, None))
+            else:
+                watched = sorted(set(i for k in component for i in writes[k]))
+                self.stages.append((phases, [self.netlist.slots[i] for i in watched]))
+                self.loops += 1
+
+    def __repr__(self):
+        return f'SettlePlan({self.device.name}, {len(self.stages)} stages, {self.loops} loops)'
+
+    def run(self, max_iters):
+        iterations = 1
+        for phases, watched in self.stages:
+            if watched is None:
+                for phase in phases:
+                    phase()
+                continue
+            for k in range(1, max_iters + 1):
+                before = [getattr(obj, attr) for obj, attr in watched]
+                for phase in phases:
+                    phase()
+                if [getattr(obj, attr) for obj, attr in watched] == before:
+                    break
+            else:
+                raise(RuntimeError(f'{self.device.name} did not settle in {max_iters} iterations'))
+            if k > iterations:
+                iterations = k
+        return iterations
+
+
+
+
+class TestLevelize(unittest.TestCase):
+    def test_rsff_loop(self):
+        print('test_rsff_loop')
+
+        from FlipFlop import RSFlipFlop
+
+        dev = RSFlipFlop('rsff1')
+        dev.power_on()
+        level = Levelization(dev)
+        self.assertEqual(len(level.loops), 1)
+        loop = level.loops[0]
+        self.assertFalse(loop.oscillating)
+        self.assertEqual(len(loop.members), 4)
+        self.assertEqual(len(loop.feedback), 1)
+        self.assertEqual(loop.iterations, 2)
+        self.assertEqual(len(level.order), 8)
+
+        level.device.update_sequence = level.order
+        dev.step()
+        io = [ # [[S, R], Q],
+            [[0, 0], 0],
+            [[1, 0], 1],
+            [[0, 0], 1],
+            [[0, 1], 0],
+            [[0, 0], 0],
+        ]
+        for i in range(len(io)):
+            dev.S.value = io[i][0][0]
+            dev.R.value = io[i][0][1]
+            dev.step()
+            self.assertEqual(dev.Q.value, io[i][1])
+            self.assertNotEqual(dev.Q.value, dev.Qbar.value)
+
+    def test_oscillator_loop(self):
+        print('test_oscillator_loop')
+
+        from Counter import Oscillator
+
+        osc = Oscillator('osc1')
+        osc.power_on()
+        level = Levelization(osc)
+        self.assertEqual(len(level.loops), 1)
+        self.assertTrue(level.loops[0].oscillating)
+        self.assertEqual(level.loops[0].iterations, 1)
+
+        auto_sequence(osc)
+        osc.step()
+        self.assertEqual(osc.O.value, HIGH)
+        for i in range(6):
+            osc.step()
+            self.assertEqual(osc.O.value, OPEN if i % 2 == 0 else HIGH)
+
+    def test_acyclic(self):
+        print('test_acyclic')
+
+        from Arithmetic import Adder8bit
+
+        a8 = Adder8bit('a8')
+        for level in levelize(a8):
+            self.assertEqual(level.loops, [])
+            self.assertEqual(len(level.order), len(level.children))
+
+        # a scrambled ripple chain is put back in carry order
+        a8.update_sequence = a8.update_sequence[::-1]
+        level = Levelization(a8)
+        self.assertEqual(level.order, a8.fa)
+
+    def test_auto_sequence(self):
+        print('test_auto_sequence')
+
+        from FlipFlop import EdgeTriggeredDtypeFlipFlop
+        from Memory import RAM16x8
+
+        ff = EdgeTriggeredDtypeFlipFlop('etdff')
+        ff.power_on()
+        auto_sequence(ff)
+        ff.step()
+
+        io = [ # [[D, Clk], Q],
+            [[0, 0], 0],
+            [[1, 0], 0],
+            [[1, 1], 1],
+            [[0, 1], 1],
+            [[0, 0], 1],
+            [[0, 1], 0],
+            [[0, 0], 0],
+        ]
+        for i in range(len(io)):
+            ff.D.value = io[i][0][0]
+            ff.Clk.value = io[i][0][1]
+            ff.step()
+            self.assertEqual(ff.Q.value, io[i][1])
+
+        ram = RAM16x8('ram')
+        ram.power_on()
+        auto_sequence(ram)
+        ram.step()
+        for addr in range(16):
+            ram.set_addr(addr)
+            ram.set_input(addr * 7)
+            ram.W.set()
+            ram.step()
+            ram.W.reset()
+            ram.step()
+        ram.E.set()
+        for addr in range(16):
+            ram.set_addr(addr)
+            ram.step()
+            self.assertEqual(ram.get_output(), addr * 7)
+
+
+class TestSettle(unittest.TestCase):
+    def test_rsff(self):
+        print('test_rsff')
+
+        from FlipFlop import RSFlipFlop
+
+        dev = RSFlipFlop('rsff1')
+        dev.power_on()
+        dev.settle()
+        io = [ # [[S, R], Q],
+            [[0, 0], 0],
+            [[1, 0], 1],
+            [[0, 0], 1],
+            [[0, 1], 0],
+            [[0, 0], 0],
+        ]
+        for i in range(len(io)):
+            dev.S.value = io[i][0][0]
+            dev.R.value = io[i][0][1]
+            iterations = dev.settle()
+            self.assertEqual(dev.Q.value, io[i][1])
+            self.assertNotEqual(dev.Q.value, dev.Qbar.value)
+            self.assertGreaterEqual(iterations, 1)
+            # settled: another pass changes nothing
+            self.assertEqual(dev.settle(), 1)
+
+    def test_etdff(self):
+        print('test_etdff')
+
+        from FlipFlop import EdgeTriggeredDtypeFlipFlop
+
+        ff = EdgeTriggeredDtypeFlipFlop('etdff')
+        ff.power_on()
+        ff.settle()
+        io = [ # [[D, Clk], Q],
+            [[0, 0], 0],
+            [[1, 0], 0],
+            [[1, 1], 1],
+            [[0, 1], 1],
+            [[0, 0], 1],
+            [[0, 1], 0],
+            [[0, 0], 0],
+        ]
+        for i in range(len(io)):
+            ff.D.value = io[i][0][0]
+            ff.Clk.value = io[i][0][1]
+            ff.settle()
+            self.assertEqual(ff.Q.value, io[i][1])
+
+    def test_adder8bit(self):
+        print('test_adder8bit')
+
+        from Arithmetic import Adder8bit
+
+        a8 = Adder8bit('a8')
+        a8.power_on()
+        self.assertNotIn('_settle_plan', a8.__dict__)
+        for A, B in [(0, 0), (255, 1), (100, 55), (200, 200)]:
+            a8.set_input(A, B)
+            self.assertEqual(a8.settle(), 1)
+            self.assertEqual(a8.get_output(), (A + B) % 256)
+        self.assertEqual(a8.__dict__['_settle_plan'].loops, 0)
+        self.assertEqual(SimulatedCircuit.__slots__, ('device_name', 'name')) # primitives carry no cache
+
+    def test_ram16x8(self):
+        print('test_ram16x8')
+
+        from Memory import RAM16x8
+
+        ram = RAM16x8('ram')
+        ram.power_on()
+        ram.settle()
+        for addr in range(16):
+            ram.set_addr(addr)
+            ram.set_input(addr * 11)
+            ram.W.set()
+            ram.settle()
+            ram.W.reset()
+            ram.settle()
+        ram.E.set()
+        for addr in range(16):
+            ram.set_addr(addr)
+            ram.settle()
+            self.assertEqual(ram.get_output(), (addr * 11) % 256)
+
+    def test_oscillator(self):
+        print('test_oscillator')
+
+        from Counter import Oscillator
+
+        osc = Oscillator('osc1')
+        osc.power_on()
+        self.assertRaises(RuntimeError, osc.settle, 10)
+
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTests([
+        TestLevelize('test_rsff_loop'),
+        TestLevelize('test_oscillator_loop'),
+        TestLevelize('test_acyclic'),
+        TestLevelize('test_auto_sequence'),
+        TestSettle('test_rsff'),
+        TestSettle('test_etdff'),
+        TestSettle('test_adder8bit'),
+        TestSettle('test_ram16x8'),
+        TestSettle('test_oscillator'),
+    ])
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -0,0 +1,290 @@
+import unittest
+import random as rd
+from BitValue import *
+from SimulatedCircuit import SimulatedCircuit
+from Branch import Branch
+from Util import walk, resolve
+
+
+# default access points of the combinational blocks: (inputs, outputs)
+PORTS = {
+    'HalfAdder': (['A', 'B'], ['S', 'CO']),
+    'FullAdder': (['CI', 'A', 'B'], ['S', 'CO']),
+    'Selector2to1': (['Select', 'A', 'B'], ['O']),
+    'Decoder4to16': (['A'], ['O']),
+}
+
+
+def expand_ports(device, names):
+    '''
+    Access point names of device to a flat list of Ports/Branches, lists in index order
+    '''
+    out = []
+    for name in names:
+        obj = resolve(device, name)
+        out.extend(obj if isinstance(obj, list) else [obj])
+    return out
+
+
+def truth_table(device, inputs, outputs):
+    '''
+    Outputs of a combinational device for every input combination, by simulation
+    return: (powered, unpowered), each a list indexed by sum(1 << i for HIGH inputs i)
+        of tuples of output values
+    The device is detached from whatever drives its inputs while the table is
+    built, and left in the state it was in.
+    '''
+    inports = expand_ports(device, inputs)
+    outports = expand_ports(device, outputs)
+    saved = device.snapshot()
+
+    # inputs are set directly, not pulled from outside
+    detached = []
+    for p in inports:
+        if isinstance(p, Branch):
+            detached.append((p, 'inport', p.inport))
+            p.inport = []
+        else:
+            detached.append((p, 'connected', p.connected))
+            p.connected = []
+    try:
+        tables = []
+        for power in (device.power_on, device.power_off):
+            power()
+            table = []
+            for k in range(1 << len(inports)):
+                for i, p in enumerate(inports):
+                    v = HIGH if (k >> i) & 1 else OPEN
+                    if isinstance(p, Branch):
+                        p._value = v
+                    else:
+                        p.value = v
+                device.step()
+                table.append(tuple(p.value for p in outports))
+            tables.append(table)
+    finally:
+        for p, attr, value in detached:
+            setattr(p, attr, value)
+        device.restore(saved)
+    return tuple(tables)
+
+
+_tables = {}
+
+
+class LookupTable(SimulatedCircuit):
+    '''
+    Stands in for a combinational device: one table lookup per step
+
+    Inputs are pulled like the device would pull them and reduced to HIGH or
+    not HIGH, which is exact when they only drive relay coils, as in the
+    blocks of PORTS. Outputs are written to the device's own output ports and
+    branches, so whatever reads them is unchanged. The table is computed once
+    per class and set of access points and shared by every instance.
+
+    For the compiled engines lower() falls back to the original primitives.
+
+    device: the replaced device
+    sequence: its original update_sequence
+    '''
+    __slots__ = ('device', 'sequence', 'inputs', 'outputs', 'table', 'supply')
+
+    def __init__(self, device: SimulatedCircuit, inputs, outputs):
+        self.device = device
+        self.sequence = device.update_sequence
+        self.inputs = expand_ports(device, inputs)
+        self.outputs = expand_ports(device, outputs)
+
+        key = (type(device), tuple(inputs), tuple(outputs))
+        if key not in _tables:
+            _tables[key] = truth_table(device, inputs, outputs)
+        self.table = _tables[key]
+        self.supply = OPEN
+
+        super().__init__('LookupTable', f'{device.name}.lut')
+
+    def on(self):
+        self.supply = HIGH
+        for dev in self.sequence: # keeps the internals valid for lower()
+            dev.power_on()
+
+    def off(self):
+        self.supply = OPEN
+        for dev in self.sequence:
+            dev.power_off()
+
+    def update_inport(self):
+        for p in self.inputs:
+            if isinstance(p, Branch):
+                p.update_inport()
+                p.update_state()
+            else:
+                p.update_value()
+
+    def update_state(self):
+        k = 0
+        for i, p in enumerate(self.inputs):
+            if p.value == HIGH:
+                k |= 1 << i
+        values = self.table[0 if self.supply == HIGH else 1][k]
+        for p, v in zip(self.outputs, values):
+            if isinstance(p, Branch):
+                p._value = v
+                p.calc_output()
+            else:
+                p.value = v
+
+    def lower(self, netlist):
+        ops = []
+        for dev in self.sequence:
+            for leaf in dev.flatten():
+                ops += netlist.lower(leaf)
+        return ops
+
+
+def lutify(device: SimulatedCircuit, inputs=None, outputs=None):
+    '''
+    Replace the update sequence of device by a LookupTable
+    inputs, outputs: access point names, default from PORTS
+    return: the LookupTable
+    '''
+    if inputs is None or outputs is None:
+        inputs, outputs = PORTS[type(device).__name__]
+    lut = LookupTable(device, inputs, outputs)
+    device.update_sequence = [lut]
+    device.__dict__.pop('_checkpoint', None) # the state now includes the table's supply
+    return lut
+
+
+def unlutify(device: SimulatedCircuit):
+    '''
+    Put the original update sequence of a lutified device back
+    '''
+    lut = device.update_sequence[0]
+    if not isinstance(lut, LookupTable):
+        raise(RuntimeError(f'{device.name} is not lutified'))
+    device.update_sequence = lut.sequence
+    device.__dict__.pop('_checkpoint', None)
+
+
+def lutify_all(device: SimulatedCircuit, classes=tuple(PORTS)):
+    '''
+    Lutify every sub-device of the given class names, outermost first
+    return: number of devices replaced
+    '''
+    done = []
+    for path, obj in list(walk(device)):
+        if type(obj).__name__ in classes and not any(path.startswith(d + '.') or path.startswith(d + '[') for d in done):
+            lutify(obj)
+            done.append(path)
+    return len(done)
+
+
+
+
+class TestLookup(unittest.TestCase):
+    def test_full_adder(self):
+        print('test_full_adder')
+
+        from Arithmetic import FullAdder
+
+        ref = FullAdder('ref')
+        dut = FullAdder('dut')
+        lut = lutify(dut)
+        self.assertEqual(dut.flatten(), [lut])
+        self.assertEqual(len(lut.table[0]), 8)
+        for dev in [ref, dut]:
+            dev.power_on()
+            dev.step()
+        for k in range(16):
+            for dev in [ref, dut]:
+                dev.A.value = (k >> 0) & 1
+                dev.B.value = (k >> 1) & 1
+                dev.CI.value = (k >> 2) & 1
+                dev.step()
+            self.assertEqual((dut.S.value, dut.CO.value), (ref.S.value, ref.CO.value))
+
+        unlutify(dut)
+        self.assertGreater(len(dut.flatten()), 1)
+
+    def test_adder8bit(self):
+        print('test_adder8bit')
+
+        from Arithmetic import Adder8bit
+        from Compiler import CompiledCircuit
+
+        ref = Adder8bit('ref')
+        dut = Adder8bit('dut')
+        self.assertEqual(lutify_all(dut), 8) # FullAdders, not their HalfAdders
+        self.assertIs(lutify(Adder8bit('other').fa[0]).table, dut.fa[3].update_sequence[0].table)
+        other = Adder8bit('compiled')
+        lutify_all(other)
+        compiled = CompiledCircuit(other) # lowered from the original primitives
+
+        rd.seed(19)
+        for dev in [ref, dut]:
+            dev.power_on()
+            dev.step()
+        compiled.power_on()
+        for k in range(40):
+            A = rd.randint(0, 255)
+            B = rd.randint(0, 255)
+            CI = rd.randint(0, 1)
+            for dev in [ref, dut, compiled.device]:
+                dev.set_input(A, B)
+                dev.CI.value = CI
+            ref.step()
+            dut.step()
+            compiled.load()
+            compiled.step()
+            compiled.store()
+            self.assertEqual(dut.get_output(), ref.get_output())
+            self.assertEqual(dut.CO.value, ref.CO.value)
+            self.assertEqual(compiled.device.get_output(), ref.get_output())
+
+    def test_decoder(self):
+        print('test_decoder')
+
+        from Decoder import Decoder4to16
+        from Memory import RAM16x8
+
+        dev = Decoder4to16('dec')
+        dev.A[2].value = HIGH
+        lutify(dev)
+        self.assertEqual(dev.A[2].value, HIGH) # left as it was
+        dev.power_on()
+        for addr in range(16):
+            dev.set_addr(addr)
+            dev.step()
+            self.assertEqual(dev.get_output(), 1 << addr)
+
+        # inside a RAM, driven through the RAM's address branches
+        ref = RAM16x8('ref')
+        ram = RAM16x8('ram')
+        self.assertEqual(lutify_all(ram), 1)
+        rd.seed(20)
+        for d in [ref, ram]:
+            d.power_on()
+            d.step()
+        for k in range(30):
+            addr = rd.randint(0, 15)
+            DI = rd.randint(0, 255)
+            W = rd.randint(0, 1)
+            for d in [ref, ram]:
+                d.set_addr(addr)
+                d.set_input(DI)
+                d.W.value = W
+                d.E.value = 1 - W
+                d.step()
+            self.assertEqual(ram.get_output(), ref.get_output())
+
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTests([
+        TestLookup('test_full_adder'),
+        TestLookup('test_adder8bit'),
+        TestLookup('test_decoder'),
+    ])
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
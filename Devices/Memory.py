@@ -1,12 +1,18 @@
 import unittest
+import os
+import mmap
+import tempfile
 import random as rd
 from BitValue import *
 from SimulatedCircuit import SimulatedCircuit
-from Gate import TriStateBuffer
+from Port import Port
+from Gate import TriStateBuffer, set_fidelity, RELAY, BEHAVIORAL
 from Branch import Branch
 from FlipFlop import LevelTriggeredDtypeFlipFlop
 from Decoder import Decoder4to16, Selector16to1
-from Util import i2b_ri, pav2i
+from Bus import Bus
+from Util import walk, getter, paused_gc
+from Template import template
 
 
 class Memory1bit(SimulatedCircuit):
@@ -24,6 +30,44 @@ class Memory1bit(SimulatedCircuit):
         super().__init__(self.device_name, self.name)
 
 
+# gate fidelity -> state of a Memory1bit that depends on the stored bit, see _bit_state()
+_bit_states = {}
+
+def _bit_state(fidelity):
+    '''
+    State attributes of a settled Memory1bit that differ between holding 0 and 1
+    Taken from a powered reference cell built at the given gate fidelity.
+    return: (attrs, [(value holding 0, value holding 1)], functions from the RSFlipFlop
+        of a Memory1bit to the objects holding attrs, see Util.getter())
+    '''
+    if fidelity not in _bit_states:
+        from Checkpoint import state_attributes
+
+        previous = set_fidelity(fidelity)
+        try:
+            ref = Memory1bit('ref')
+        finally:
+            set_fidelity(previous)
+        ref.power_on()
+        states = []
+        for bit in (OPEN, HIGH):
+            ref.DI.value = bit
+            ref.W.value = HIGH
+            ref.step()
+            ref.step()
+            ref.W.value = OPEN
+            ref.step()
+            ref.step()
+            states.append([(path, attr, getattr(obj, attr)) for path, obj in walk(ref.latch.rsff) for attr in state_attributes(obj)])
+        diff = [(path, attr, v0, v1) for (path, attr, v0), (_, _, v1) in zip(*states) if v0 != v1]
+        _bit_states[fidelity] = (
+            [attr for path, attr, v0, v1 in diff],
+            [(v0, v1) for path, attr, v0, v1 in diff],
+            [getter(path) for path, attr, v0, v1 in diff],
+        )
+    return _bit_states[fidelity]
+
+
 class RAM16x8(SimulatedCircuit):
     # 16x8: "16 separate memories that can be selected by addr" x "width of data in/out"
     # Address: 4 bits
@@ -43,11 +87,11 @@ class RAM16x8(SimulatedCircuit):
         self.sele = Selector16to1('selector for E')
 
         self.brnw = [Branch(f'brnw{j:02d}') for j in range(self.nloc)]
-        self.brndi = [Branch(f'brndi{i}') for i in range(self.nbus)]
+        self.brndi = Bus(Branch(f'brndi{i}') for i in range(self.nbus))
         self.cell = [[Memory1bit(f'cell{j:02d}x{i}') for i in range(self.nbus)] for j in range(self.nloc)]
         self.tri = [[TriStateBuffer(f'tri{j:02d}x{i}') for i in range(self.nbus)] for j in range(self.nloc)]
         self.brne = [Branch(f'brne{j:02d}') for j in range(self.nloc)]
-        self.brndo = [Branch(f'brndo{i}') for i in range(self.nbus)]
+        self.brndo = Bus(Branch(f'brndo{i}') for i in range(self.nbus))
 
         # connect
         for j in range(self.nloc):
@@ -68,6 +112,9 @@ class RAM16x8(SimulatedCircuit):
         self.DI = self.brndi
         self.DO = self.brndo
 
+        # objects holding the bit state of each address, resolved by load() as it needs them
+        self._bit_objects = None
+
         # update sequence
         self.update_sequence = [self.dec]
         self.update_sequence.extend([self.brndc[j] for j in range(self.nloc)])
@@ -89,29 +136,66 @@ class RAM16x8(SimulatedCircuit):
     def print_cell(self):
         out = ''
         for j in range(self.nloc):
-            strDO = ''
-            for i in range(self.nbus):
-                strDO = f'{self.cell[j][i].DO.value}{strDO}'
-            DO = int(strDO, 2)
+            DO = self.get_cell(j)
             out = f'{DO:02x}'.upper() + ('   ' if j == 8 else ' ') + out
         return out
     
     def set_addr(self, addr):
         if addr < 0 or addr > self.nloc - 1:
             raise(RuntimeError)
-        bin = i2b_ri(addr, 4)
-        for i in range(self.naddr):
-            self.A[i].value = bin[i]
+        self.A.value = addr
     
     def set_input(self, DI: int):
         if DI < 0 or DI > 2**self.nbus - 1:
             raise(RuntimeError)
-        strDI = i2b_ri(DI, 8)
-        for i in range(self.nbus):
-            self.DI[i].value = strDI[i]
+        self.DI.value = DI
     
     def get_output(self):
-        return pav2i(self.DO, self.nbus)
+        return self.DO.value
+
+    def get_cell(self, addr):
+        return self.cell_ports(addr).value
+
+    def cell_ports(self, addr):
+        '''
+        Ports holding the stored bits of addr, bit 0 first
+        '''
+        return Bus(self.cell[addr][i].DO for i in range(self.nbus))
+
+    @paused_gc()
+    def load(self, data, base=0):
+        '''
+        Store data at addresses base, base + 1, ... by setting the latches of
+        the cells to the state a write leaves them in, without stepping
+        The RAM must be powered and not writing; DO follows on the next step.
+        '''
+        if base < 0 or base + len(data) > self.nloc:
+            raise(RuntimeError)
+        nor = self.cell[0][0].latch.rsff.nor1
+        if (nor.supply if nor.fidelity == BEHAVIORAL else nor.pwr.O.value) != HIGH:
+            raise(RuntimeError(f'{self.name} is not powered'))
+        if self.W.value == HIGH:
+            raise(RuntimeError(f'{self.name} is writing'))
+        attrs, values, getters = _bit_state(nor.fidelity)
+        if self._bit_objects is None:
+            self._bit_objects = [None] * self.nloc
+        for addr, byte in enumerate(data, base):
+            if self._bit_objects[addr] is None:
+                # objects holding attrs, per bit
+                self._bit_objects[addr] = [[get(self.cell[addr][i].latch.rsff) for get in getters] for i in range(self.nbus)]
+            for i, objects in enumerate(self._bit_objects[addr]):
+                bit = (byte >> i) & 1
+                for obj, attr, value in zip(objects, attrs, values):
+                    setattr(obj, attr, value[bit])
+
+    def dump(self, start=0, length=None):
+        '''
+        Stored bytes of addresses start, start + 1, ..., default up to the last one
+        '''
+        length = self.nloc - start if length is None else length
+        if start < 0 or length < 0 or start + length > self.nloc:
+            raise(RuntimeError)
+        return bytes(self.get_cell(addr) for addr in range(start, start + length))
 
 
 class RAMnx8(SimulatedCircuit):
@@ -119,6 +203,7 @@ class RAMnx8(SimulatedCircuit):
     # Address: 4 bits
     # W: 1 bit
     # DI, DO: 8 bits (1 byte)
+    @paused_gc()
     def __init__(self, name, base_ram, base_ram_naddr):
         self.device_name = 'RAMnx8'
         self.name = name
@@ -137,9 +222,11 @@ class RAMnx8(SimulatedCircuit):
         self.selw = Selector16to1('selector for W')
         self.sele = Selector16to1('selector for E')
 
-        self.brndi = [Branch(f'brndi{i}') for i in range(self.nbus)]
-        self.cell = [self.base_ram(f'base_ram_{j:02d}') for j in range(self.dec.nloc)]
-        self.brndo = [Branch(f'brndo{i}') for i in range(self.nbus)]
+        self.brndi = Bus(Branch(f'brndi{i}') for i in range(self.nbus))
+        # RAM16x8s are stamped out of one cached prototype, see Template
+        new_base_ram = template(RAM16x8).clone if self.base_ram is RAM16x8 else self.base_ram
+        self.cell = [new_base_ram(f'base_ram_{j:02d}') for j in range(self.dec.nloc)]
+        self.brndo = Bus(Branch(f'brndo{i}') for i in range(self.nbus))
 
         # connect
         for i in range(self.naddr1):
@@ -154,7 +241,7 @@ class RAMnx8(SimulatedCircuit):
                 self.cell[j].DO[i] >> self.brndo[i]
 
         # create access points
-        self.A = [self.brna[i] for i in range(self.naddr1)] + [self.dec.A[i] for i in range(self.naddr2)]
+        self.A = Bus([self.brna[i] for i in range(self.naddr1)] + [self.dec.A[i] for i in range(self.naddr2)])
         self.W = self.selw.Signal
         self.E = self.sele.Signal
         self.DI = self.brndi
@@ -181,19 +268,52 @@ class RAMnx8(SimulatedCircuit):
     def set_addr(self, addr):
         if addr < 0 or addr > self.nloc - 1:
             raise(RuntimeError)
-        bin = i2b_ri(addr, self.naddr)
-        for i in range(self.naddr):
-            self.A[i].value = bin[i]
+        self.A.value = addr
     
     def set_input(self, DI: int):
         if DI < 0 or DI > 2**self.nbus - 1:
             raise(RuntimeError)
-        strDI = i2b_ri(DI, self.nbus)
-        for i in range(self.nbus):
-            self.DI[i].value = strDI[i]
+        self.DI.value = DI
     
     def get_output(self):
-        return pav2i(self.DO, self.nbus)
+        return self.DO.value
+
+    def get_cell(self, addr):
+        return self.cell[addr >> self.naddr1].get_cell(addr & (2**self.naddr1 - 1))
+
+    def _chunks(self, start, length):
+        # (base_ram, local address, offset, length) of each base_ram a range of addresses covers
+        if start < 0 or length < 0 or start + length > self.nloc:
+            raise(RuntimeError)
+        size = 2**self.naddr1
+        out = []
+        pos = 0
+        while pos < length:
+            addr = start + pos
+            n = min(size - (addr & (size - 1)), length - pos)
+            out.append((self.cell[addr >> self.naddr1], addr & (size - 1), pos, n))
+            pos += n
+        return out
+
+    @paused_gc()
+    def load(self, data, base=0):
+        '''
+        Store data at addresses base, base + 1, ..., see RAM16x8.load()
+        '''
+        if self.W.value == HIGH:
+            raise(RuntimeError(f'{self.name} is writing'))
+        for ram, local, pos, n in self._chunks(base, len(data)):
+            ram.load(data[pos:pos + n], local)
+
+    def dump(self, start=0, length=None):
+        '''
+        Stored bytes of addresses start, start + 1, ..., default up to the last one
+        '''
+        length = self.nloc - start if length is None else length
+        return b''.join(ram.dump(local, n) for ram, local, pos, n in self._chunks(start, length))
+
+    def cell_ports(self, addr):
+        return self.cell[addr >> self.naddr1].cell_ports(addr & (2**self.naddr1 - 1))
 
 
 class RAM256x8(RAMnx8):
@@ -205,6 +325,187 @@ class RAM4096x8(RAMnx8):
         super().__init__(name, 'RAM256x8', 8)
 
 
+def map_file(filename, size):
+    '''
+    Shared writable mmap of the first size bytes of filename
+    The file is created, or zero-extended, if it is shorter.
+    '''
+    fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        return mmap.mmap(fd, size)
+    finally:
+        os.close(fd) # the mmap keeps its own handle
+
+
+class RAMCore(SimulatedCircuit):
+    '''
+    Storage of BehavioralRAMnx8, stepped like a primitive
+    Writes DI to data[A] while W is HIGH, drives DO with data[A] while E is HIGH.
+    Neither happens unless powered.
+
+    data: bytearray of nloc bytes, or an mmap of filename if one is given
+    '''
+    __slots__ = ('naddr', 'nloc', 'nbus', 'supply', 'data', 'A', 'W', 'E', 'DI', 'DO', '_inports')
+
+    def __init__(self, name, naddr, filename=None):
+        self.naddr = naddr
+        self.nloc = 2**self.naddr
+        self.nbus = 8
+
+        self.supply = OPEN
+        self.data = bytearray(self.nloc) if filename is None else map_file(filename, self.nloc)
+
+        # create ports
+        self.A = Bus(Port(f'A{a}', self) for a in range(self.naddr))
+        self.W = Port('W', self)
+        self.E = Port('E', self)
+        self.DI = Bus(Port(f'DI{i}', self) for i in range(self.nbus))
+        self.DO = Bus(Port(f'DO{i}', self) for i in range(self.nbus))
+
+        self._inports = self.A + [self.W, self.E] + self.DI
+
+        super().__init__('RAMCore', name)
+
+    @property
+    def addr(self):
+        return self.A.value
+
+    def on(self):
+        self.supply = HIGH
+
+    def off(self):
+        self.supply = OPEN
+
+    def flush(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.flush()
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def update_inport(self):
+        for p in self._inports:
+            p.update_value()
+
+    def update_state(self):
+        if self.supply == HIGH and self.W.value == HIGH:
+            self.data[self.A.value] = self.DI.value
+
+    def calc_output(self):
+        if self.supply == HIGH and self.E.value == HIGH:
+            self.DO.value = self.data[self.A.value]
+        else:
+            self.DO.value = 0
+
+
+class BehavioralRAMnx8(SimulatedCircuit):
+    # Same access points and step timing as RAM16x8/RAMnx8, contents in a bytearray
+    # or, given a filename, in a memory-mapped file that keeps them across runs
+    # Address: naddr bits
+    # W, E: 1 bit
+    # DI, DO: 8 bits (1 byte)
+    def __init__(self, name, naddr, filename=None):
+        self.name = name
+        self.naddr = naddr
+        self.nloc = 2**self.naddr
+        self.nbus = 8
+        self.device_name = f'Behavioral RAM{self.nloc}x8'
+
+        # create elements
+        self.brna = Bus(Branch(f'brna{a}') for a in range(self.naddr))
+        self.brnw = Branch('brnw')
+        self.brne = Branch('brne')
+        self.brndi = Bus(Branch(f'brndi{i}') for i in range(self.nbus))
+        self.core = RAMCore('core', self.naddr, filename)
+        self.brndo = Bus(Branch(f'brndo{i}') for i in range(self.nbus))
+
+        # connect
+        for a in range(self.naddr):
+            self.brna[a] >> self.core.A[a]
+        self.brnw >> self.core.W
+        self.brne >> self.core.E
+        for i in range(self.nbus):
+            self.brndi[i] >> self.core.DI[i]
+            self.core.DO[i] >> self.brndo[i]
+
+        # create access points
+        self.A = self.brna
+        self.W = self.brnw
+        self.E = self.brne
+        self.DI = self.brndi
+        self.DO = self.brndo
+
+        # update sequence
+        self.update_sequence = [self.brna[a] for a in range(self.naddr)]
+        self.update_sequence.extend([self.brnw, self.brne])
+        self.update_sequence.extend([self.brndi[i] for i in range(self.nbus)])
+        self.update_sequence.append(self.core)
+        self.update_sequence.extend([self.brndo[i] for i in range(self.nbus)])
+
+        super().__init__(self.device_name, name)
+
+    def set_addr(self, addr):
+        if addr < 0 or addr > self.nloc - 1:
+            raise(RuntimeError)
+        self.A.value = addr
+
+    def set_input(self, DI: int):
+        if DI < 0 or DI > 2**self.nbus - 1:
+            raise(RuntimeError)
+        self.DI.value = DI
+
+    def get_output(self):
+        return self.DO.value
+
+    def get_cell(self, addr):
+        return self.core.data[addr]
+
+    def load(self, data, base=0):
+        '''
+        Store data at addresses base, base + 1, ... in one slice assignment
+        '''
+        if base < 0 or base + len(data) > self.nloc:
+            raise(RuntimeError)
+        self.core.data[base:base + len(data)] = data
+
+    def dump(self, start=0, length=None):
+        '''
+        Stored bytes of addresses start, start + 1, ..., default up to the last one
+        '''
+        length = self.nloc - start if length is None else length
+        if start < 0 or length < 0 or start + length > self.nloc:
+            raise(RuntimeError)
+        return bytes(self.core.data[start:start + length])
+
+    def flush(self):
+        '''
+        Write the contents of a memory-mapped RAM through to its file
+        '''
+        self.core.flush()
+
+    def close(self):
+        '''
+        Unmap the file of a memory-mapped RAM, the device is unusable afterwards
+        '''
+        self.core.close()
+
+
+class BehavioralRAM16x8(BehavioralRAMnx8):
+    def __init__(self, name, filename=None):
+        super().__init__(name, 4, filename)
+
+class BehavioralRAM256x8(BehavioralRAMnx8):
+    def __init__(self, name, filename=None):
+        super().__init__(name, 8, filename)
+
+class BehavioralRAM4096x8(BehavioralRAMnx8):
+    def __init__(self, name, filename=None):
+        super().__init__(name, 12, filename)
+
+
 class TestMemory(unittest.TestCase):
     def test_memory1(self):
         print('test_memory1')
@@ -286,6 +587,174 @@ class TestMemory(unittest.TestCase):
         dev.step()
         self._test_ram(dev, 4096, 1)
 
+    def test_behavioral_ram(self):
+        print('test_behavioral_ram')
+
+        for dev, nloc, ntrial in [(BehavioralRAM16x8('bram16x8'), 16, 0), (BehavioralRAM256x8('bram256x8'), 256, 0), (BehavioralRAM4096x8('bram4096x8'), 4096, 64)]:
+            dev.power_on()
+            dev.step()
+            self._test_ram(dev, nloc, ntrial)
+
+    def test_behavioral_matches_relay(self):
+        print('test_behavioral_matches_relay')
+
+        ref = RAM16x8('ref')
+        dut = BehavioralRAM16x8('dut')
+        rd.seed(9)
+        for dev in [ref, dut]:
+            dev.power_on()
+            dev.step()
+        for k in range(200):
+            addr = rd.randint(0, 15)
+            DI = rd.randint(0, 255)
+            W = rd.randint(0, 1)
+            E = rd.randint(0, 1)
+            for dev in [ref, dut]:
+                dev.set_addr(addr)
+                dev.set_input(DI)
+                dev.W.value = W
+                dev.E.value = E
+                dev.step()
+            self.assertEqual(dut.get_output(), ref.get_output())
+        for addr in range(16):
+            self.assertEqual(dut.get_cell(addr), ref.get_cell(addr))
+
+        # unpowered: nothing is written or driven
+        dut.power_off()
+        dut.set_addr(3)
+        dut.set_input(0x5A)
+        dut.W.set()
+        dut.E.set()
+        dut.step()
+        self.assertEqual(dut.get_output(), 0)
+        self.assertEqual(dut.get_cell(3), ref.get_cell(3))
+
+    def test_mapped_ram(self):
+        print('test_mapped_ram')
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'ram.bin')
+
+            # an existing image appears without writing it through the ports
+            with open(filename, 'wb') as f:
+                f.write(bytes(range(100)))
+            dev = BehavioralRAM256x8('mram', filename)
+            self.assertEqual(os.path.getsize(filename), 256)
+            self.assertEqual(dev.get_cell(99), 99)
+            self.assertEqual(dev.get_cell(100), 0)
+            dev.power_on()
+            dev.set_addr(42)
+            dev.E.set()
+            dev.step()
+            self.assertEqual(dev.get_output(), 42)
+
+            # same port behavior as the bytearray version
+            dev.E.reset()
+            dev.step()
+            self._test_ram(dev, 256, 32)
+
+            # writes persist
+            dev.set_addr(200)
+            dev.set_input(0xC3)
+            dev.W.set()
+            dev.step()
+            dev.W.reset()
+            dev.step()
+            dev.close()
+            with open(filename, 'rb') as f:
+                self.assertEqual(f.read()[200], 0xC3)
+            dev = BehavioralRAM256x8('mram', filename)
+            self.assertEqual(dev.get_cell(200), 0xC3)
+            dev.close()
+
+    def test_load_dump(self):
+        print('test_load_dump')
+
+        rd.seed(24)
+        data = bytes(rd.randint(0, 255) for k in range(16))
+
+        # same state as writing through the ports
+        ref = RAM16x8('ref')
+        dut = RAM16x8('dut')
+        for dev in [ref, dut]:
+            dev.power_on()
+            dev.step()
+        for addr, DI in enumerate(data):
+            ref.set_addr(addr)
+            ref.set_input(DI)
+            ref.W.set()
+            ref.step()
+            ref.W.reset()
+            ref.step()
+        dut.load(data)
+        self.assertEqual(dut.dump(), data)
+        for dev in [ref, dut]:
+            dev.set_addr(5)
+            dev.set_input(0)
+            dev.step()
+        self.assertEqual(dut.snapshot(), ref.snapshot())
+        dut.E.set()
+        dut.step()
+        self.assertEqual(dut.get_output(), data[5])
+
+        # across the base RAMs of a RAMnx8, and the behavioral version
+        image = bytes(rd.randint(0, 255) for k in range(40))
+        for dev in [RAM256x8('ram'), BehavioralRAM256x8('bram')]:
+            dev.power_on()
+            dev.step()
+            dev.load(image, 10)
+            self.assertEqual(dev.dump(10, 40), image)
+            self.assertEqual(dev.dump()[:10], bytes(10))
+            self.assertEqual(dev.get_cell(33), image[23])
+            dev.set_addr(33)
+            dev.E.set()
+            dev.step()
+            self.assertEqual(dev.get_output(), image[23])
+            with self.assertRaises(RuntimeError):
+                dev.load(image, 250)
+            with self.assertRaises(RuntimeError):
+                dev.dump(200, 100)
+
+        # only into a powered RAM that is not writing
+        for fidelity in [RELAY, BEHAVIORAL]:
+            previous = set_fidelity(fidelity)
+            try:
+                dev = RAM16x8('ram')
+            finally:
+                set_fidelity(previous)
+            with self.assertRaises(RuntimeError):
+                dev.load(data)
+            dev.power_on()
+            dev.step()
+            dev.W.set()
+            with self.assertRaises(RuntimeError):
+                dev.load(data)
+            dev.W.reset()
+            dev.load(data)
+            self.assertEqual(dev.dump(), data)
+        ram = RAM256x8('ram')
+        ram.power_on()
+        ram.W.set()
+        with self.assertRaises(RuntimeError):
+            ram.load(data)
+
+    def test_load_resolves_range(self):
+        print('test_load_resolves_range')
+
+        # only the cells of the loaded addresses are looked up
+        dev = RAM4096x8('ram4096x8')
+        dev.power_on()
+        dev.step()
+        dev.load(bytes(range(1, 21)), 250) # 250 ~ 269, across two RAM16x8 and two RAM256x8
+        resolved = []
+        for j, ram256 in enumerate(dev.cell):
+            for k, ram16 in enumerate(ram256.cell):
+                if ram16._bit_objects is not None:
+                    base = (j << 8) | (k << 4)
+                    resolved.extend(base + a for a in range(ram16.nloc) if ram16._bit_objects[a] is not None)
+        self.assertEqual(resolved, list(range(250, 270)))
+        self.assertEqual(dev.dump(248, 24), bytes(2) + bytes(range(1, 21)) + bytes(2))
+
 
 
 
@@ -296,6 +765,11 @@ if __name__ == '__main__':
         TestMemory('test_ram16x8'),
         TestMemory('test_ram256x8'),
         TestMemory('test_ram4096x8'),
+        TestMemory('test_behavioral_ram'),
+        TestMemory('test_behavioral_matches_relay'),
+        TestMemory('test_mapped_ram'),
+        TestMemory('test_load_dump'),
+        TestMemory('test_load_resolves_range'),
     ])
     runner = unittest.TextTestRunner()
     runner.run(suite)
@@ -0,0 +1,426 @@
+import unittest
+import os
+import glob
+import hashlib
+import marshal
+import pickle
+import tempfile
+import importlib.util
+from functools import lru_cache
+import random as rd
+from array import array
+from BitValue import *
+from SimulatedCircuit import SimulatedCircuit
+from Port import Port
+from Compiler import Netlist, generate_source, COPY, CONST, CHARGE, SELECT, RESOLVE
+from Util import attributes, object_paths
+
+
+FORMAT = 1 # bump when the file layout or the op encoding changes
+DEVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+# cache files are unpickled and their code executed: only point this, or the
+# directory argument of cached_netlist()/CachedCircuit, at a trusted directory
+CACHE_DIR = os.path.join(DEVICE_DIR, '__netlist_cache__')
+
+
+def source_hash(directory=None):
+    '''
+    Digest of every device module, the cache format and the Python bytecode version
+    Any edit to a module in this directory invalidates every cached netlist.
+    Computed once per directory and process, edits made while running are not seen.
+    '''
+    return _source_hash(os.path.abspath(directory or DEVICE_DIR))
+
+@lru_cache(maxsize=None)
+def _source_hash(directory):
+    h = hashlib.sha256(f'{FORMAT}'.encode())
+    h.update(importlib.util.MAGIC_NUMBER)
+    for filename in sorted(glob.glob(os.path.join(directory, '*.py'))):
+        h.update(os.path.basename(filename).encode())
+        with open(filename, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+class StoredNetlist:
+    '''
+    Netlist of a device detached from its objects
+
+    Slots are named by the hierarchical path of their object and attribute
+    (see Util.object_paths), e.g. 'dec.brnd[2]._value'. The top level access
+    points of the device (A[0], W, DO[3], ...) are kept as aliases of those
+    paths. power_on() and power_off() are recorded as the slots they set.
+    Usable wherever a Netlist only provides ops and nslot, e.g. generate_source().
+
+    device_name, name: of the source device
+    nslot: number of slots
+    ops: list of ops in execution order, as in Netlist
+    names: path of each slot
+    aliases: {access point: canonical path}
+    '''
+    def __init__(self, device_name, name, ops, state, names, aliases, on, off):
+        self.device_name = device_name
+        self.name = name
+        self.ops = ops
+        self.state = state
+        self.names = names
+        self.aliases = aliases
+        self.on = on
+        self.off = off
+        self._index = None
+
+    def __repr__(self):
+        return f'StoredNetlist({self.name}, {self.nslot} slots, {len(self.ops)} ops)'
+
+    @property
+    def nslot(self):
+        return len(self.names)
+
+    @classmethod
+    def from_device(cls, device: SimulatedCircuit):
+        '''
+        Lower a freshly built device. Its state is changed by power_on() and power_off().
+        '''
+        netlist = Netlist(device)
+        paths = object_paths(device)
+        names = []
+        for obj, attr in netlist.slots:
+            path = paths[id(obj)]
+            names.append(f'{path}.{attr}' if path else attr)
+
+        aliases = {}
+        for attr, value in attributes(device):
+            items = [(attr, value)]
+            if isinstance(value, list):
+                items = [(f'{attr}[{i}]', v) for i, v in enumerate(value)]
+            for alias, obj in items:
+                if isinstance(obj, (Port, SimulatedCircuit)) and paths.get(id(obj), alias) != alias:
+                    aliases[alias] = paths[id(obj)]
+
+        state = netlist.load()
+        device.power_on()
+        on = netlist.load()
+        device.power_off()
+        off = netlist.load()
+        changed = [i for i in range(netlist.nslot) if on[i] != state[i] or off[i] != state[i]]
+        return cls(device.device_name, device.name, list(netlist.ops), state, names, aliases,
+                   [(i, on[i]) for i in changed], [(i, off[i]) for i in changed])
+
+    def find(self, path):
+        '''
+        Slot of a path, either 'obj.attr' or the path of a Port, Branch, Relay or Switch
+        '''
+        if self._index is None:
+            self._index = {name: i for i, name in enumerate(self.names)}
+        if path in self._index:
+            return self._index[path]
+        path = self.aliases.get(path, path)
+        for attr in ('value', '_value', 'X', 'state'):
+            name = f'{path}.{attr}' if path else attr
+            if name in self._index:
+                return self._index[name]
+        raise(KeyError(path))
+
+    def load(self):
+        '''
+        New slot list in the state the constructor left the device in
+        '''
+        return list(self.state)
+
+    def _encode(self):
+        ops = array('i')
+        for op in self.ops:
+            code = op[0]
+            if code == SELECT:
+                ops.extend((code, op[1], op[2], -1 if op[3] is None else op[3], -1 if op[4] is None else op[4]))
+            elif code == RESOLVE:
+                ops.extend((code, op[1], len(op[2])))
+                ops.extend(op[2])
+            else: # COPY, CONST, CHARGE
+                ops.extend(op)
+        return {
+            'device_name': self.device_name,
+            'name': self.name,
+            'ops': ops,
+            'state': array('b', self.state),
+            'names': '\n'.join(self.names),
+            'aliases': self.aliases,
+            'on': array('i', [v for pair in self.on for v in pair]),
+            'off': array('i', [v for pair in self.off for v in pair]),
+        }
+
+    @classmethod
+    def _decode(cls, d):
+        words = d['ops'].tolist()
+        ops = []
+        k = 0
+        n = len(words)
+        while k < n:
+            code = words[k]
+            if code == SELECT:
+                a = words[k + 3]
+                b = words[k + 4]
+                ops.append((code, words[k + 1], words[k + 2], None if a < 0 else a, None if b < 0 else b))
+                k += 5
+            elif code == RESOLVE:
+                m = words[k + 2]
+                ops.append((code, words[k + 1], tuple(words[k + 3:k + 3 + m])))
+                k += 3 + m
+            else: # COPY, CONST, CHARGE
+                ops.append((code, words[k + 1], words[k + 2]))
+                k += 3
+        on = d['on'].tolist()
+        off = d['off'].tolist()
+        return cls(d['device_name'], d['name'], ops, d['state'].tolist(), d['names'].split('\n') if d['names'] else [],
+                   d['aliases'], list(zip(on[0::2], on[1::2])), list(zip(off[0::2], off[1::2])))
+
+    def save(self, filename, key):
+        '''
+        Write to filename atomically, tagged with key and the current source hash
+        '''
+        d = self._encode()
+        d['format'] = FORMAT
+        d['key'] = key
+        d['hash'] = source_hash()
+        tmp = f'{filename}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(d, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, filename)
+
+    @classmethod
+    def read(cls, filename, key):
+        '''
+        Netlist stored in filename, or None if it is missing, stale or unreadable
+        The file is unpickled, which can run arbitrary code: filename must be trusted.
+        '''
+        try:
+            with open(filename, 'rb') as f:
+                d = pickle.load(f)
+            if d.get('format') != FORMAT or d.get('key') != key or d.get('hash') != source_hash():
+                return None
+            return cls._decode(d)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, KeyError, TypeError, ValueError):
+            return None
+
+
+def _cache_file(cls, args, directory, suffix):
+    import Gate
+    key = repr((cls.__module__, cls.__qualname__, args, Gate.fidelity))
+    digest = hashlib.sha256(key.encode()).hexdigest()[:16]
+    return os.path.join(directory or CACHE_DIR, f'{cls.__qualname__}-{digest}.{suffix}'), key
+
+
+def cached_netlist(cls, *args, directory=None):
+    '''
+    StoredNetlist of cls('name', *args) at the current default gate fidelity
+    Loaded from the cache directory if present and built from the current
+    sources, otherwise the device is constructed, lowered and saved.
+    '''
+    filename, key = _cache_file(cls, args, directory, 'netlist')
+    netlist = StoredNetlist.read(filename, key)
+    if netlist is None:
+        netlist = StoredNetlist.from_device(cls(cls.__name__.lower(), *args))
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        netlist.save(filename, key)
+    return netlist
+
+
+class CachedCircuit:
+    '''
+    Compiled step function of a device class, without any device objects
+
+    Netlist and compiled code both come from the cache directory, so a warm
+    start neither runs the constructors nor the Python compiler. Signals are
+    addressed by path, see StoredNetlist.find().
+    The cached code is executed as found, so the cache directory must be trusted.
+
+    state: slot list
+    '''
+    def __init__(self, cls, *args, directory=None):
+        self.netlist = cached_netlist(cls, *args, directory=directory)
+        self.name = self.netlist.name
+
+        filename, key = _cache_file(cls, args, directory, 'step')
+        code = None
+        try:
+            with open(filename, 'rb') as f:
+                tag, code = marshal.load(f)
+            if tag != (key, source_hash()):
+                code = None
+        except (OSError, EOFError, ValueError, TypeError):
+            code = None
+        if code is None:
+            code = compile(generate_source(self.netlist), f'<compiled {self.name}>', 'exec')
+            tmp = f'{filename}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                marshal.dump(((key, source_hash()), code), f)
+            os.replace(tmp, filename)
+
+        namespace = {}
+        exec(code, namespace)
+        self._step = namespace['step']
+
+        self.state = self.netlist.load()
+
+    def __repr__(self):
+        return f'CachedCircuit({self.name}, {self.netlist.nslot} slots, {len(self.netlist.ops)} ops)'
+
+    def get(self, path):
+        return self.state[self.netlist.find(path)]
+
+    def set(self, path, value):
+        self.state[self.netlist.find(path)] = value
+
+    def power_on(self):
+        for i, value in self.netlist.on:
+            self.state[i] = value
+
+    def power_off(self):
+        for i, value in self.netlist.off:
+            self.state[i] = value
+
+    def step(self, n=1):
+        for i in range(n):
+            self._step(self.state)
+
+
+
+
+class TestNetlistCache(unittest.TestCase):
+    def test_hit_and_miss(self):
+        print('test_hit_and_miss')
+
+        from FlipFlop import RSFlipFlop
+        from Memory import RAM16x8
+
+        with tempfile.TemporaryDirectory() as directory:
+            first = cached_netlist(RAM16x8, directory=directory)
+            self.assertEqual(len(os.listdir(directory)), 1)
+            mtime = os.path.getmtime(os.path.join(directory, os.listdir(directory)[0]))
+
+            second = cached_netlist(RAM16x8, directory=directory)
+            self.assertEqual(os.path.getmtime(os.path.join(directory, os.listdir(directory)[0])), mtime)
+            self.assertIsNot(second, first)
+            self.assertEqual(second.ops, first.ops)
+            self.assertEqual(second.names, first.names)
+            self.assertEqual(second.load(), first.load())
+            self.assertEqual(second.find('A[3]'), first.find('dec.brnd[3]._value'))
+
+            # another class gets its own file
+            cached_netlist(RSFlipFlop, directory=directory)
+            self.assertEqual(len(os.listdir(directory)), 2)
+
+    def test_invalidation(self):
+        print('test_invalidation')
+
+        from Gate import Xor
+
+        with tempfile.TemporaryDirectory() as directory:
+            netlist = cached_netlist(Xor, directory=directory)
+            filename = os.path.join(directory, os.listdir(directory)[0])
+            key = _cache_file(Xor, (), directory, 'netlist')[1]
+            self.assertIsNotNone(StoredNetlist.read(filename, key))
+
+            # a file written from other sources is stale
+            with open(filename, 'rb') as f:
+                d = pickle.load(f)
+            d['hash'] = source_hash() + 'edited'
+            with open(filename, 'wb') as f:
+                pickle.dump(d, f)
+            self.assertIsNone(StoredNetlist.read(filename, key))
+
+            # rebuilt and rewritten on the next use
+            self.assertEqual(cached_netlist(Xor, directory=directory).ops, netlist.ops)
+            self.assertIsNotNone(StoredNetlist.read(filename, key))
+
+            # a damaged file is rebuilt as well
+            with open(filename, 'wb') as f:
+                f.write(b'garbage')
+            self.assertEqual(cached_netlist(Xor, directory=directory).ops, netlist.ops)
+
+        # the sources are read once per directory, not on every store and read
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'dev.py'), 'w') as f:
+                f.write('x = 1\n')
+            digest = source_hash(directory)
+            with open(os.path.join(directory, 'dev.py'), 'w') as f:
+                f.write('x = 2\n')
+            self.assertEqual(source_hash(directory), digest)
+            self.assertEqual(source_hash(), source_hash(DEVICE_DIR))
+
+    def test_adder8bit(self):
+        print('test_adder8bit')
+
+        from Arithmetic import Adder8bit
+
+        ref = Adder8bit('ref')
+        ref.power_on()
+        with tempfile.TemporaryDirectory() as directory:
+            for k in range(2): # cold, then warm
+                dut = CachedCircuit(Adder8bit, directory=directory)
+                dut.power_on()
+                rd.seed(12)
+                for n in range(20):
+                    a = rd.randint(0, 255)
+                    b = rd.randint(0, 255)
+                    for i in range(8):
+                        ref.A[i].value = (a >> i) & 1
+                        ref.B[i].value = (b >> i) & 1
+                        dut.set(f'A[{i}]', (a >> i) & 1)
+                        dut.set(f'B[{i}]', (b >> i) & 1)
+                    ref.step()
+                    dut.step()
+                    self.assertEqual([dut.get(f'S[{i}]') for i in range(8)], [p.value for p in ref.S])
+                    self.assertEqual(dut.get('CO'), ref.CO.value)
+
+    def test_ram16x8(self):
+        print('test_ram16x8')
+
+        from Memory import RAM16x8
+
+        ref = RAM16x8('ref')
+        ref.power_on()
+        ref.step()
+        with tempfile.TemporaryDirectory() as directory:
+            CachedCircuit(RAM16x8, directory=directory)
+            dut = CachedCircuit(RAM16x8, directory=directory)
+            dut.power_on()
+            dut.step()
+
+            rd.seed(13)
+            for k in range(60):
+                addr = rd.randint(0, 15)
+                DI = rd.randint(0, 255)
+                W = rd.randint(0, 1)
+                E = rd.randint(0, 1)
+                ref.set_addr(addr)
+                ref.set_input(DI)
+                ref.W.value = W
+                ref.E.value = E
+                ref.step()
+                for i in range(4):
+                    dut.set(f'A[{i}]', (addr >> i) & 1)
+                for i in range(8):
+                    dut.set(f'DI[{i}]', (DI >> i) & 1)
+                dut.set('W', W)
+                dut.set('E', E)
+                dut.step()
+                self.assertEqual([dut.get(f'DO[{i}]') for i in range(8)], [p.value for p in ref.DO])
+
+            dut.power_off()
+            dut.step()
+            ref.power_off()
+            ref.step()
+            self.assertEqual([dut.get(f'DO[{i}]') for i in range(8)], [p.value for p in ref.DO])
+
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTests([
+        TestNetlistCache('test_hit_and_miss'),
+        TestNetlistCache('test_invalidation'),
+        TestNetlistCache('test_adder8bit'),
+        TestNetlistCache('test_ram16x8'),
+    ])
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -4,6 +4,8 @@ from SimulatedCircuit import SimulatedCircuit
 
 
 class Port:
+    __slots__ = ('name', 'parent', 'value', 'connected')
+
     def __init__(self, name: str, parent: SimulatedCircuit, value=OPEN):
         self.name = name
         self.parent = parent
@@ -0,0 +1,209 @@
+import unittest
+import io
+from time import perf_counter
+from SimulatedCircuit import SimulatedCircuit
+from Util import walk
+
+
+METHODS = ('step', 'power_on', 'power_off', 'update_inport', 'update_state', 'calc_output')
+
+_active = None
+
+
+class Profiler:
+    '''
+    Call counts and wall time of step(), power_on()/power_off() and the
+    phase methods, per device instance and per class
+
+    While the profiler is active (a with block, or between start() and
+    stop()) the methods are replaced by timing wrappers on the classes that
+    define them; outside of it nothing is patched and there is no cost.
+    Every device reachable from the root is covered, including objects the
+    root does not list in its update_sequence.
+
+    stats: {(id(device), method): [calls, total seconds, self seconds]}
+    '''
+    def __init__(self, device: SimulatedCircuit):
+        self.device = device
+        self.stats = {}
+        self._paths = [(path, obj) for path, obj in walk(device) if isinstance(obj, (SimulatedCircuit, list))]
+        self._patched = []
+
+    def __repr__(self):
+        return f'Profiler({self.device.name}, {len(self.stats)} entries)'
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _wrap(self, method, name):
+        stats = self.stats
+        stack = self._stack
+
+        def wrapper(dev, *args, **kwargs):
+            stack.append(0.0) # time spent in nested wrapped calls
+            t0 = perf_counter()
+            try:
+                return method(dev, *args, **kwargs)
+            finally:
+                dt = perf_counter() - t0
+                inner = stack.pop()
+                if stack:
+                    stack[-1] += dt
+                key = (id(dev), name)
+                if key not in stats:
+                    stats[key] = [0, 0.0, 0.0]
+                rec = stats[key]
+                rec[0] += 1
+                rec[1] += dt
+                rec[2] += dt - inner
+        wrapper.__wrapped__ = method
+        return wrapper
+
+    def start(self):
+        global _active
+        if _active is not None:
+            raise(RuntimeError('another Profiler is active'))
+        _active = self
+        self._stack = []
+        owners = set()
+        for path, obj in self._devices():
+            for name in METHODS:
+                for cls in type(obj).__mro__:
+                    if name in cls.__dict__:
+                        owners.add((cls, name))
+                        break
+        for cls, name in owners:
+            method = cls.__dict__[name]
+            self._patched.append((cls, name, method))
+            setattr(cls, name, self._wrap(method, name))
+
+    def stop(self):
+        global _active
+        for cls, name, method in reversed(self._patched):
+            setattr(cls, name, method)
+        self._patched = []
+        _active = None
+
+    def _devices(self):
+        return [(path, obj) for path, obj in self._paths if not isinstance(obj, list)]
+
+    def total(self, method='step'):
+        '''
+        Seconds spent in method of the root device
+        '''
+        return self.stats.get((id(self.device), method), [0, 0.0, 0.0])[1]
+
+    def by_class(self):
+        '''
+        {(class name, method): [calls, total seconds, self seconds]}
+        '''
+        out = {}
+        for path, obj in self._devices():
+            for name in METHODS:
+                rec = self.stats.get((id(obj), name))
+                if rec is None:
+                    continue
+                acc = out.setdefault((type(obj).__name__, name), [0, 0.0, 0.0])
+                for k in range(3):
+                    acc[k] += rec[k]
+        return out
+
+    def report(self, method='step', min_percent=1.0, file=None):
+        '''
+        Print the share of each device in the root's time, in hierarchy order,
+        followed by the self time per class and method
+        Lists of devices (e.g. ram.tri) are reported as the sum of their
+        elements. Entries below min_percent are left out.
+        '''
+        root = self.total(method) or 1.0
+        lists = {path: [0, 0.0] for path, obj in self._paths if isinstance(obj, list)}
+        for path, obj in self._devices():
+            rec = self.stats.get((id(obj), method))
+            while rec is not None and path.endswith(']'):
+                path = path[:path.rindex('[')]
+                if path in lists:
+                    lists[path][0] += rec[0]
+                    lists[path][1] += rec[1]
+        lines = []
+        for path, obj in self._paths:
+            rec = lists[path] if isinstance(obj, list) else self.stats.get((id(obj), method))
+            if rec is None or rec[0] == 0 or 100 * rec[1] / root < min_percent:
+                continue
+            name = f'{self.device.name}.{path}' if path else self.device.name
+            indent = '  ' * path.count('.') + ('  ' if path else '')
+            lines.append(f'{indent}{name}: {100 * rec[1] / root:.1f}% ({rec[0]} calls)')
+        lines.append('')
+        for (cls, name), (calls, total, own) in sorted(self.by_class().items(), key=lambda item: -item[1][2]):
+            if 100 * own / root >= min_percent:
+                lines.append(f'{cls}.{name}: {100 * own / root:.1f}% self, {calls} calls')
+        print('\n'.join(lines), file=file)
+
+
+
+
+class TestProfile(unittest.TestCase):
+    def test_ram16x8(self):
+        print('test_ram16x8')
+
+        from Memory import RAM16x8
+
+        dev = RAM16x8('ram')
+        original = SimulatedCircuit.step
+        with Profiler(dev) as prof:
+            self.assertIsNot(SimulatedCircuit.step, original)
+            dev.power_on()
+            for k in range(3):
+                dev.step()
+        self.assertIs(SimulatedCircuit.step, original)
+
+        self.assertEqual(prof.stats[(id(dev), 'step')][0], 3)
+        self.assertEqual(prof.stats[(id(dev.dec), 'step')][0], 3)
+        self.assertEqual(prof.stats[(id(dev), 'power_on')][0], 1)
+
+        # children account for no more than their parent
+        children = sum(prof.stats[(id(d), 'step')][1] for d in set(dev.update_sequence))
+        self.assertLessEqual(children, prof.total())
+
+        classes = prof.by_class()
+        self.assertEqual(classes[('Relay', 'update_state')][0], sum(
+            prof.stats[(id(r), 'update_state')][0] for p, r in prof._devices() if type(r).__name__ == 'Relay'))
+
+        out = io.StringIO()
+        prof.report(min_percent=0, file=out)
+        lines = out.getvalue().split('\n')
+        self.assertTrue(lines[0].startswith('ram: 100.0%'))
+        self.assertIn('ram.dec: ', out.getvalue())
+        self.assertIn('ram.tri[3][5]: ', out.getvalue())
+        self.assertIn('ram.tri: ', out.getvalue())
+        self.assertIn('Relay.update_state: ', out.getvalue())
+
+        # stepping without the profiler is not recorded
+        dev.step()
+        self.assertEqual(prof.stats[(id(dev), 'step')][0], 3)
+
+    def test_nested(self):
+        print('test_nested')
+
+        from Gate import And
+
+        gate = And('and1')
+        with Profiler(gate):
+            with self.assertRaises(RuntimeError):
+                Profiler(gate).start()
+        with Profiler(gate) as prof:
+            gate.step()
+        self.assertEqual(prof.stats[(id(gate), 'step')][0], 1)
+
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTests([
+        TestProfile('test_ram16x8'),
+        TestProfile('test_nested'),
+    ])
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -17,6 +17,8 @@ def rlystrof(v):
         raise(RuntimeError)
 
 class Relay(SimulatedCircuit):
+    __slots__ = ('parent', 'type', 'le', 'up', 'ru', 'rd', 'X')
+
     NORMAL = 0
     REVERSED = 1
 
@@ -132,11 +134,35 @@ class TestRelay(unittest.TestCase):
         self.assertEqual(rly.X, CHARGED)
         self.assertEqual(rly.up.value, rly.rd.value)
 
+    def test_relay_slots(self):
+        print('test_relay_slots')
+
+        from Branch import Branch
+
+        # primitives have no per-instance __dict__
+        tmp = SimulatedCircuit('SimulatedCircuit', 'tmp')
+        rly = Relay('rly', tmp)
+        brn = Branch('brn')
+        for obj in [rly, rly.le, brn, Power('pwr')]:
+            self.assertFalse(hasattr(obj, '__dict__'))
+        self.assertRaises(AttributeError, setattr, rly, 'Y', CHARGED)
+
+        # connections work as before
+        pwr = Power('pwr')
+        pwr.O >> rly.up
+        rly.rd >> brn
+        pwr.power_on()
+        rly.le.set()
+        for dev in [pwr, rly, brn]:
+            dev.step()
+        self.assertEqual(brn.value, HIGH)
+
 if __name__ == '__main__':
     suite = unittest.TestSuite()
     suite.addTests([
         TestRelay('test_relay_normal'),
         TestRelay('test_relay_reversed'),
+        TestRelay('test_relay_slots'),
     ])
     runner = unittest.TextTestRunner()
     runner.run(suite)
@@ -2,6 +2,10 @@ from abc import *
 
 
 class SimulatedCircuit:
+    # primitives and gates declare __slots__ too, composites keep a __dict__
+    # per-device caches (_settle_plan, _checkpoint) live in the __dict__ of composites only
+    __slots__ = ('device_name', 'name')
+
     def __init__(self, device_name, name, n=1):
         self.device_name = device_name
         self.name = name
@@ -23,6 +27,68 @@ class SimulatedCircuit:
         elif hasattr(self, 'off'):
             self.off()
 
+    def flatten(self):
+        '''
+        Return the primitive devices (Relay, Branch, Power, Ground, Switch,
+        behavioral models) in the order step() visits them, duplicates included
+        '''
+        if hasattr(self, 'update_sequence'):
+            devices = []
+            for device in self.update_sequence:
+                devices.extend(device.flatten())
+            return devices
+        else:
+            return [self]
+
+    def settle(self, max_iters=100, replan=False):
+        '''
+        Evaluate every primitive once in dependency order and repeat each
+        feedback loop until its values stop changing
+        return: the largest number of passes any loop needed
+        Raises RuntimeError if a loop does not settle within max_iters (e.g. Oscillator).
+        The plan is built on the first call; call again after rewiring with replan=True.
+        '''
+        cache = getattr(self, '__dict__', {}) # primitives have no __dict__ and plan per call
+        if replan or '_settle_plan' not in cache:
+            from Levelize import SettlePlan
+            cache['_settle_plan'] = SettlePlan(self)
+        return cache['_settle_plan'].run(max_iters)
+
+    def snapshot(self):
+        '''
+        Complete simulation state packed into bytes, see Checkpoint
+        '''
+        return self._get_checkpoint().snapshot()
+
+    def restore(self, buf):
+        '''
+        Return to a state taken by snapshot() of this device or another
+        instance built the same way
+        '''
+        self._get_checkpoint().restore(buf)
+
+    def _get_checkpoint(self):
+        # composites keep their Checkpoint, primitives have no __dict__ and build one per call
+        cache = getattr(self, '__dict__', {})
+        if '_checkpoint' not in cache:
+            from Checkpoint import Checkpoint
+            cache['_checkpoint'] = Checkpoint(self)
+        return cache['_checkpoint']
+
+    def run(self, max_steps, until=None):
+        '''
+        Step until a stop condition holds, checked after every step
+        until: Condition (see Condition), compiled once per call, or a function without arguments
+        return: number of steps taken when it held, None if it did not within max_steps,
+            max_steps without a condition
+        '''
+        check = until.compile(self) if hasattr(until, 'compile') else until
+        for k in range(1, max_steps + 1):
+            self.step()
+            if check is not None and check():
+                return k
+        return None if check is not None else max_steps
+
     def step(self, n=1):
         if hasattr(self, 'update_sequence'):
             for device in self.update_sequence:
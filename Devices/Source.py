@@ -7,6 +7,8 @@ class Power(SimulatedCircuit):
     '''
     O: power output (HIGH or OPEN)
     '''
+    __slots__ = ('O',)
+
     def __init__(self, name):
         self.device_name = 'Power'
         self.name = name
@@ -35,6 +37,8 @@ class Power(SimulatedCircuit):
 
 
 class Ground(SimulatedCircuit):
+    __slots__ = ('ri', 'O')
+
     def __init__(self, name):
         self.ri = Port('le', self)
 
@@ -5,6 +5,8 @@ from Port import Port
 from Source import Power
 
 class Switch(SimulatedCircuit):
+    __slots__ = ('state', 'le', 'ri', 'I', 'O')
+
     def __init__(self, name):
         self.state = OPEN # open
 
@@ -0,0 +1,322 @@
+import unittest
+import random as rd
+from BitValue import *
+from SimulatedCircuit import SimulatedCircuit
+from Compiler import Netlist, COPY, CONST, CHARGE, SELECT, RESOLVE
+from BitParallel import pack_lanes, unpack_lanes
+from Lookup import expand_ports
+
+
+FALSE = 0
+TRUE = 1
+
+
+class Expressions:
+    '''
+    Hash-consed Boolean expressions over input variables
+
+    Every expression is an int indexing nodes; structurally equal
+    expressions are the same int. and_/or_/not_ fold constants, idempotence,
+    complements, double negation and absorption as they build.
+
+    nodes: ('const', value, None), ('var', i, None), ('not', a, None),
+        ('and', a, b) or ('or', a, b) with a < b
+    '''
+    def __init__(self):
+        self.nodes = [('const', 0, None), ('const', 1, None)]
+        self._index = {node: k for k, node in enumerate(self.nodes)}
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def _node(self, node):
+        if node not in self._index:
+            self._index[node] = len(self.nodes)
+            self.nodes.append(node)
+        return self._index[node]
+
+    def var(self, i):
+        return self._node(('var', i, None))
+
+    def not_(self, a):
+        if a <= TRUE:
+            return 1 - a
+        if self.nodes[a][0] == 'not':
+            return self.nodes[a][1]
+        return self._node(('not', a, None))
+
+    def _complement(self, a, b):
+        node = self.nodes[a]
+        return (node[0] == 'not' and node[1] == b) or self._index.get(('not', a, None)) == b
+
+    def _binary(self, op, a, b):
+        unit, zero = (TRUE, FALSE) if op == 'and' else (FALSE, TRUE)
+        if a == zero or b == zero:
+            return zero
+        if a == unit:
+            return b
+        if b == unit or a == b:
+            return a
+        if self._complement(a, b):
+            return zero
+        # absorption: a & (a | x) = a, a | (a & x) = a
+        dual = 'or' if op == 'and' else 'and'
+        for x, y in [(a, b), (b, a)]:
+            node = self.nodes[y]
+            if node[0] == dual and x in (node[1], node[2]):
+                return x
+        return self._node((op, min(a, b), max(a, b)))
+
+    def and_(self, a, b):
+        return self._binary('and', a, b)
+
+    def or_(self, a, b):
+        return self._binary('or', a, b)
+
+    def any_(self, items):
+        out = FALSE
+        for a in items:
+            out = self.or_(out, a)
+        return out
+
+    def mux(self, c, a, b):
+        # a where c, else b
+        if a == b:
+            return a
+        return self.or_(self.and_(c, a), self.and_(self.not_(c), b))
+
+
+class BooleanCircuit:
+    '''
+    Combinational device compiled to bitwise Python over packed lanes
+
+    One step of the Netlist is executed symbolically from the current object
+    state (call power_on() first), with each input port a variable. Every
+    slot is a pair of expressions (HIGH, GND) as in BitParallel; outputs
+    are the resulting expressions, emitted as straight-line code of &, |
+    and ^ mask. The code only grows with the logic, not with 2**ninput, so
+    it handles blocks too wide for a LookupTable.
+
+    The device must produce its outputs from its inputs in one step;
+    this is checked by stepping symbolically a second time.
+
+    inputs, outputs: access point names, see Lookup.expand_ports
+    source: generated evaluate(mask, *input planes)
+    nnode: number of expressions computed by evaluate
+    '''
+    def __init__(self, device: SimulatedCircuit, inputs, outputs):
+        self.device = device
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.netlist = Netlist(device)
+        self.expr = Expressions()
+
+        self._width = {name: len(expand_ports(device, [name])) for name in self.inputs + self.outputs}
+        inslots = [self.netlist.find(p) for p in expand_ports(device, self.inputs)]
+        outslots = [self.netlist.find(p) for p in expand_ports(device, self.outputs)]
+        variables = {i: self.expr.var(k) for k, i in enumerate(inslots)}
+
+        state = []
+        for value in self.netlist.load():
+            state.append((TRUE if value == HIGH else FALSE, TRUE if value == GND else FALSE))
+        self._shorts = []
+        first = self._step(state, variables)
+        shorts = self._shorts
+        self._shorts = [] # the second step only checks combinationality
+        second = self._step(list(first), variables)
+        self._shorts = shorts
+        if any(first[i] != second[i] for i in outslots):
+            raise(RuntimeError(f'{device.name} is not combinational in one step'))
+
+        self._ninput = len(inslots)
+        self._h = [first[i][0] for i in outslots]
+        self._g = [first[i][1] for i in outslots]
+        self.source = self._generate()
+        namespace = {}
+        exec(compile(self.source, f'<boolean {device.name}>', 'exec'), namespace)
+        self._evaluate = namespace['evaluate']
+
+    def __repr__(self):
+        return f'BooleanCircuit({self.device.name}, {self._ninput} inputs, {len(self._h)} outputs, {self.nnode} nodes)'
+
+    def _step(self, state, variables):
+        x = self.expr
+        for i, v in variables.items():
+            state[i] = (v, FALSE)
+        for op in self.netlist.ops:
+            code, d = op[0], op[1]
+            if code == COPY:
+                state[d] = state[op[2]]
+            elif code == CONST:
+                state[d] = (TRUE if op[2] == HIGH else FALSE, TRUE if op[2] == GND else FALSE)
+            elif code == CHARGE:
+                state[d] = (state[op[2]][0], FALSE)
+            elif code == SELECT:
+                c = x.or_(*state[op[2]]) # taken while the condition is not OPEN
+                a = state[op[3]] if op[3] is not None else (FALSE, FALSE)
+                b = state[op[4]] if op[4] is not None else (FALSE, FALSE)
+                state[d] = (x.mux(c, a[0], b[0]), x.mux(c, a[1], b[1]))
+            else: # RESOLVE
+                h = x.any_(state[i][0] for i in op[2])
+                g = x.any_(state[i][1] for i in op[2])
+                if x.and_(h, g) != FALSE:
+                    self._shorts.append(x.and_(h, g))
+                state[d] = (h, g)
+        return state
+
+    def _generate(self):
+        nodes = self.expr.nodes
+        order = []
+        seen = set()
+        roots = self._h + self._g + self._shorts
+        for root in roots:
+            stack = [(root, False)]
+            while stack:
+                k, expanded = stack.pop()
+                if k in seen or nodes[k][0] in ('const', 'var'):
+                    continue
+                if expanded:
+                    seen.add(k)
+                    order.append(k)
+                    continue
+                stack.append((k, True))
+                op, a, b = nodes[k]
+                stack.extend((c, False) for c in (a, b) if c is not None)
+        self.nnode = len(order)
+
+        def name(k):
+            op, a, b = nodes[k]
+            if op == 'const':
+                return 'mask' if a else '0'
+            if op == 'var':
+                return f'x{a}'
+            return f'n{k}'
+
+        args = ''.join(f', x{i}' for i in range(self._ninput))
+        lines = [f'def evaluate(mask{args}):']
+        for k in order:
+            op, a, b = nodes[k]
+            if op == 'not':
+                lines.append(f'    n{k} = {name(a)} ^ mask')
+            else:
+                lines.append(f'    n{k} = {name(a)} {"&" if op == "and" else "|"} {name(b)}')
+        if self._shorts:
+            lines.append(f'    if {" | ".join(name(k) for k in self._shorts)}:')
+            lines.append(f'        raise NotImplementedError')
+        h = ''.join(f'{name(k)}, ' for k in self._h)
+        g = ''.join(f'{name(k)}, ' for k in self._g)
+        lines.append(f'    return ({h}), ({g})')
+        return '\n'.join(lines) + '\n'
+
+    def evaluate(self, planes, mask):
+        '''
+        One plane per input bit (in order of inputs) to (HIGH planes, GND planes) of the outputs
+        '''
+        return self._evaluate(mask, *planes)
+
+    def run(self, inputs: dict):
+        '''
+        inputs: {access point name: [one integer per lane]} for every input
+        return: {output name: [one integer per lane]}, HIGH bits read as 1,
+            like BatchSimulator.run()
+        '''
+        nlane = len(next(iter(inputs.values())))
+        planes = []
+        for name in self.inputs:
+            if len(inputs[name]) != nlane:
+                raise(RuntimeError)
+            planes.extend(pack_lanes(inputs[name], self._width[name]))
+        h, g = self.evaluate(planes, (1 << nlane) - 1)
+        result = {}
+        pos = 0
+        for name in self.outputs:
+            width = self._width[name]
+            result[name] = unpack_lanes(list(h[pos:pos + width]), nlane)
+            pos += width
+        return result
+
+
+
+
+class TestSymbolic(unittest.TestCase):
+    def test_expressions(self):
+        print('test_expressions')
+
+        x = Expressions()
+        a = x.var(0)
+        b = x.var(1)
+        self.assertEqual(x.and_(a, b), x.and_(b, a))
+        self.assertEqual(x.and_(a, x.not_(a)), FALSE)
+        self.assertEqual(x.or_(a, x.not_(a)), TRUE)
+        self.assertEqual(x.not_(x.not_(a)), a)
+        self.assertEqual(x.and_(a, x.or_(a, b)), a)
+        self.assertEqual(x.mux(TRUE, a, b), a)
+        self.assertEqual(x.mux(a, b, b), b)
+
+    def test_gates(self):
+        print('test_gates')
+
+        from Gate import And, Or, Nand, Nor, Xor
+
+        for gate_class, op in [(And, lambda a, b: a & b), (Or, lambda a, b: a | b), (Nand, lambda a, b: 1 - (a & b)), (Nor, lambda a, b: 1 - (a | b)), (Xor, lambda a, b: a ^ b)]:
+            gate = gate_class('gate')
+            gate.power_on()
+            circuit = BooleanCircuit(gate, ['I'], ['O'])
+            O = circuit.run({'I': [0, 1, 2, 3]})['O']
+            self.assertNotIn('NotImplementedError', circuit.source) # no short can occur
+            self.assertEqual(O, [op(k & 1, k >> 1) for k in range(4)])
+
+    def test_adder8bit_exhaustive(self):
+        print('test_adder8bit_exhaustive')
+
+        from Arithmetic import Adder8bit
+
+        a8 = Adder8bit('a8')
+        a8.power_on()
+        circuit = BooleanCircuit(a8, ['A', 'B', 'CI'], ['S', 'CO'])
+
+        vectors = range(2**17)
+        A = [v & 0xFF for v in vectors]
+        B = [(v >> 8) & 0xFF for v in vectors]
+        CI = [v >> 16 for v in vectors]
+        out = circuit.run({'A': A, 'B': B, 'CI': CI})
+        for a, b, ci, s, co in zip(A, B, CI, out['S'], out['CO']):
+            self.assertEqual(s | (co << 8), a + b + ci)
+
+    def test_selector16to1(self):
+        print('test_selector16to1')
+
+        from Decoder import Selector16to1
+
+        sel = Selector16to1('sel')
+        sel.power_on()
+        circuit = BooleanCircuit(sel, ['Signal', 'I'], ['O'])
+
+        rd.seed(20)
+        signal = [rd.randint(0, 1) for k in range(500)]
+        I = [rd.randint(0, 0xFFFF) for k in range(500)]
+        out = circuit.run({'Signal': signal, 'I': I})['O']
+        self.assertEqual(out, [i if s else 0 for s, i in zip(signal, I)])
+
+    def test_sequential(self):
+        print('test_sequential')
+
+        from FlipFlop import RSFlipFlop
+
+        ff = RSFlipFlop('rsff')
+        ff.power_on()
+        with self.assertRaises(RuntimeError):
+            BooleanCircuit(ff, ['S', 'R'], ['Q'])
+
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTests([
+        TestSymbolic('test_expressions'),
+        TestSymbolic('test_gates'),
+        TestSymbolic('test_adder8bit_exhaustive'),
+        TestSymbolic('test_selector16to1'),
+        TestSymbolic('test_sequential'),
+    ])
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -0,0 +1,280 @@
+import unittest
+import random as rd
+from collections import deque
+from itertools import repeat
+from operator import itemgetter
+from types import FunctionType, BuiltinFunctionType, ModuleType
+from SimulatedCircuit import SimulatedCircuit
+from Util import paused_gc
+
+
+_MISSING = object()
+
+
+_CONSTANT_TYPES = {type(None), bool, int, float, str, bytes}
+
+def _is_constant(value):
+    if type(value) in _CONSTANT_TYPES:
+        return True
+    if isinstance(value, tuple):
+        return all(_is_constant(v) for v in value)
+    return value is None or isinstance(value, (int, float, str, bytes, type, FunctionType, BuiltinFunctionType, ModuleType))
+
+
+class Template:
+    '''
+    Object graph of a prototype device, stamped out without running constructors
+
+    The prototype is walked once. Every object, list, dict and bytearray
+    reachable from it gets an index; attributes are recorded per name as
+    index arrays into that numbering. clone() allocates
+    the same number of objects and replays the attribute stores in bulk, so
+    connections inside the copy point at the copy's own ports.
+
+    The prototype must not be connected to anything outside itself,
+    otherwise the outside objects are copied as well.
+
+    nobject: number of objects, lists, dicts and bytearrays per copy
+    '''
+    def __init__(self, prototype: SimulatedCircuit):
+        self.device_name = prototype.device_name
+
+        # number the graph
+        nodes = []
+        index = {}
+        stack = [prototype]
+        slots = {}
+        while stack:
+            obj = stack.pop()
+            if id(obj) in index:
+                continue
+            index[id(obj)] = len(nodes)
+            nodes.append(obj)
+            if isinstance(obj, list):
+                values = obj
+            elif isinstance(obj, dict):
+                values = list(obj.keys()) + list(obj.values())
+            elif isinstance(obj, bytearray):
+                values = ()
+            else:
+                cls = type(obj)
+                if cls not in slots:
+                    slots[cls] = self._slots(cls)
+                values = [getattr(obj, name, _MISSING) for name, descr in slots[cls]]
+                if hasattr(obj, '__dict__'):
+                    values.extend(obj.__dict__.values())
+                elif not slots[cls]:
+                    raise(NotImplementedError(f'cannot copy {cls.__name__}'))
+            for value in values:
+                if not _is_constant(value) and value is not _MISSING and id(value) not in index:
+                    stack.append(value)
+
+        # objects first, then containers, so one index space serves every kind
+        objects = [obj for obj in nodes if not isinstance(obj, (list, dict, bytearray))]
+        lists = [obj for obj in nodes if isinstance(obj, list)]
+        dicts = [obj for obj in nodes if isinstance(obj, dict)]
+        buffers = [obj for obj in nodes if isinstance(obj, bytearray)]
+        order = objects + lists + dicts + buffers
+        index = {id(obj): i for i, obj in enumerate(order)}
+        ref = lambda value: None if _is_constant(value) else index[id(value)]
+
+        self._classes = [type(obj) for obj in objects]
+        self._ndict = len(dicts)
+        self._buffers = [bytes(obj) for obj in buffers]
+
+        # lists holding only objects are built with their items: (class, getter or None);
+        # the other containers are filled afterwards: (container index, items),
+        # an item is (index, None) or (None, constant)
+        self._lists = []
+        self._fills = []
+        for k, obj in enumerate(lists + dicts):
+            items = obj if isinstance(obj, list) else [v for pair in obj.items() for v in pair]
+            refs = [ref(v) for v in items]
+            if isinstance(obj, list):
+                if all(i is not None and i < len(objects) for i in refs):
+                    self._lists.append((type(obj), self._getter(refs) if refs else None)) # Bus or list
+                    continue
+                self._lists.append((type(obj), None))
+            if items:
+                self._fills.append((k, [(i, None if i is not None else v) for i, v in zip(refs, items)]))
+
+        # attribute stores grouped by name, set with setattr (faster than the slot descriptors)
+        groups = {}
+        for obj in objects:
+            i = index[id(obj)]
+            items = [(name, getattr(obj, name, _MISSING)) for name, descr in slots[type(obj)]]
+            if hasattr(obj, '__dict__'):
+                items.extend(obj.__dict__.items())
+            for name, value in items:
+                if value is _MISSING:
+                    continue
+                group = groups.setdefault((name, _is_constant(value)), ([], []))
+                group[0].append(i)
+                group[1].append(value if _is_constant(value) else index[id(value)])
+        self._stores = []
+        for (name, constant), (targets, values) in groups.items():
+            values = tuple(values) if constant else self._getter(values)
+            self._stores.append((name, self._getter(targets), values, constant))
+
+        self.nobject = len(order)
+
+    def __repr__(self):
+        return f'Template({self.device_name}, {self.nobject} objects)'
+
+    @staticmethod
+    def _slots(cls):
+        # (name, descriptor) of every slot in the class hierarchy
+        out = []
+        for base in reversed(cls.__mro__):
+            for name in base.__dict__.get('__slots__', ()):
+                if name not in ('__dict__', '__weakref__'):
+                    out.append((name, base.__dict__[name]))
+        return out
+
+    @staticmethod
+    def _getter(indices):
+        # itemgetter that always returns a tuple
+        if len(indices) == 1:
+            i = indices[0]
+            return lambda objs: (objs[i],)
+        return itemgetter(*indices)
+
+    def clone(self, name=None):
+        '''
+        New copy of the prototype, renamed if name is given
+        '''
+        with paused_gc():
+            objs = list(map(object.__new__, self._classes))
+            objs.extend([cls() if items is None else cls(items(objs)) for cls, items in self._lists])
+            objs.extend({} for k in range(self._ndict))
+            objs.extend(bytearray(b) for b in self._buffers)
+            base = len(self._classes)
+            for k, items in self._fills:
+                values = [v if i is None else objs[i] for i, v in items]
+                if k < len(self._lists):
+                    objs[base + k].extend(values)
+                else:
+                    objs[base + k].update(zip(values[0::2], values[1::2]))
+            for attr, targets, values, constant in self._stores:
+                if not constant:
+                    values = values(objs)
+                deque(map(setattr, targets(objs), repeat(attr), values), 0)
+        device = objs[0]
+        if name is not None:
+            device.name = name
+        return device
+
+
+_templates = {}
+
+def template(cls, *args):
+    '''
+    Cached Template of cls(name, *args) at the current default gate fidelity
+    '''
+    import Gate
+    key = (cls, args, Gate.fidelity)
+    if key not in _templates:
+        _templates[key] = Template(cls('prototype', *args))
+    return _templates[key]
+
+
+
+
+class TestTemplate(unittest.TestCase):
+    def test_clone_gate(self):
+        print('test_clone_gate')
+
+        from Gate import And
+
+        tmpl = Template(And('and1'))
+        gate = tmpl.clone('and2')
+        self.assertEqual(gate.name, 'and2')
+        self.assertIsNot(gate.rly[0], tmpl.clone().rly[0])
+
+        # wiring points into the copy
+        self.assertIs(gate.pwr.O.connected, gate.rly[0].up)
+        self.assertIs(gate.rly[0].up.parent, gate.rly[0])
+        self.assertIs(gate.I[0], gate.rly[0].le)
+        self.assertIs(gate.update_sequence[1], gate.rly[0])
+
+        gate.power_on()
+        for k in range(4):
+            gate.I[0].value = k & 1
+            gate.I[1].value = k >> 1
+            gate.step()
+            self.assertEqual(gate.O.value, 1 if k == 3 else 0)
+
+    def test_clone_ram16x8(self):
+        print('test_clone_ram16x8')
+
+        from Memory import RAM16x8
+
+        ref = RAM16x8('ref')
+        dut = template(RAM16x8).clone('dut')
+        self.assertIs(template(RAM16x8), template(RAM16x8))
+        self.assertIs(type(dut.DI), type(ref.DI)) # Bus access points stay Buses
+
+        rd.seed(11)
+        for dev in [ref, dut]:
+            dev.power_on()
+            dev.step()
+        for k in range(60):
+            addr = rd.randint(0, 15)
+            DI = rd.randint(0, 255)
+            W = rd.randint(0, 1)
+            E = rd.randint(0, 1)
+            for dev in [ref, dut]:
+                dev.set_addr(addr)
+                dev.set_input(DI)
+                dev.W.value = W
+                dev.E.value = E
+                dev.step()
+            self.assertEqual(dut.get_output(), ref.get_output())
+        self.assertEqual(dut.print_cell(), ref.print_cell())
+
+        # copies do not share state
+        other = template(RAM16x8).clone('other')
+        other.power_on()
+        other.step()
+        self.assertEqual(other.print_cell(), RAM16x8('fresh').print_cell())
+
+    def test_clone_behavioral_ram(self):
+        print('test_clone_behavioral_ram')
+
+        from Memory import BehavioralRAM16x8
+
+        ram1 = template(BehavioralRAM16x8).clone('ram1')
+        ram2 = template(BehavioralRAM16x8).clone('ram2')
+        self.assertIsNot(ram1.core.data, ram2.core.data)
+        ram1.power_on()
+        ram1.set_addr(5)
+        ram1.set_input(0xA5)
+        ram1.W.set()
+        ram1.step()
+        self.assertEqual(ram1.get_cell(5), 0xA5)
+        self.assertEqual(ram2.get_cell(5), 0)
+
+    def test_ram_base_clones(self):
+        print('test_ram_base_clones')
+
+        from Memory import RAM16x8, RAM256x8
+
+        # RAMnx8 stamps its RAM16x8s out of the cached template and wires the copies
+        ram = RAM256x8('ram')
+        self.assertEqual([type(cell) for cell in ram.cell], [RAM16x8] * 16)
+        self.assertEqual(ram.cell[3].name, 'base_ram_03')
+        self.assertIsNot(ram.cell[0].cell[0][0], ram.cell[1].cell[0][0])
+        self.assertIs(ram.brna[0].outport[3].connected.parent, ram.cell[3].A[0])
+        self.assertIs(ram.cell[3].DO[5].outport[0].connected.parent, ram.brndo[5])
+
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTests([
+        TestTemplate('test_clone_gate'),
+        TestTemplate('test_clone_ram16x8'),
+        TestTemplate('test_clone_behavioral_ram'),
+        TestTemplate('test_ram_base_clones'),
+    ])
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
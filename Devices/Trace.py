@@ -0,0 +1,193 @@
+import unittest
+import io
+from BitValue import *
+from SimulatedCircuit import SimulatedCircuit
+from Util import resolve, value_attr
+
+
+_CHARS = {HIGH: '1', OPEN: '0', GND: 'x'}
+
+
+def _code(k):
+    # VCD identifier: base 94 over the printable characters
+    out = ''
+    while True:
+        out += chr(33 + k % 94)
+        k //= 94
+        if k == 0:
+            return out
+
+
+class Tracer:
+    '''
+    Writes value changes of probed signals to a VCD file
+
+    Probes are paths into the device as understood by Util.resolve(),
+    e.g. 'cs.ToCounterClk' or 'counter.Q'. A path to a Port, Branch, Relay
+    or Switch is a 1 bit wire, a path to a list of them is a bus with
+    element 0 as the least significant bit. HIGH is written as 1, OPEN as 0
+    and GND as x. Scopes follow the dots of the path.
+
+    The device itself is not modified: call step() of the tracer instead of
+    the device's, or sample() after stepping it some other way. Each sample
+    is one time unit; only probes that changed are written, through a
+    buffered file.
+
+    time: number of samples taken
+    '''
+    def __init__(self, device: SimulatedCircuit, file, probes, timescale='1 us', buffering=1 << 16):
+        self.device = device
+        if isinstance(file, str):
+            self._file = open(file, 'w', buffering=buffering)
+            self._owned = True
+        else:
+            self._file = file
+            self._owned = False
+
+        self.probes = list(probes)
+        self._objs = []
+        self._attrs = []
+        self._vars = [] # (code, first value index, width)
+        for k, path in enumerate(self.probes):
+            obj = resolve(device, path)
+            objs = obj if isinstance(obj, list) else [obj]
+            self._vars.append((_code(k), len(self._objs), len(objs) if isinstance(obj, list) else 0))
+            self._objs.extend(objs)
+            self._attrs.extend(value_attr(o) for o in objs)
+
+        self._header(timescale)
+        self.time = 0
+        self._last = None
+
+    def __repr__(self):
+        return f'Tracer({self.device.name}, {len(self.probes)} probes, t={self.time})'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _header(self, timescale):
+        lines = [f'$timescale {timescale} $end']
+        scope = []
+        for path, (code, first, width) in sorted(zip(self.probes, self._vars)):
+            *parents, name = path.split('.')
+            while scope != parents[:len(scope)]:
+                lines.append('$upscope $end')
+                scope.pop()
+            for s in parents[len(scope):]:
+                lines.append(f'$scope module {s} $end')
+                scope.append(s)
+            if width:
+                lines.append(f'$var wire {width} {code} {name} [{width - 1}:0] $end')
+            else:
+                lines.append(f'$var wire 1 {code} {name} $end')
+        lines.extend('$upscope $end' for s in scope)
+        lines.append('$enddefinitions $end')
+        self._file.write('\n'.join(lines) + '\n')
+
+    def _changes(self, values, last):
+        out = []
+        for code, first, width in self._vars:
+            if width:
+                bits = values[first:first + width]
+                if last is None or bits != last[first:first + width]:
+                    out.append('b' + ''.join(_CHARS[v] for v in reversed(bits)) + f' {code}')
+            elif last is None or values[first] != last[first]:
+                out.append(_CHARS[values[first]] + code)
+        return out
+
+    def sample(self):
+        '''
+        Record the current values at the current time, then advance it
+        '''
+        values = list(map(getattr, self._objs, self._attrs))
+        if values != self._last:
+            lines = self._changes(values, self._last)
+            if self._last is None:
+                lines = ['$dumpvars'] + lines + ['$end']
+            self._file.write(f'#{self.time}\n' + '\n'.join(lines) + '\n')
+            self._last = values
+        self.time += 1
+
+    def step(self, n=1):
+        '''
+        Step the device n times, sampling after each step
+        '''
+        if self._last is None:
+            self.sample()
+        for i in range(n):
+            self.device.step()
+            self.sample()
+
+    def close(self):
+        self._file.write(f'#{self.time}\n')
+        if self._owned:
+            self._file.close()
+        else:
+            self._file.flush()
+
+
+
+
+class TestTrace(unittest.TestCase):
+    def test_rsff(self):
+        print('test_rsff')
+
+        from FlipFlop import RSFlipFlop
+
+        dev = RSFlipFlop('rsff1')
+        dev.power_on()
+        out = io.StringIO()
+        with Tracer(dev, out, ['S', 'R', 'Q']) as tracer:
+            tracer.step()
+            dev.S.value = HIGH
+            tracer.step()
+            dev.S.value = OPEN
+            tracer.step(3) # nothing changes
+
+        vcd = out.getvalue()
+        header, body = vcd.split('$enddefinitions $end\n')
+        self.assertIn('$var wire 1 ! S $end', header)
+        self.assertIn('$var wire 1 # Q $end', header)
+        self.assertEqual(body, '\n'.join([
+            '#0', '$dumpvars', '0!', '0"', '0#', '$end',
+            '#2', '1!', '1#',
+            '#3', '0!',
+            '#6', '',
+        ]))
+
+    def test_control_signal(self):
+        print('test_control_signal')
+
+        from AutomatedAccumulatingAdder import AutomatedAccumulatingAdder
+        from Memory import BehavioralRAM256x8
+
+        aaa = AutomatedAccumulatingAdder('aaa', ram=BehavioralRAM256x8)
+        aaa.power_on()
+        aaa.init()
+        out = io.StringIO()
+        tracer = Tracer(aaa, out, ['cs.ToCounterClk', 'cs.ToLatchClk', 'cs.osc.O', 'counter.Q'])
+        tracer.step(16)
+        tracer.close()
+
+        vcd = out.getvalue()
+        self.assertIn('$scope module osc $end\n$var wire 1 # O $end\n$upscope $end\n$upscope $end', vcd)
+        self.assertIn(f'$var wire {len(aaa.counter.Q)} $ Q [{len(aaa.counter.Q) - 1}:0] $end', vcd)
+
+        # the oscillator toggles every step, the counter advances
+        changes = [line for line in vcd.split('\n') if line.endswith('#') and len(line) == 2]
+        self.assertEqual(len(changes), 17)
+        counts = {line.split()[0] for line in vcd.split('\n') if line.startswith('b')}
+        self.assertGreater(len(counts), 2)
+
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTests([
+        TestTrace('test_rsff'),
+        TestTrace('test_control_signal'),
+    ])
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -1,6 +1,12 @@
 import unittest
+import gc
+from contextlib import contextmanager
+from operator import attrgetter, itemgetter
 from SimulatedCircuit import SimulatedCircuit
 from Port import Port
+from Relay import Relay
+from Branch import Branch
+from Switch import Switch
 
 
 def i2b_r(num, len):
@@ -27,6 +33,111 @@ def pav2i(ports, nport):
     value = int(buffer, 2)
     return value
 
+def value_attr(obj):
+    '''
+    Attribute holding the value of a Port, Branch, Relay or Switch, as in Netlist.find()
+    '''
+    if isinstance(obj, Branch):
+        return '_value'
+    elif isinstance(obj, Relay):
+        return 'X'
+    elif isinstance(obj, Switch):
+        return 'state'
+    return 'value'
+
+def attributes(obj):
+    '''
+    (name, value) of every slot and instance attribute of obj, in definition order
+    '''
+    out = []
+    for cls in reversed(type(obj).__mro__):
+        for name in cls.__dict__.get('__slots__', ()):
+            if hasattr(obj, name):
+                out.append((name, getattr(obj, name)))
+    if hasattr(obj, '__dict__'):
+        out.extend(obj.__dict__.items())
+    return out
+
+def walk(device):
+    '''
+    (path, obj) of every object reachable from device, e.g. ('dec.brnd[2]', Branch)
+    Attributes are visited in definition order, depth first, update_sequence
+    last, and the first path that reaches an object names it. Back
+    references (parent, connected) are not followed. device itself is ''.
+    '''
+    seen = set()
+    stack = [(device, '')]
+    while stack:
+        obj, path = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        yield path, obj
+        if isinstance(obj, list):
+            children = [(f'{path}[{i}]', v) for i, v in enumerate(obj)]
+        else:
+            children = [(f'{path}.{name}' if path else name, v) for name, v in attributes(obj)]
+            children.sort(key=lambda c: c[0].endswith('update_sequence'))
+        for child_path, v in reversed(children):
+            if child_path.rsplit('.', 1)[-1] in ('parent', 'connected'):
+                continue
+            if isinstance(v, (list, SimulatedCircuit, Port)) and id(v) not in seen:
+                stack.append((v, child_path))
+
+def object_paths(device):
+    '''
+    {id(obj): path} of every object reachable from device, see walk()
+    '''
+    return {id(obj): path for path, obj in walk(device)}
+
+def getter(path):
+    '''
+    Function from a device to the object at a path as given by object_paths()
+    The path is parsed once, e.g. for following it from many devices.
+    '''
+    steps = [] # attrgetter of each run of names, itemgetter of each index
+    names = []
+    for part in path.replace('[', '.[').split('.'):
+        if not part:
+            continue
+        if part[0] == '[':
+            if names:
+                steps.append(attrgetter('.'.join(names)))
+                names = []
+            steps.append(itemgetter(int(part[1:-1])))
+        else:
+            names.append(part)
+    if names:
+        steps.append(attrgetter('.'.join(names)))
+    if len(steps) == 1:
+        return steps[0]
+    def get(obj):
+        for step in steps:
+            obj = step(obj)
+        return obj
+    return get
+
+def resolve(device, path):
+    '''
+    Object at a path as given by object_paths()
+    '''
+    return getter(path)(device)
+
+@contextmanager
+def paused_gc():
+    '''
+    Suspend the cyclic garbage collector, e.g. while building a large device
+    Every collection would rescan the whole, still growing, object graph.
+    Nests; usable as a decorator.
+    '''
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
 
 
 
@@ -62,6 +173,52 @@ class TestDecoder(unittest.TestCase):
 
         self.assertEqual(pav2i(ps, 8), value)
 
+    def test_object_paths(self):
+        print('test_object_paths')
+
+        from Gate import And
+        from Memory import RAM16x8
+
+        gate = And('and1')
+        paths = object_paths(gate)
+        self.assertEqual(paths[id(gate)], '')
+        self.assertEqual(paths[id(gate.rly[1])], 'rly[1]')
+        self.assertEqual(paths[id(gate.rly[0].le)], 'I[0]')
+        self.assertIs(resolve(gate, 'rly[0].ru'), gate.rly[0].ru)
+        get = getter('rly[1].le')
+        self.assertIs(get(gate), gate.rly[1].le)
+        other = And('and2')
+        self.assertIs(get(other), other.rly[1].le)
+
+        ram = RAM16x8('ram')
+        paths = object_paths(ram)
+        for obj in [ram.cell[3][5].DO, ram.DI[2], ram.tri[15][7], ram.W]:
+            self.assertIs(resolve(ram, paths[id(obj)]), obj)
+
+        # same structure, same paths
+        other = RAM16x8('other')
+        self.assertEqual(sorted(object_paths(other).values()), sorted(paths.values()))
+
+    def test_paused_gc(self):
+        print('test_paused_gc')
+
+        enabled = gc.isenabled()
+        gc.enable()
+        with paused_gc():
+            self.assertFalse(gc.isenabled())
+            with paused_gc():
+                self.assertFalse(gc.isenabled())
+            self.assertFalse(gc.isenabled())
+        self.assertTrue(gc.isenabled())
+
+        @paused_gc()
+        def build():
+            return gc.isenabled()
+        self.assertFalse(build())
+        self.assertTrue(gc.isenabled())
+        if not enabled:
+            gc.disable()
+
 
 
 if __name__ == '__main__':
@@ -70,6 +227,8 @@ if __name__ == '__main__':
         TestDecoder('test_i2b_r'),
         TestDecoder('test_i2b_ri'),
         TestDecoder('test_pav2i'),
+        TestDecoder('test_object_paths'),
+        TestDecoder('test_paused_gc'),
     ])
     runner = unittest.TextTestRunner()
     runner.run(suite)
@@ -0,0 +1,181 @@
+import unittest
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from BitValue import *
+
+
+class AdderCheck:
+    '''
+    Every A, B, CI of Adder8bit against integer addition
+
+    Vector k is A = k & 0xFF, B = (k >> 8) & 0xFF, CI = k >> 16.
+    Result: (S, CO)
+    '''
+    size = 1 << 17
+
+    def build(self):
+        from Arithmetic import Adder8bit
+        dev = Adder8bit('a8')
+        dev.power_on()
+        dev.step()
+        return dev
+
+    def run(self, dev, k):
+        A = k & 0xFF
+        B = (k >> 8) & 0xFF
+        CI = k >> 16
+        dev.set_input(A, B)
+        dev.CI.value = HIGH if CI else OPEN
+        dev.step()
+        return (dev.get_output(), dev.CO.value), self.expected(k)
+
+    def expected(self, k):
+        total = (k & 0xFF) + ((k >> 8) & 0xFF) + (k >> 16)
+        return (total & 0xFF, HIGH if total > 0xFF else OPEN)
+
+
+class RAMCheck:
+    '''
+    Every address/data pair of a RAM: write DI to A, then read it back
+
+    Vector k is A = k >> 8, DI = k & 0xFF. Each vector overwrites the cell
+    it reads, so the result does not depend on the vectors run before it.
+    Result: DO
+    '''
+    def __init__(self, cls=None, naddr=4):
+        self.cls = cls # RAM class, RAM16x8 if None
+        self.size = 1 << (naddr + 8)
+
+    def build(self):
+        from Memory import RAM16x8
+        dev = (self.cls or RAM16x8)('ram')
+        dev.power_on()
+        dev.step()
+        return dev
+
+    def run(self, dev, k):
+        dev.set_addr(k >> 8)
+        dev.set_input(k & 0xFF)
+        dev.W.set()
+        dev.step()
+        dev.W.reset()
+        dev.E.set()
+        dev.step()
+        DO = dev.get_output()
+        dev.E.reset()
+        return DO, self.expected(k)
+
+    def expected(self, k):
+        return k & 0xFF
+
+
+# per worker process: the check and the device it built
+_worker = None
+
+def _init(check):
+    global _worker
+    _worker = (check, check.build())
+
+def _run_shard(start, stop):
+    check, dev = _worker
+    out = []
+    for k in range(start, stop):
+        got, expected = check.run(dev, k)
+        if got != expected:
+            out.append((k, got, expected))
+    return out
+
+
+def shards(start, stop, nshard):
+    '''
+    [start, stop) cut into at most nshard contiguous ranges
+    '''
+    n = stop - start
+    nshard = max(1, min(nshard, n))
+    bounds = [start + n * i // nshard for i in range(nshard + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def mismatches(check, start=0, stop=None, nworkers=None, nshard=None):
+    '''
+    Run vectors [start, stop) of check, default all of them, and yield
+    (vector, got, expected) for each one that fails, shard by shard as
+    the shards finish
+
+    The range is split into nshard shards (default 8 per worker) that are
+    run by a ProcessPoolExecutor of nworkers processes (default: one per
+    CPU). Each worker builds its device once and runs its shards on it.
+    With nworkers=1 everything runs in this process.
+    '''
+    stop = check.size if stop is None else stop
+    nworkers = nworkers or os.cpu_count() or 1
+    ranges = shards(start, stop, nshard or 8 * nworkers)
+    if nworkers == 1:
+        global _worker
+        saved = _worker
+        _init(check)
+        try:
+            for lo, hi in ranges:
+                yield from _run_shard(lo, hi)
+        finally:
+            _worker = saved
+        return
+    with ProcessPoolExecutor(nworkers, initializer=_init, initargs=(check,)) as pool:
+        futures = [pool.submit(_run_shard, lo, hi) for lo, hi in ranges]
+        for future in as_completed(futures):
+            yield from future.result()
+
+
+def verify(check, start=0, stop=None, nworkers=None, nshard=None):
+    '''
+    All mismatches of mismatches() sorted by vector
+    '''
+    return sorted(mismatches(check, start, stop, nworkers, nshard))
+
+
+
+
+class _FaultyAdderCheck(AdderCheck):
+    # claims the carry in is ignored, so every vector with CI set fails
+    def expected(self, k):
+        return super().expected(k & 0xFFFF)
+
+
+class TestVerify(unittest.TestCase):
+    def test_shards(self):
+        print('test_shards')
+
+        self.assertEqual(shards(0, 10, 3), [(0, 3), (3, 6), (6, 10)])
+        self.assertEqual(shards(5, 7, 8), [(5, 6), (6, 7)])
+
+    def test_adder8bit(self):
+        print('test_adder8bit')
+
+        # a slice around the carry-in boundary, in two processes
+        self.assertEqual(verify(AdderCheck(), 0xFF00, 0x10100, nworkers=2), [])
+
+        bad = verify(_FaultyAdderCheck(), 0xFFF0, 0x10010, nworkers=2, nshard=4)
+        self.assertEqual([k for k, got, expected in bad], list(range(0x10000, 0x10010)))
+        k, got, expected = bad[0]
+        self.assertEqual(got, (1, OPEN))
+        self.assertEqual(expected, (0, OPEN))
+
+    def test_ram16x8(self):
+        print('test_ram16x8')
+
+        check = RAMCheck()
+        self.assertEqual(check.size, 4096)
+        self.assertEqual(verify(check, 0x3F0, 0x410, nworkers=1), [])
+        from Memory import BehavioralRAM16x8
+        self.assertEqual(verify(RAMCheck(BehavioralRAM16x8), nworkers=1), [])
+
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTests([
+        TestVerify('test_shards'),
+        TestVerify('test_adder8bit'),
+        TestVerify('test_ram16x8'),
+    ])
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
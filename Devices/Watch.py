@@ -0,0 +1,209 @@
+import unittest
+from BitValue import *
+from SimulatedCircuit import SimulatedCircuit
+from Util import resolve, value_attr
+
+
+# id of a watched object -> Watchpoints on it
+_watches = {}
+# class -> its watched subclass
+_classes = {}
+
+
+def _watched_class(cls, attr):
+    '''
+    Subclass of cls whose value attribute notifies the Watchpoints of the
+    instance when a write changes it
+
+    It adds no slots, so instances can be switched to it and back by
+    assigning __class__. Objects that are not watched keep their own class
+    and pay nothing.
+    '''
+    if cls not in _classes:
+        slot = next(base.__dict__[attr] for base in cls.__mro__ if attr in base.__dict__)
+
+        def get(self):
+            return slot.__get__(self, cls)
+
+        def set(self, value):
+            old = slot.__get__(self, cls)
+            slot.__set__(self, value)
+            if value != old:
+                for watch in _watches.get(id(self), ()):
+                    watch._changed()
+
+        _classes[cls] = type(f'Watched{cls.__name__}', (cls,), {
+            '__slots__': (),
+            attr: property(get, set),
+            '_unwatched': cls,
+        })
+    return _classes[cls]
+
+
+class Watchpoint:
+    '''
+    Calls back when the value at a path changes
+
+    The path is understood by Util.resolve(), e.g. 'cs.ToLatchClk' or
+    'counter.Q'. A Port, Branch, Relay or Switch has its own value (HIGH,
+    OPEN, GND), a list of them is a bus read as an integer with element 0
+    as bit 0 and HIGH as 1. Each watched object is switched to a subclass
+    whose value writes are hooked, until remove(). Changes are seen as
+    they are written, including transient values within a step such as
+    the ripple of a RippleCounter4Bit.
+
+    when: predicate on the new value, default every change
+    callback: called as callback(watchpoint, old, new) on every hit
+    A Watchpoint is also a breakpoint: as run(until=watchpoint) it stops the
+    run after the first step that hits it. Hits before the run do not count.
+
+    value: value as of the last change
+    hits: number of hits so far
+    '''
+    def __init__(self, device: SimulatedCircuit, path, callback=None, when=None):
+        self.path = path
+        self.callback = callback
+        self.when = when
+        self.hits = 0
+        self.triggered = False
+
+        obj = resolve(device, path)
+        self.bus = isinstance(obj, list)
+        self._objects = list({id(o): o for o in (obj if self.bus else [obj])}.values())
+        self._items = [(o, value_attr(o)) for o in (obj if self.bus else [obj])]
+        self.value = self.read()
+        for o in self._objects:
+            if id(o) not in _watches:
+                _watches[id(o)] = []
+                o.__class__ = _watched_class(type(o), value_attr(o))
+            _watches[id(o)].append(self)
+
+    def __repr__(self):
+        return f'Watchpoint({self.path}, {self.value}, {self.hits} hits)'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.remove()
+
+    def compile(self, device):
+        # called by run(): the breakpoint only fires on hits from now on
+        self.triggered = False
+        return self
+
+    def __call__(self):
+        triggered = self.triggered
+        self.triggered = False
+        return triggered
+
+    def read(self):
+        if not self.bus:
+            obj, attr = self._items[0]
+            return getattr(obj, attr)
+        value = 0
+        for i, (obj, attr) in enumerate(self._items):
+            if getattr(obj, attr) == HIGH:
+                value |= 1 << i
+        return value
+
+    def _changed(self):
+        new = self.read()
+        if new == self.value:
+            return
+        old = self.value
+        self.value = new
+        if self.when is None or self.when(new):
+            self.hits += 1
+            self.triggered = True
+            if self.callback is not None:
+                self.callback(self, old, new)
+
+    def remove(self):
+        '''
+        Stop watching, objects watched by nobody else get their class back
+        '''
+        for o in self._objects:
+            watches = _watches.get(id(o), [])
+            if self in watches:
+                watches.remove(self)
+            if not watches and id(o) in _watches:
+                del _watches[id(o)]
+                o.__class__ = o._unwatched
+        self._objects = []
+
+
+
+
+class TestWatch(unittest.TestCase):
+    data = [0x35, 0x1B, 0x09, 0x31, 0x1E, 0x12, 0x23, 0x0C]
+
+    def _aaa(self):
+        from AutomatedAccumulatingAdder import AutomatedAccumulatingAdder
+        from Memory import BehavioralRAM256x8
+
+        aaa = AutomatedAccumulatingAdder('aaa', ram=BehavioralRAM256x8)
+        aaa.power_on()
+        aaa.init()
+        aaa.write_data(self.data)
+        return aaa
+
+    def test_watch(self):
+        print('test_watch')
+
+        from Port import Port
+        from Branch import Branch
+
+        aaa = self._aaa()
+        counts = []
+        clocks = []
+        writes = []
+        with Watchpoint(aaa, 'counter.Q', lambda w, old, new: counts.append((old, new))) as wq, \
+             Watchpoint(aaa, 'cs.ToLatchClk', lambda w, old, new: clocks.append(new)) as wc, \
+             Watchpoint(aaa, 'cs.ToRamW', lambda w, old, new: writes.append(new), when=lambda v: v == HIGH) as ww:
+            self.assertIsInstance(aaa.cs.ToRamW, Port)
+            self.assertIsNot(type(aaa.cs.ToRamW), Port)
+            self.assertIsInstance(aaa.counter.Q[0], Branch)
+            for k in range(40):
+                aaa.step()
+        self.assertEqual(counts[-1], (8, 9))
+        self.assertIn((3, 2), counts) # 3 -> 4 ripples through 2 and 0
+        self.assertEqual(sorted({new for old, new in counts}), list(range(10)))
+        self.assertEqual(wq.hits, len(counts))
+        self.assertGreater(wc.hits, 4)
+        self.assertEqual(set(clocks), {HIGH, OPEN})
+        self.assertEqual(writes, [HIGH, HIGH])
+        self.assertIs(type(aaa.cs.ToRamW), Port)
+        self.assertIs(type(aaa.counter.Q[0]), Branch)
+        self.assertIs(type(aaa.cs.ToLatchClk), Branch)
+
+        # same results as without watching
+        ref = self._aaa()
+        for k in range(40):
+            ref.step()
+        self.assertEqual(aaa.snapshot(), ref.snapshot())
+
+    def test_breakpoint(self):
+        print('test_breakpoint')
+
+        aaa = self._aaa()
+        w1 = Watchpoint(aaa, 'counter.Q', when=lambda v: v == 5)
+        w2 = Watchpoint(aaa, 'counter.Q[0]') # shares the hooked port with w1
+        self.assertEqual(aaa.run(100, until=w1), 21)
+        self.assertEqual(aaa.counter.get_output(), 5)
+        self.assertEqual((w1.hits, w2.hits), (1, 5))
+        w1.remove()
+        self.assertIsNot(type(aaa.counter.Q[0]), type(aaa.counter.Q[1])) # still watched by w2
+        self.assertEqual(aaa.run(100, until=w2), 4)
+        w2.remove()
+        self.assertIs(type(aaa.counter.Q[0]), type(aaa.counter.Q[1]))
+
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTests([
+        TestWatch('test_watch'),
+        TestWatch('test_breakpoint'),
+    ])
+    runner = unittest.TextTestRunner()
+    runner.run(suite)